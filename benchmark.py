@@ -0,0 +1,266 @@
+import argparse
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib.metadata import PackageNotFoundError, version
+
+from chapter_reader import ChapterReader
+from city_analysis import (city_normalization, city_suffixes, exclude_words, identify_cities_with_jieba,
+                           normalize_and_count_cities, place_matcher, tokenizer)
+from final_optimized_analysis import CityAnalyzer
+from token_stream import TokenStream
+
+try:
+    import resource
+except ImportError:
+    # Windows 下没有 resource 模块，不统计内存峰值
+    resource = None
+
+# 合成语料的保存目录和默认结果文件
+BENCHMARK_CORPUS_DIR = 'benchmark_corpus'
+BENCHMARK_RESULTS_PATH = 'benchmark_results.json'
+
+# 《儒林外史》原书规模：56回，约40万字
+NOVEL_CHAPTERS = 56
+NOVEL_CHARS_PER_CHAPTER = 7200
+
+# 流水线各阶段（与 analyze_chapter 的处理顺序一致）
+STAGES = ['segmentation', 'direct_search', 'classification', 'normalization']
+
+# 合成语料用的文言常用词
+filler_words = [
+    '先生', '老爺', '今日', '明日', '不曾', '銀子', '吃酒', '朋友', '家裏', '兩個', '一個', '那里',
+    '這里', '甚麼', '如何', '自然', '只得', '進來', '出去', '回來', '說', '道', '問', '見', '便',
+    '了', '的', '這', '那', '他', '我', '你', '也', '又', '都', '就', '在', '是', '有', '不',
+    '之', '乎', '者', '也', '矣', '焉', '哉', '曰', '其', '而', '以', '於', '與', '為',
+    '秀才', '舉人', '進士', '知縣', '學道', '宗師', '文章', '考試', '書房', '茶館', '酒樓', '船上',
+    '杜少卿', '范進', '周進', '匡超人', '馬二先生', '王冕', '嚴貢生', '鮑廷璽', '季葦蕭', '莊紹光'
+]
+
+# 与后缀组合成县、府、镇等地名的词干
+place_stems = ['天長', '五河', '安東', '滁', '烏衣', '高要', '南昌', '青楓', '湯', '石', '蕪湖', '儀徵']
+
+
+# 生成一章合成文本：常用词为主，按固定比例夹杂预定义地名变体、排除词和带后缀的地名
+def generate_chapter(rng, chars, variants, distractors):
+    parts = []
+    length = 0
+    while length < chars:
+        sentence = []
+        for _ in range(rng.randint(4, 12)):
+            roll = rng.random()
+            if roll < 0.04:
+                word = rng.choice(variants)
+            elif roll < 0.08:
+                word = rng.choice(distractors)
+            elif roll < 0.10:
+                word = rng.choice(place_stems) + rng.choice(city_suffixes)
+            else:
+                word = rng.choice(filler_words)
+            sentence.append(word)
+        sentence.append(rng.choice('，。：；！？'))
+        if rng.random() < 0.1:
+            sentence.append('\n')
+        text = ''.join(sentence)
+        parts.append(text)
+        length += len(text)
+    return ''.join(parts)
+
+
+# 生成规模为原书 scale 倍的合成语料（章节标题格式与原文一致），同样的参数只生成一次
+def generate_corpus(scale, seed=0, corpus_dir=BENCHMARK_CORPUS_DIR):
+    os.makedirs(corpus_dir, exist_ok=True)
+    path = os.path.join(corpus_dir, f'synthetic_{scale}x_seed{seed}.txt')
+    if os.path.exists(path):
+        return path
+
+    rng = random.Random(seed)
+    variants = [variant for variants in city_normalization.values() for variant in variants]
+    distractors = list(exclude_words)
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write('儒林外史（合成语料）\n')
+        for chapter_number in range(1, NOVEL_CHAPTERS * scale + 1):
+            f.write(f'\n*第{chapter_number}回　合成章節{chapter_number}\n')
+            f.write(generate_chapter(rng, NOVEL_CHARS_PER_CHAPTER, variants, distractors))
+    os.replace(tmp_path, path)
+    return path
+
+
+# 内存峰值（MB）；children=True 时为已结束的子进程（并行分析的工作进程）中最大的一个
+# Linux 的 ru_maxrss 单位为KB，macOS 为字节
+def peak_rss_mb(children=False):
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_CHILDREN if children else resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == 'darwin':
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+# 逐阶段计时：串行分析每一章（不使用分词缓存），统计各阶段总耗时
+def time_stages(path):
+    stage_seconds = dict.fromkeys(STAGES, 0.0)
+    chapters = 0
+    chars = 0
+
+    started = time.perf_counter()
+    tokenizer.load()
+    load_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ChapterReader(path) as reader:
+        for chapter in reader.chapters():
+            text = chapter['content']
+
+            t0 = time.perf_counter()
+            tokens = TokenStream.segment(text, tokenizer)
+            t1 = time.perf_counter()
+            variant_counts, _ = place_matcher.scan(text)
+            t2 = time.perf_counter()
+            places = identify_cities_with_jieba(text, tokens, variant_counts)
+            t3 = time.perf_counter()
+            normalize_and_count_cities(places)
+            t4 = time.perf_counter()
+
+            stage_seconds['segmentation'] += t1 - t0
+            stage_seconds['direct_search'] += t2 - t1
+            stage_seconds['classification'] += t3 - t2
+            stage_seconds['normalization'] += t4 - t3
+            chapters += 1
+            chars += len(text)
+    seconds = time.perf_counter() - started
+
+    return {
+        'chapters': chapters,
+        'chars': chars,
+        'tokenizer_load_seconds': load_seconds,
+        'seconds': seconds,
+        'chapters_per_sec': chapters / seconds if seconds else None,
+        'chars_per_sec': chars / seconds if seconds else None,
+        'stages': stage_seconds
+    }
+
+
+# 端到端计时：在临时目录中用空缓存运行完整流水线（建立索引并汇总统计）
+def time_pipeline(path, workers):
+    with tempfile.TemporaryDirectory() as work_dir:
+        started = time.perf_counter()
+        analyzer = CityAnalyzer(path, workers=workers,
+                                cache_dir=os.path.join(work_dir, 'segmentation_cache'),
+                                index_path=os.path.join(work_dir, 'chapter_results.json'),
+                                mention_index_path=os.path.join(work_dir, 'mention_index.npz'),
+                                geocode_cache_path=os.path.join(work_dir, 'geocode_cache.json'))
+        chapters = analyzer.update_index()
+        analyzer.place_matrix()
+        analyzer.summarize()
+        seconds = time.perf_counter() - started
+        chars = sum(len(chapter['content']) for chapter in analyzer.reader.chapters())
+        analyzer.reader.close()
+
+    return {
+        'workers': workers,
+        'chapters': chapters,
+        'seconds': seconds,
+        'chapters_per_sec': chapters / seconds if seconds else None,
+        'chars_per_sec': chars / seconds if seconds else None
+    }
+
+
+# 对一份语料运行基准测试（在独立进程中调用，内存峰值只反映该语料）
+def run_benchmark(path, workers=1, pipeline=True):
+    result = time_stages(path)
+    if pipeline:
+        result['pipeline'] = time_pipeline(path, workers)
+    result['peak_rss_mb'] = peak_rss_mb()
+    result['peak_rss_children_mb'] = peak_rss_mb(children=True)
+    return result
+
+
+# 运行环境信息，便于比较不同版本的结果
+def environment_info():
+    try:
+        jieba_version = version('jieba')
+    except PackageNotFoundError:
+        jieba_version = None
+    try:
+        commit = subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                                cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        commit = None
+    return {
+        'time': time.strftime('%Y-%m-%d %H:%M:%S'),
+        'commit': commit,
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'processor': platform.processor(),
+        'cpu_count': os.cpu_count(),
+        'jieba': jieba_version
+    }
+
+
+# 输出一份语料的结果，有基准结果时附上吞吐量变化
+def print_result(result, baseline=None):
+    print(f"\n=== {result['scale']}× 语料：{result['chapters']} 章，{result['chars']} 字 ===")
+    print(f"分词器加载：{result['tokenizer_load_seconds']:.2f} 秒")
+    print(f"逐阶段串行分析：{result['seconds']:.2f} 秒，"
+          f"{result['chapters_per_sec']:.1f} 章/秒，{result['chars_per_sec']:.0f} 字/秒")
+    for stage in STAGES:
+        seconds = result['stages'][stage]
+        share = seconds / result['seconds'] if result['seconds'] else 0
+        print(f"  {stage:15s} {seconds:8.2f} 秒 ({share:.1%})")
+    if 'pipeline' in result:
+        pipeline = result['pipeline']
+        print(f"完整流水线（{pipeline['workers']} 进程）：{pipeline['seconds']:.2f} 秒，"
+              f"{pipeline['chapters_per_sec']:.1f} 章/秒，{pipeline['chars_per_sec']:.0f} 字/秒")
+    if result['peak_rss_mb'] is not None:
+        # 并行分析时分词在工作进程中进行，两者分别列出
+        print(f"内存峰值：主进程 {result['peak_rss_mb']:.1f} MB，"
+              f"工作进程 {result['peak_rss_children_mb']:.1f} MB")
+    if baseline is not None:
+        change = result['chars_per_sec'] / baseline['chars_per_sec'] - 1
+        print(f"与基准结果相比：字/秒 {change:+.1%}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='地名识别流水线基准测试')
+    parser.add_argument('--scales', type=int, nargs='+', default=[1, 10, 100],
+                        help='合成语料相对原书的规模倍数，默认 1 10 100')
+    parser.add_argument('--seed', type=int, default=0, help='合成语料的随机种子')
+    parser.add_argument('--workers', type=int, default=1, help='完整流水线使用的进程数，默认1')
+    parser.add_argument('--no-pipeline', action='store_true', help='只做逐阶段计时，不运行完整流水线')
+    parser.add_argument('--corpus-dir', default=BENCHMARK_CORPUS_DIR, help='合成语料目录')
+    parser.add_argument('--output', default=BENCHMARK_RESULTS_PATH, help='结果JSON文件')
+    parser.add_argument('--baseline', help='用于比较的历史结果JSON文件')
+    args = parser.parse_args(argv)
+
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = {result['scale']: result for result in json.load(f)['results']}
+
+    results = []
+    for scale in args.scales:
+        print(f"准备 {scale}× 合成语料...")
+        path = generate_corpus(scale, args.seed, args.corpus_dir)
+        # 每份语料在新进程中测试，分词缓存和内存峰值互不影响
+        with ProcessPoolExecutor(max_workers=1) as executor:
+            result = executor.submit(run_benchmark, path, args.workers, not args.no_pipeline).result()
+        result = {'scale': scale, 'corpus': path, **result}
+        print_result(result, baseline.get(scale))
+        results.append(result)
+
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump({'environment': environment_info(), 'seed': args.seed, 'results': results},
+                  f, ensure_ascii=False, indent=2)
+    print(f"\n结果已保存到 {args.output}")
+
+
+if __name__ == '__main__':
+    main()
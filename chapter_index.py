@@ -0,0 +1,55 @@
+import json
+import os
+from collections import Counter
+
+# 逐章分析结果的默认保存位置
+CHAPTER_INDEX_PATH = 'chapter_results.json'
+
+
+# 逐章分析结果索引
+# 全书每章只分析一次并保存；之后任意章节范围的统计都由已保存的行汇总得到，无需重新分词
+# signature 记录原文、词典和过滤规则的指纹，任一变化时索引整体失效
+class ChapterResultIndex:
+    def __init__(self, path=CHAPTER_INDEX_PATH, signature=None):
+        self.path = path
+        self.signature = signature
+        self.records = {}
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, 'r', encoding='utf-8') as f:
+            saved = json.load(f)
+        if self.signature is not None and saved.get('signature') != self.signature:
+            return
+        if self.signature is None:
+            self.signature = saved.get('signature')
+        for record in saved['chapters']:
+            record['cities'] = Counter(record['cities'])
+            self.records[record['chapter_number']] = record
+
+    def save(self):
+        data = {
+            'signature': self.signature,
+            'chapters': [self.records[number] for number in sorted(self.records)]
+        }
+        with open(self.path, 'w', encoding='utf-8') as f:
+            json.dump(data, f, ensure_ascii=False)
+
+    def __contains__(self, chapter_number):
+        return chapter_number in self.records
+
+    def __len__(self):
+        return len(self.records)
+
+    def add(self, record):
+        self.records[record['chapter_number']] = record
+
+    def chapter_numbers(self):
+        return sorted(self.records)
+
+    def rows(self, start=None, end=None):
+        """按章节号顺序返回 [start, end] 范围内的章节记录"""
+        return [self.records[number] for number in sorted(self.records)
+                if (start is None or number >= start) and (end is None or number <= end)]
@@ -0,0 +1,91 @@
+import json
+import mmap
+import os
+import re
+
+# 章节标题行：与以文本模式读取（\r\n 转为 \n）后 re.split(r'\n\*(.*?)\n', text) 的切分方式一致
+CHAPTER_HEADER = re.compile(rb'\r?\n\*(.*?)\r?\n')
+
+# 章节偏移索引文件的格式版本，切分规则调整后旧索引随之失效
+INDEX_VERSION = 2
+
+
+# 基于内存映射的章节读取器
+# 首次打开时扫描一遍文件，记录每章标题及正文的字节偏移并保存为索引文件；之后按需只解码所需章节的字节
+class ChapterReader:
+    def __init__(self, path, index_path=None, encoding='utf-8'):
+        self.path = path
+        self.index_path = index_path or path + '.chapters.json'
+        self.encoding = encoding
+
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._mmap = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.index = self._load_index()
+
+    def close(self):
+        if isinstance(self._mmap, mmap.mmap):
+            self._mmap.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def __len__(self):
+        return len(self.index)
+
+    def source_signature(self):
+        """原文的大小和修改时间"""
+        stat = os.stat(self.path)
+        return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+    def _load_index(self):
+        signature = self.source_signature()
+        try:
+            with open(self.index_path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('source') == signature and saved.get('version') == INDEX_VERSION:
+                return saved['chapters']
+        except (OSError, ValueError, KeyError):
+            pass
+
+        chapters = self._build_index()
+        try:
+            with open(self.index_path, 'w', encoding='utf-8') as f:
+                json.dump({'version': INDEX_VERSION, 'source': signature, 'chapters': chapters}, f, ensure_ascii=False)
+        except OSError:
+            # 索引无法写入时（如只读目录）仅在内存中使用
+            pass
+        return chapters
+
+    def _build_index(self):
+        # 每章记录 [章节号, 标题, 正文起始字节, 正文结束字节]
+        chapters = []
+        for match in CHAPTER_HEADER.finditer(self._mmap):
+            if chapters:
+                chapters[-1][3] = match.start()
+            title = match.group(1).replace(b'\r', b'').decode(self.encoding)
+            chapters.append([len(chapters) + 1, title, match.end(), len(self._mmap)])
+        return chapters
+
+    def chapter_numbers(self):
+        return [row[0] for row in self.index]
+
+    def chapters(self, start=None, end=None, numbers=None):
+        """按章节号范围 [start, end] 逐章产出 {'chapter_number', 'chapter_title', 'content'}
+        numbers 不为空时只产出其中的章节"""
+        for chapter_number, chapter_title, begin, finish in self.index:
+            if start is not None and chapter_number < start:
+                continue
+            if end is not None and chapter_number > end:
+                break
+            if numbers is not None and chapter_number not in numbers:
+                continue
+            yield {
+                'chapter_number': chapter_number,
+                'chapter_title': chapter_title,
+                'content': self._mmap[begin:finish].decode(self.encoding).replace('\r\n', '\n')
+            }
@@ -0,0 +1,254 @@
+import hashlib
+import json
+from collections import Counter
+
+from jieba_tokenizer import LazyTokenizer
+from place_classifier import PlaceClassifier
+from place_matcher import PlaceMatcher
+from profiling import profiler
+from token_stream import TokenStream
+
+# 增强的自定义词典 - 重点加强地名权重并排除非地名
+custom_words = [
+    # 南京相关变体（提高权重）
+    "南京 2000 ns", "南京城 1800 ns", "金陵 1800 ns", "應天府 1800 ns", "江寧府 1800 ns", 
+    "白下 1500 ns", "南都 1500 ns", "建康 1500 ns", "秣陵 1500 ns", "建業 1500 ns",
+    "江寧 1500 ns", "到南京 1200 ns", "在南京 1200 ns", "自南京 1200 ns", "往南京 1200 ns",
+    "南京來 1200 ns", "南京去 1200 ns", "南京的 1200 ns", 
+    
+    # 北京相关变体
+    "北京 1800 ns", "北京城 1600 ns", "京師 1600 ns", "到北京 1300 ns", "在京師 1300 ns",
+    
+    # 扬州相关变体
+    "揚州 1800 ns", "揚州城 1600 ns", "到揚州 1300 ns", "在揚州 1300 ns", "揚州府 1500 ns",
+    
+    # 其他主要城市
+    "蘇州 1600 ns", "杭州 1600 ns", "濟南 1500 ns", "湖州 1500 ns", "徽州 1500 ns", 
+    "成都 1500 ns", "安東 1400 ns", "五河 1400 ns", "天長 1400 ns",
+    
+    # 降低非地名的权重
+    "知道 0 v", "說道 0 v", "問道 0 v", "人道 0 v", "難道 0 d", "道理 0 n", "路上 0 n",
+    "一路 0 n", "府上 0 n", "尊府 0 n", "州府 0 n", "鄉紳 0 n", "那人道 0 v", "十里 0 m",
+    "街上 0 n", "大道 0 n", "小道 0 n", "便道 0 v", "強盜 0 n", "道路 0 n", "一道 0 m",
+    "知道了 0 v", "不知道 0 v", "知道的 0 v", "知道要 0 v", "知道是 0 v",
+    "說道是 0 v", "說道你 0 v", "說道我 0 v", "說道他 0 v", "說道這 0 v",
+    "問道他 0 v", "問道你 0 v", "問道我 0 v", "問道這 0 v", "問道是 0 v"
+]
+
+# 加载了自定义词典的分词器（每个进程首次分词时才导入jieba并构建）
+tokenizer = LazyTokenizer(custom_words)
+
+
+# 城市名称归一化字典
+city_normalization = {
+    '南京': ['南京', '應天府', '江寧府', '白下', '金陵', '南京城', '南都', '建康', '秣陵', '建業', '江寧',
+            '到南京', '在南京', '自南京', '往南京', '南京來', '南京去', '南京的'],
+    '北京': ['北京', '京師', '北京城', '到北京', '在京師', '往京師'],
+    '揚州': ['揚州', '揚州城', '到揚州', '在揚州', '揚州府', '往揚州'],
+    '蘇州': ['蘇州', '吳縣', '吳中', '蘇州城', '到蘇州', '在蘇州'],
+    '杭州': ['杭州', '武林', '錢塘', '杭州城', '到杭州', '在杭州'],
+    '濟南': ['濟南', '濟南府', '到濟南', '在濟南'],
+    '湖州': ['湖州', '湖郡', '到湖州', '在湖州'],
+    '徽州': ['徽州', '新安', '到徽州', '在徽州'],
+    '成都': ['成都', '成都府', '到成都', '在成都']
+}
+
+# 由变体表一次性构建多模式匹配器
+place_matcher = PlaceMatcher(city_normalization)
+
+# 常见地名后缀
+city_suffixes = ['縣', '府', '州', '鎮', '城', '鄉', '村', '街', '里', '坊', '巷', '道', '路']
+
+# 大幅扩展排除词汇列表
+exclude_words = [
+    # 常用动词短语
+    '知道', '說道', '問道', '人道', '難道', '道理', '路上', '一路', '府上', '尊府', '州府', 
+    '鄉紳', '那人道', '十里', '街上', '大道', '小道', '便道', '強盜', '道路', '一道',
+    '知道了', '不知道', '知道的', '知道要', '知道是', '說道是', '說道你', '說道我', '說道他', 
+    '說道這', '問道他', '問道你', '問道我', '問道這', '問道是',
+    # 其他常用非地名
+    '自己', '不是', '只是', '可是', '但是', '要是', '就是', '正是', '于是', '因此', '所以', 
+    '忽然', '果然', '竟然', '居然', '虽然', '然而', '因为', '由于', '对于', '关于', '此外', 
+    '另外', '这个', '那个', '这些', '那些', '这里', '那里', '这么', '那么', '这样', '那样'
+]
+
+# 正则表达式模式匹配非地名
+non_place_patterns = [
+    # 动词+道模式
+    r'^[\u4e00-\u9fa5]道$',  # 如：知道、說道
+    r'^[\u4e00-\u9fa5]{2,3}道$',  # 如：問道、那人道
+    # 数量词+里模式
+    r'^[\d一二三四五六七八九十百千]+里$',  # 如：十里、百里
+    # 其他模式
+    r'^[\u4e00-\u9fa5]+道的$',
+    r'^[\u4e00-\u9fa5]+道是$',
+    r'^[\u4e00-\u9fa5]+道你$',
+    r'^[\u4e00-\u9fa5]+道我$',
+    r'^[\u4e00-\u9fa5]+道他$',
+    r'^[\u4e00-\u9fa5]+道這$',
+    # 排除单个字符
+    r'^.$'
+]
+
+# 预编译的地名判断器
+place_classifier = PlaceClassifier(city_normalization, exclude_words, non_place_patterns, city_suffixes)
+
+# 改进的有效性判断函数 - 严格过滤非地名（重复词直接命中缓存）
+def is_valid_city(word):
+    return place_classifier.is_valid(word)
+
+# 使用jieba精确模式进行分词
+def identify_cities_with_jieba(text, tokens=None, variant_counts=None):
+    # 使用精确模式分词（已切分的章节直接复用其词流）
+    if tokens is None:
+        tokens = TokenStream.segment(text, tokenizer)
+    
+    # 收集潜在的地名（直接计数，内存只与不同地名的数量有关）
+    potential_places = Counter(word for word in tokens if is_valid_city(word))
+    
+    # 另外，单次扫描文本搜索预定义的城市变体（最左最长匹配，重叠变体不重复计数）
+    if variant_counts is None:
+        variant_counts, _ = place_matcher.scan(text)
+    for variant, count in variant_counts.items():
+        # 按实际出现次数累加
+        potential_places[variant] += count
+    
+    return potential_places
+
+# 归一化函数（places 为潜在地名计数，也可以是地名列表）
+def normalize_and_count_cities(places):
+    normalized_counts = Counter()
+    variant_details = {}
+    
+    # 初始化变体详情字典
+    for city, variants in city_normalization.items():
+        variant_details[city] = {variant: 0 for variant in variants}
+    
+    # 统计变体
+    temp_counter = Counter(places)
+    
+    # 处理预定义的城市变体
+    for city, variants in city_normalization.items():
+        total = 0
+        for variant in variants:
+            if variant in temp_counter:
+                count = temp_counter[variant]
+                total += count
+                variant_details[city][variant] = count
+                del temp_counter[variant]  # 从临时计数器中删除已处理的变体
+        if total > 0:
+            normalized_counts[city] = total
+    
+    # 处理未在预定义字典中的地名（带后缀的）
+    for place, count in temp_counter.items():
+        if is_valid_city(place):  # 再次验证
+            normalized_counts[place] = count
+            variant_details[place] = {place: count}
+    
+    return normalized_counts, variant_details
+
+# 直接字符串搜索
+def direct_city_search(text):
+    # 单次扫描文本，按标准地名汇总所有变体的出现次数
+    return place_matcher.count_cities(text)
+
+# 提及收集规则的版本号，规则调整后已保存的提及索引随之失效
+MENTION_RULES_VERSION = 2
+
+# 收集章节内每次地名提及的位置，返回按偏移排序的 [(字符偏移, 变体), ...]
+# 分词得到的地名和变体匹配结果合在一起按最左最长、互不重叠选取（与 PlaceMatcher 相同），
+# 同一段文字只记录一次提及（如"到南京"和其中的"南京"）
+def collect_mentions(tokens, variant_offsets):
+    longest = {}
+    spans = [(offset, word) for offset, word in tokens.with_offsets() if is_valid_city(word)]
+    spans += [(offset, variant) for variant, offsets in variant_offsets.items() for offset in offsets]
+    for offset, word in spans:
+        best = longest.get(offset)
+        if best is None or len(word) > len(best):
+            longest[offset] = word
+
+    mentions = []
+    position = 0
+    for offset in sorted(longest):
+        if offset < position:
+            continue
+        mentions.append((offset, longest[offset]))
+        position = offset + len(longest[offset])
+    return mentions
+
+# 分析单个章节，返回章节统计记录、该章的潜在地名计数和地名提及位置
+def analyze_chapter(chapter, tokens):
+    chapter_text = chapter['content']
+    chapter_number = chapter['chapter_number']
+    
+    # 单次扫描得到预定义变体的计数和位置
+    with profiler.span('direct_search', chapter=chapter_number, items=len(chapter_text)):
+        variant_counts, variant_offsets = place_matcher.scan(chapter_text)
+    
+    # 组合多种方法：jieba分词 + 直接字符串搜索
+    with profiler.span('classification', chapter=chapter_number, items=len(tokens)):
+        chapter_places = identify_cities_with_jieba(chapter_text, tokens, variant_counts)
+    
+    # 归一化并统计
+    with profiler.span('normalization', chapter=chapter_number, items=len(chapter_places)):
+        city_counts, variant_details = normalize_and_count_cities(chapter_places)
+    
+    # 计算城市密集度
+    total_words = len(tokens)
+    city_density = sum(city_counts.values()) / total_words if total_words > 0 else 0
+    
+    record = {
+        'chapter_number': chapter['chapter_number'],
+        'chapter_title': chapter['chapter_title'],
+        'cities': city_counts,
+        'total_city_mentions': sum(city_counts.values()),
+        'total_words': total_words,
+        'city_density': city_density,
+        'variant_details': variant_details
+    }
+    
+    # 收集地名提及位置
+    with profiler.span('mentions', chapter=chapter_number) as span:
+        mentions = collect_mentions(tokens, variant_offsets)
+        span['items'] = len(mentions)
+    
+    # 记录地名判断缓存的累计命中情况
+    if profiler.enabled:
+        cache_info = place_classifier.cache_info()
+        profiler.counter('classifier_cache', hits=cache_info.hits, misses=cache_info.misses)
+    return record, chapter_places, mentions
+
+
+# 汇总多个章节的统计结果
+# 与把各章潜在地名合并后整体归一化的结果一致：预定义城市按归一化字典顺序在前，其余地名按首次出现顺序在后
+def merge_chapter_records(records):
+    totals = Counter()
+    variant_details = {city: {variant: 0 for variant in variants}
+                       for city, variants in city_normalization.items()}
+    for record in records:
+        totals.update(record['cities'])
+        for city in city_normalization:
+            for variant, count in record['variant_details'].get(city, {}).items():
+                variant_details[city][variant] += count
+    
+    normalized_counts = Counter()
+    for city in city_normalization:
+        if totals[city] > 0:
+            normalized_counts[city] = totals[city]
+    for place, count in totals.items():
+        if place not in city_normalization:
+            normalized_counts[place] = count
+            variant_details[place] = {place: count}
+    
+    return normalized_counts, variant_details
+
+
+# 识别规则指纹：词典或过滤规则调整后，已保存的逐章结果随之失效
+def rules_fingerprint():
+    rules = [custom_words, city_normalization, city_suffixes, exclude_words, non_place_patterns]
+    return hashlib.sha256(json.dumps(rules, ensure_ascii=False).encode('utf-8')).hexdigest()[:16]
+
+
+# 变体对应的标准地名（未收录的地名即为其本身）
+def canonical_place(variant):
+    return place_classifier.canonical(variant) or variant
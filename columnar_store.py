@@ -0,0 +1,62 @@
+import json
+import os
+
+import numpy as np
+
+# 列式结果的默认目录
+COLUMNAR_DIR = 'final_columns'
+
+MANIFEST_NAME = 'manifest.json'
+
+
+# 写入临时文件后替换：正在内存映射旧文件的读取方（如运行中的应用）仍读到完整的旧内容，不会被截断
+def _replace_file(path, write):
+    tmp_path = path + '.tmp'
+    with open(tmp_path, 'wb') as f:
+        write(f)
+    os.replace(tmp_path, path)
+
+
+# 以列式二进制格式保存结果表：每列一个 .npy 文件（定长数值或定长Unicode），目录下 manifest.json 记录表和列
+# 读取时可直接内存映射，无需解析文本
+def save_tables(directory, tables):
+    """tables: {表名: {列名: 一维数组}}"""
+    os.makedirs(directory, exist_ok=True)
+    manifest = {}
+    for table, columns in tables.items():
+        manifest[table] = {}
+        for column, values in columns.items():
+            values = np.asarray(values)
+            if values.dtype == object:
+                raise TypeError(f'列 {table}.{column} 不是定长类型')
+            _replace_file(os.path.join(directory, f'{table}.{column}.npy'), lambda f: np.save(f, values))
+            manifest[table][column] = {'dtype': values.dtype.str, 'length': len(values)}
+
+    # manifest 最后写入，读取方以它为准
+    _replace_file(os.path.join(directory, MANIFEST_NAME),
+                  lambda f: f.write(json.dumps(manifest, ensure_ascii=False, indent=2).encode('utf-8')))
+
+
+def load_tables(directory, tables=None, mmap=True):
+    """返回 {表名: {列名: 数组}}；mmap=True 时各列以只读方式内存映射"""
+    with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+        manifest = json.load(f)
+
+    result = {}
+    for table, columns in manifest.items():
+        if tables is not None and table not in tables:
+            continue
+        result[table] = {
+            column: np.load(os.path.join(directory, f'{table}.{column}.npy'),
+                            mmap_mode='r' if mmap else None, allow_pickle=False)
+            for column in columns
+        }
+    return result
+
+
+def has_table(directory, table):
+    try:
+        with open(os.path.join(directory, MANIFEST_NAME), 'r', encoding='utf-8') as f:
+            return table in json.load(f)
+    except FileNotFoundError:
+        return False
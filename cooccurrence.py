@@ -0,0 +1,239 @@
+import argparse
+import csv
+import json
+import re
+
+import numpy as np
+
+from profiling import profiler
+
+# 共现单位：同一句、同一段，或相距不超过N个字符
+COOCCURRENCE_MODES = ('sentence', 'paragraph', 'window')
+
+# 句末标点和换行视为句子边界，换行视为段落边界
+SENTENCE_END = re.compile(r'[。！？!?；;…\n]+')
+PARAGRAPH_END = re.compile(r'\n+')
+
+# 每批最多展开的提及对数，控制内存峰值
+MAX_PAIRS_PER_BATCH = 4_000_000
+
+
+# 章节文本中各句（段）的结束偏移，提及偏移经二分查找即得所在句（段）的序号
+def segment_boundaries(text, mode='sentence'):
+    pattern = SENTENCE_END if mode == 'sentence' else PARAGRAPH_END
+    return np.fromiter((match.end() for match in pattern.finditer(text)), dtype=np.int64)
+
+
+# 展开提及对：第 i 行与 i+1 .. ends[i]-1 行配对，按批产出 (左行号, 右行号)
+def _expand_pairs(ends, max_pairs=MAX_PAIRS_PER_BATCH):
+    rows = np.arange(len(ends), dtype=np.int64)
+    lengths = np.maximum(ends - rows - 1, 0)
+    totals = np.cumsum(lengths)
+    lo = 0
+    while lo < len(rows):
+        # 本批至少一行，且展开后的提及对数不超过上限
+        base = totals[lo - 1] if lo else 0
+        hi = max(lo + 1, int(np.searchsorted(totals, base + max_pairs, side='right')))
+        batch_lengths = lengths[lo:hi]
+        left = np.repeat(rows[lo:hi], batch_lengths)
+        steps = np.arange(batch_lengths.sum()) - np.repeat(np.cumsum(batch_lengths) - batch_lengths, batch_lengths)
+        yield left, left + 1 + steps
+        lo = hi
+
+
+# 合并相同的键并累加权重
+def _reduce(keys, weights):
+    unique_keys, inverse = np.unique(keys, return_inverse=True)
+    return unique_keys, np.bincount(inverse, weights=weights, minlength=len(unique_keys)).astype(np.int64)
+
+
+# 地名共现结果：按 (章节, 地名a, 地名b) 稀疏存储，a < b，权重为共现次数
+class CooccurrenceMatrix:
+    def __init__(self, places, chapters, chapter_col, left, right, weight, mentions, mode, window=None):
+        self.places = list(places)                                  # 地名id -> 地名
+        self.chapters = np.asarray(chapters, dtype=np.int32)        # 列id -> 章节号
+        self.chapter_col = np.asarray(chapter_col, dtype=np.int32)
+        self.left = np.asarray(left, dtype=np.int32)
+        self.right = np.asarray(right, dtype=np.int32)
+        self.weight = np.asarray(weight, dtype=np.int64)
+        self.mentions = np.asarray(mentions, dtype=np.int64)        # 地名id -> 范围内提及次数
+        self.mode = mode
+        self.window = window
+        self.place_ids = {place: pid for pid, place in enumerate(self.places)}
+
+    def __len__(self):
+        return len(self.weight)
+
+    def pairs(self, chapter=None):
+        """返回 (地名a id, 地名b id, 权重)；指定章节时只含该章，否则为各章合计"""
+        if chapter is not None:
+            col = int(np.searchsorted(self.chapters, chapter))
+            mask = self.chapter_col == col if col < len(self.chapters) and self.chapters[col] == chapter \
+                else np.zeros(len(self.weight), dtype=bool)
+            return self.left[mask], self.right[mask], self.weight[mask]
+
+        size = len(self.places)
+        keys, weight = _reduce(self.left.astype(np.int64) * size + self.right, self.weight)
+        return (keys // size).astype(np.int32), (keys % size).astype(np.int32), weight
+
+    def dense(self, places=None, chapter=None):
+        """返回对称的 [地名, 地名] 共现矩阵"""
+        left, right, weight = self.pairs(chapter)
+        if places is None:
+            out = np.zeros((len(self.places), len(self.places)), dtype=np.int64)
+            out[left, right] = weight
+        else:
+            # 地名id -> 所选地名中的位置，未选中的为 -1
+            position = np.full(len(self.places), -1, dtype=np.int64)
+            ids = np.array([self.place_ids.get(place, -1) for place in places], dtype=np.int64)
+            position[ids[ids >= 0]] = np.flatnonzero(ids >= 0)
+            out = np.zeros((len(places), len(places)), dtype=np.int64)
+            mask = (position[left] >= 0) & (position[right] >= 0)
+            out[position[left[mask]], position[right[mask]]] = weight[mask]
+        return out + out.T
+
+    def strength(self, chapter=None):
+        """各地名的加权度（与其他地名的共现次数之和）"""
+        left, right, weight = self.pairs(chapter)
+        size = len(self.places)
+        return np.bincount(left, weights=weight, minlength=size) + np.bincount(right, weights=weight, minlength=size)
+
+    def top_pairs(self, n=20, chapter=None):
+        left, right, weight = self.pairs(chapter)
+        order = np.argsort(-weight, kind='stable')[:n]
+        return [(self.places[left[i]], self.places[right[i]], int(weight[i])) for i in order]
+
+    def to_graph(self, chapter=None, min_weight=1):
+        """加权无向图（node-link 格式，可直接用于 d3 / networkx.node_link_graph）"""
+        left, right, weight = self.pairs(chapter)
+        keep = weight >= min_weight
+        left, right, weight = left[keep], right[keep], weight[keep]
+        strength = self.strength(chapter)
+        node_ids = np.union1d(left, right)
+        return {
+            'directed': False,
+            'multigraph': False,
+            'graph': {'mode': self.mode, 'window': self.window, 'chapter': chapter,
+                      'chapters': [int(self.chapters[0]), int(self.chapters[-1])] if len(self.chapters) else []},
+            'nodes': [{'id': self.places[pid], 'mentions': int(self.mentions[pid]),
+                       'strength': int(strength[pid])} for pid in node_ids],
+            'links': [{'source': self.places[a], 'target': self.places[b], 'weight': int(w)}
+                      for a, b, w in zip(left, right, weight)]
+        }
+
+    def save_graph(self, path, chapter=None, min_weight=1):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.to_graph(chapter, min_weight), f, ensure_ascii=False, indent=2)
+
+    def save_edges_csv(self, path, chapter=None, min_weight=1):
+        """边列表CSV（Source, Target, Weight），可导入 Gephi"""
+        left, right, weight = self.pairs(chapter)
+        with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['Source', 'Target', 'Weight'])
+            for a, b, w in zip(left, right, weight):
+                if w >= min_weight:
+                    writer.writerow([self.places[a], self.places[b], int(w)])
+
+
+# 由地名提及索引计算共现矩阵
+# mode 为 sentence/paragraph 时按句（段）计数：同一句内出现的每对不同地名记一次，句子边界需由 reader 读取原文；
+# mode 为 window 时按提及对计数：同一章内起始位置相距不超过 window 个字符的每对不同地名提及记一次
+def compute_cooccurrence(mention_index, mode='sentence', window=50, reader=None, start=None, end=None,
+                         places=None):
+    if mode not in COOCCURRENCE_MODES:
+        raise ValueError(f'未知的共现单位：{mode}')
+    if mode != 'window' and reader is None:
+        raise ValueError('按句或按段统计共现需要提供原文 reader')
+
+    with profiler.span('cooccurrence', mode=mode) as span:
+        chapter, offset, variant = mention_index.by_chapter(
+            start if start is not None else np.iinfo(np.int32).min,
+            end if end is not None else np.iinfo(np.int32).max)
+        place = mention_index.place_of(variant)
+        if places is not None:
+            selected = [mention_index.place_ids[name] for name in places if name in mention_index.place_ids]
+            keep = np.isin(place, selected)
+            chapter, offset, place = chapter[keep], offset[keep], place[keep]
+
+        size = len(mention_index.places)
+        chapters, chapter_col = np.unique(chapter, return_inverse=True)
+        chapter_col = chapter_col.astype(np.int64)
+        mentions = np.bincount(place, minlength=size)
+
+        if mode == 'window':
+            # 章节号放在高位，相距不超过 window 的提及在排序后的键上连续，且不会跨章
+            keys = (chapter_col << 32) | offset.astype(np.int64)
+            ends = np.searchsorted(keys, keys + window, side='right')
+            rows_col, rows_place = chapter_col, place.astype(np.int64)
+        else:
+            # 每次提及所在句（段）的序号
+            segment = np.empty(len(offset), dtype=np.int64)
+            # 有提及的章节按章节号顺序只读一遍原文，与按章节分组的提及一一对应
+            bounds = np.searchsorted(chapter, chapters, side='left').tolist() + [len(chapter)]
+            chapter_numbers = chapters.tolist()
+            texts = reader.chapters(chapter_numbers[0], chapter_numbers[-1], numbers=set(chapter_numbers)) \
+                if chapter_numbers else ()
+            for col, chapter_text in enumerate(texts):
+                lo, hi = bounds[col], bounds[col + 1]
+                segment[lo:hi] = np.searchsorted(segment_boundaries(chapter_text['content'], mode), offset[lo:hi],
+                                                 side='right')
+
+            # 同一句内同一地名只保留一次，之后句内任意两行即为一对不同地名
+            units, unit_ids = np.unique((chapter_col << 32) | segment, return_inverse=True)
+            unit_place = np.unique(unit_ids.astype(np.int64) * size + place)
+            unit_ids = unit_place // size
+            rows_place = unit_place % size
+            rows_col = (units[unit_ids] >> 32)
+            ends = np.searchsorted(unit_ids, unit_ids, side='right')
+
+        key_parts, weight_parts = [], []
+        for left, right in _expand_pairs(ends):
+            a = np.minimum(rows_place[left], rows_place[right])
+            b = np.maximum(rows_place[left], rows_place[right])
+            distinct = a != b
+            keys = (rows_col[left[distinct]] * size + a[distinct]) * size + b[distinct]
+            keys, weights = _reduce(keys, np.ones(len(keys), dtype=np.int64))
+            key_parts.append(keys)
+            weight_parts.append(weights)
+
+        if key_parts:
+            keys, weight = _reduce(np.concatenate(key_parts), np.concatenate(weight_parts))
+        else:
+            keys, weight = np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        span['items'] = len(keys)
+
+    return CooccurrenceMatrix(mention_index.places, chapters, keys // (size * size), keys // size % size,
+                              keys % size, weight, mentions, mode, window if mode == 'window' else None)
+
+
+def main(argv=None):
+    from final_optimized_analysis import DEFAULT_SOURCE_PATH, CityAnalyzer
+
+    parser = argparse.ArgumentParser(description='地名共现网络')
+    parser.add_argument('--source', default=DEFAULT_SOURCE_PATH, help='《儒林外史》原文路径')
+    parser.add_argument('--mode', choices=COOCCURRENCE_MODES, default='sentence', help='共现单位，默认按句')
+    parser.add_argument('--window', type=int, default=50, help='window 模式的字符距离，默认50')
+    parser.add_argument('--start', type=int, help='开始章节')
+    parser.add_argument('--end', type=int, help='结束章节')
+    parser.add_argument('--min-weight', type=int, default=1, help='导出边的最小权重')
+    parser.add_argument('--graph', default='place_cooccurrence.json', help='node-link JSON 输出文件')
+    parser.add_argument('--edges', default='place_cooccurrence_edges.csv', help='边列表CSV输出文件')
+    parser.add_argument('--top', type=int, default=20, help='输出权重最高的地名对数量')
+    args = parser.parse_args(argv)
+
+    analyzer = CityAnalyzer(args.source)
+    analyzer.update_index()
+    result = analyzer.cooccurrence(args.mode, args.window, args.start, args.end)
+
+    print(f"=== 地名共现（{args.mode}）：{len(result.chapters)} 个章节 ===")
+    for i, (a, b, weight) in enumerate(result.top_pairs(args.top), 1):
+        print(f"{i:2d}. {a} - {b}: {weight}")
+
+    result.save_graph(args.graph, min_weight=args.min_weight)
+    result.save_edges_csv(args.edges, min_weight=args.min_weight)
+    print(f"已保存：{args.graph}、{args.edges}")
+
+
+if __name__ == '__main__':
+    main()
@@ -1,415 +1,399 @@
-import re
 import json
 import csv
+import argparse
+import numpy as np
 from collections import Counter
-import jieba
-import jieba.analyse
-
-# 配置jieba
-print("初始化jieba分词，优化地名识别...")
-
-# 增强的自定义词典 - 重点加强地名权重并排除非地名
-custom_words = [
-    # 南京相关变体（提高权重）
-    "南京 2000 ns", "南京城 1800 ns", "金陵 1800 ns", "應天府 1800 ns", "江寧府 1800 ns", 
-    "白下 1500 ns", "南都 1500 ns", "建康 1500 ns", "秣陵 1500 ns", "建業 1500 ns",
-    "江寧 1500 ns", "到南京 1200 ns", "在南京 1200 ns", "自南京 1200 ns", "往南京 1200 ns",
-    "南京來 1200 ns", "南京去 1200 ns", "南京的 1200 ns", 
-    
-    # 北京相关变体
-    "北京 1800 ns", "北京城 1600 ns", "京師 1600 ns", "到北京 1300 ns", "在京師 1300 ns",
-    
-    # 扬州相关变体
-    "揚州 1800 ns", "揚州城 1600 ns", "到揚州 1300 ns", "在揚州 1300 ns", "揚州府 1500 ns",
-    
-    # 其他主要城市
-    "蘇州 1600 ns", "杭州 1600 ns", "濟南 1500 ns", "湖州 1500 ns", "徽州 1500 ns", 
-    "成都 1500 ns", "安東 1400 ns", "五河 1400 ns", "天長 1400 ns",
-    
-    # 地名后缀模式
-    "[\u4e00-\u9fa5]{1,4}縣 1000 ns", "[\u4e00-\u9fa5]{1,4}府 1000 ns",
-    "[\u4e00-\u9fa5]{1,4}州 1000 ns", "[\u4e00-\u9fa5]{1,4}鎮 1000 ns",
-    "[\u4e00-\u9fa5]{1,4}城 1000 ns", "[\u4e00-\u9fa5]{1,4}鄉 800 ns",
-    "[\u4e00-\u9fa5]{1,4}村 800 ns", "[\u4e00-\u9fa5]{1,4}街 700 ns",
-    
-    # 降低非地名的权重
-    "知道 0 v", "說道 0 v", "問道 0 v", "人道 0 v", "難道 0 d", "道理 0 n", "路上 0 n",
-    "一路 0 n", "府上 0 n", "尊府 0 n", "州府 0 n", "鄉紳 0 n", "那人道 0 v", "十里 0 m",
-    "街上 0 n", "大道 0 n", "小道 0 n", "便道 0 v", "強盜 0 n", "道路 0 n", "一道 0 m",
-    "知道了 0 v", "不知道 0 v", "知道的 0 v", "知道要 0 v", "知道是 0 v",
-    "說道是 0 v", "說道你 0 v", "說道我 0 v", "說道他 0 v", "說道這 0 v",
-    "問道他 0 v", "問道你 0 v", "問道我 0 v", "問道這 0 v", "問道是 0 v"
-]
-
-# 保存自定义词典
-with open('final_jieba_dict.txt', 'w', encoding='utf-8') as f:
-    f.write('\n'.join(custom_words))
-
-# 加载自定义词典
-jieba.load_userdict('final_jieba_dict.txt')
-
-# 读取《儒林外史》文本
-print("读取《儒林外史》文本...")
-with open('/Users/yangtuotuo/Documents/trae_projects/CHC assignment2/儒林外史.txt', 'r', encoding='utf-8') as f:
-    text = f.read()
-
-# 按章节分割文本
-chapters = re.split(r'\n\*(.*?)\n', text)
-chapter_data = []
-
-for i in range(1, len(chapters), 2):
-    chapter_title = chapters[i]
-    chapter_content = chapters[i+1] if i+1 < len(chapters) else ''
-    chapter_data.append({
-        'chapter_number': (i + 1) // 2,
-        'chapter_title': chapter_title,
-        'content': chapter_content
-    })
-
-print(f"共找到 {len(chapter_data)} 个章节")
-
-# 城市名称归一化字典
-city_normalization = {
-    '南京': ['南京', '應天府', '江寧府', '白下', '金陵', '南京城', '南都', '建康', '秣陵', '建業', '江寧',
-            '到南京', '在南京', '自南京', '往南京', '南京來', '南京去', '南京的'],
-    '北京': ['北京', '京師', '北京城', '到北京', '在京師', '往京師'],
-    '揚州': ['揚州', '揚州城', '到揚州', '在揚州', '揚州府', '往揚州'],
-    '蘇州': ['蘇州', '吳縣', '吳中', '蘇州城', '到蘇州', '在蘇州'],
-    '杭州': ['杭州', '武林', '錢塘', '杭州城', '到杭州', '在杭州'],
-    '濟南': ['濟南', '濟南府', '到濟南', '在濟南'],
-    '湖州': ['湖州', '湖郡', '到湖州', '在湖州'],
-    '徽州': ['徽州', '新安', '到徽州', '在徽州'],
-    '成都': ['成都', '成都府', '到成都', '在成都']
-}
-
-# 常见地名后缀
-city_suffixes = ['縣', '府', '州', '鎮', '城', '鄉', '村', '街', '里', '坊', '巷', '道', '路']
-
-# 大幅扩展排除词汇列表
-exclude_words = [
-    # 常用动词短语
-    '知道', '說道', '問道', '人道', '難道', '道理', '路上', '一路', '府上', '尊府', '州府', 
-    '鄉紳', '那人道', '十里', '街上', '大道', '小道', '便道', '強盜', '道路', '一道',
-    '知道了', '不知道', '知道的', '知道要', '知道是', '說道是', '說道你', '說道我', '說道他', 
-    '說道這', '問道他', '問道你', '問道我', '問道這', '問道是',
-    # 其他常用非地名
-    '自己', '不是', '只是', '可是', '但是', '要是', '就是', '正是', '于是', '因此', '所以', 
-    '忽然', '果然', '竟然', '居然', '虽然', '然而', '因为', '由于', '对于', '关于', '此外', 
-    '另外', '这个', '那个', '这些', '那些', '这里', '那里', '这么', '那么', '这样', '那样'
-]
-
-# 正则表达式模式匹配非地名
-non_place_patterns = [
-    # 动词+道模式
-    r'^[\u4e00-\u9fa5]道$',  # 如：知道、說道
-    r'^[\u4e00-\u9fa5]{2,3}道$',  # 如：問道、那人道
-    # 数量词+里模式
-    r'^[\d一二三四五六七八九十百千]+里$',  # 如：十里、百里
-    # 其他模式
-    r'^[\u4e00-\u9fa5]+道的$',
-    r'^[\u4e00-\u9fa5]+道是$',
-    r'^[\u4e00-\u9fa5]+道你$',
-    r'^[\u4e00-\u9fa5]+道我$',
-    r'^[\u4e00-\u9fa5]+道他$',
-    r'^[\u4e00-\u9fa5]+道這$',
-    # 排除单个字符
-    r'^.$'
-]
-
-# 改进的有效性判断函数 - 严格过滤非地名
-def is_valid_city(word):
-    # 检查是否在排除列表中
-    if word in exclude_words:
-        return False
-    
-    # 使用正则表达式检查非地名模式
-    for pattern in non_place_patterns:
-        if re.match(pattern, word):
-            return False
-    
-    # 检查是否在预定义城市变体中
-    for variants in city_normalization.values():
-        if word in variants:
-            return True
-    
-    # 检查是否包含地名后缀
-    if any(suffix in word for suffix in city_suffixes):
-        # 但排除包含"道"作为后缀且不是真正地名的词汇
-        if '道' in word and not any(s in word for s in ['街道', '道路', '河道', '官道', '省道', '国道']):
-            # 进一步检查是否为真正的地名
-            if not re.search(r'[縣府州鎮城鄉村街巷坊]', word):
-                return False
-        return True
-    
-    # 检查是否包含方向词+地名的模式
-    direction_patterns = ['到', '在', '往', '自']
-    for direction in direction_patterns:
-        if word.startswith(direction) and len(word) > 2:
-            # 截取方向词后的部分，检查是否包含地名特征
-            remaining = word[1:]
-            if any(suffix in remaining for suffix in ['縣', '府', '州', '鎮', '城']):
-                return True
-            # 或者剩余部分是已知城市
-            for city in ['南京', '北京', '揚州', '蘇州', '杭州', '濟南', '湖州', '徽州', '成都']:
-                if remaining == city:
-                    return True
-    
-    return False
-
-# 使用jieba精确模式进行分词
-def identify_cities_with_jieba(text):
-    # 使用精确模式分词
-    words_exact = list(jieba.cut(text, cut_all=False))
-    
-    # 收集潜在的地名
-    potential_places = []
-    for word in words_exact:
-        if is_valid_city(word):
-            potential_places.append(word)
-    
-    # 另外，直接在文本中搜索预定义的城市变体
-    for city, variants in city_normalization.items():
-        for variant in variants:
-            # 直接统计每个变体的出现次数
-            count = text.count(variant)
-            if count > 0:
-                # 添加到潜在地名列表中（按实际出现次数）
-                potential_places.extend([variant] * count)
-    
-    return potential_places
-
-# 归一化函数
-def normalize_and_count_cities(place_list):
-    normalized_counts = Counter()
-    variant_details = {}
-    
-    # 初始化变体详情字典
-    for city, variants in city_normalization.items():
-        variant_details[city] = {variant: 0 for variant in variants}
-    
-    # 统计变体
-    temp_counter = Counter(place_list)
-    
-    # 处理预定义的城市变体
-    for city, variants in city_normalization.items():
-        total = 0
-        for variant in variants:
-            if variant in temp_counter:
-                count = temp_counter[variant]
-                total += count
-                variant_details[city][variant] = count
-                del temp_counter[variant]  # 从临时计数器中删除已处理的变体
-        if total > 0:
-            normalized_counts[city] = total
-    
-    # 处理未在预定义字典中的地名（带后缀的）
-    for place, count in temp_counter.items():
-        if is_valid_city(place):  # 再次验证
-            normalized_counts[place] = count
-            variant_details[place] = {place: count}
-    
-    return normalized_counts, variant_details
-
-# 直接字符串搜索
-def direct_city_search(text):
-    direct_counts = Counter()
-    
-    # 对每个城市的所有变体进行直接文本搜索
-    for city, variants in city_normalization.items():
-        total = 0
-        for variant in variants:
-            count = text.count(variant)
-            total += count
-        if total > 0:
-            direct_counts[city] = total
-    
-    return direct_counts
-
-# 分析每个章节
-total_places = []
-chapter_analysis = []
-
-print("开始章节分析...")
-
-# 只分析第30-50章
-filtered_chapters = [chapter for chapter in chapter_data if 30 <= chapter['chapter_number'] <= 50]
-print(f"过滤后待分析章节数：{len(filtered_chapters)}")
-
-for chapter in filtered_chapters:
-    chapter_number = chapter['chapter_number']
-    chapter_title = chapter['chapter_title']
-    chapter_text = chapter['content']
-    
-    # 组合多种方法：jieba分词 + 直接字符串搜索
-    chapter_places = identify_cities_with_jieba(chapter_text)
-    
-    # 归一化并统计
-    city_counts, variant_details = normalize_and_count_cities(chapter_places)
-    
-    # 计算城市密集度
-    total_words = len(list(jieba.cut(chapter_text)))
-    city_density = sum(city_counts.values()) / total_words if total_words > 0 else 0
-    
-    # 记录分析结果
-    chapter_analysis.append({
-        'chapter_number': chapter_number,
-        'chapter_title': chapter_title,
-        'cities': city_counts,
-        'total_city_mentions': sum(city_counts.values()),
-        'city_density': city_density,
-        'variant_details': variant_details
-    })
-    
-    # 添加到总列表
-    total_places.extend(chapter_places)
-
-# 使用jieba方法进行分析
-filtered_text = '\n'.join([chapter['content'] for chapter in filtered_chapters])
-filtered_city_counts, filtered_variant_details = normalize_and_count_cities(total_places)
-
-# 进一步过滤结果，移除可能的非地名
-filtered_counts = {}
-for city, count in filtered_city_counts.items():
-    if is_valid_city(city):
-        filtered_counts[city] = count
-
-# 区域分类
-region_classification = {
-    '江南地区': ['南京', '蘇州', '杭州', '揚州', '湖州', '徽州', '鎮江', '常州', '嘉興', '寧波', '松江', '太倉'],
-    '华北地区': ['北京', '濟南', '開封', '大名', '保定', '天津'],
-    '西南地区': ['成都', '重慶', '貴陽'],
-    '其他地区': []
-}
-
-# 按区域分类统计
-region_stats = {region: Counter() for region in region_classification.keys()}
-for city, count in filtered_counts.items():
-    region_found = False
-    for region, cities_in_region in region_classification.items():
-        if city in cities_in_region:
-            region_stats[region][city] = count
-            region_found = True
-            break
-    if not region_found:
-        region_stats['其他地区'][city] = count
-
-# 提取所有城市列表
-all_cities_list = []
-for city, count in sorted(filtered_counts.items(), key=lambda x: x[1], reverse=True):
-    # 确定区域
-    region = '其他地区'
-    for r, cities_in_region in region_classification.items():
-        if city in cities_in_region:
-            region = r
-            break
-    
-    all_cities_list.append({
-        'city': city,
-        'count': count,
-        'region': region,
-        'variants': filtered_variant_details.get(city, {city: count})
-    })
-
-# 输出结果
-print("\n=== 第30-50章城市识别结果 ===")
-print(f"共识别出 {len(filtered_counts)} 个城市")
-print("\n出现次数最多的前20个城市：")
-
-for i, (city, count) in enumerate(sorted(filtered_counts.items(), key=lambda x: x[1], reverse=True)[:20], 1):
-    print(f"{i:2d}. {city}: {count} 次")
-    # 打印南京的变体详情
-    if city == '南京' and city in all_variant_details:
-        print("   南京变体详情：")
-        for variant, v_count in sorted(all_variant_details[city].items(), key=lambda x: x[1], reverse=True):
-            if v_count > 0:
-                print(f"     - {variant}: {v_count} 次")
-
-# 区域统计
-print("\n=== 区域统计 ===")
-for region, cities in region_stats.items():
-    total_mentions = sum(cities.values())
-    city_count = len(cities)
-    print(f"{region}: {city_count} 个城市, 共 {total_mentions} 次提及")
-
-# 30-50章中各章节城市出现统计
-print("\n=== 第30-50章各章节城市出现统计 ===")
-for chapter in chapter_analysis:
-    print(f"第{chapter['chapter_number']}回《{chapter['chapter_title']}》: {chapter['total_city_mentions']} 次")
-
-# 南京在各章节的分布
-print("\n=== 南京出现次数最多的10个章节 ===")
-nanjing_chapters = []
-for chapter in chapter_analysis:
-    if '南京' in chapter['cities']:
-        nanjing_chapters.append((chapter['chapter_number'], chapter['chapter_title'], chapter['cities']['南京']))
-
-nanjing_chapters.sort(key=lambda x: x[2], reverse=True)
-for i, (ch_num, ch_title, count) in enumerate(nanjing_chapters[:10], 1):
-    print(f"{i:2d}. 第{ch_num}回《{ch_title}》: {count} 次")
-
-# 保存结果
-print("\n保存最终分析结果...")
-
-# 保存JSON结果
-full_results = {
-    'total_chapters_analyzed': len(filtered_chapters),
-    'analyzed_chapters_range': '30-50',
-    'total_valid_cities': len(filtered_counts),
-    'city_counts': filtered_counts,
-    'region_statistics': {region: dict(cities) for region, cities in region_stats.items()},
-    'chapter_analysis': chapter_analysis,
-    'city_variant_details': filtered_variant_details,
-    'all_cities_list': all_cities_list
-}
-
-with open('final_city_analysis.json', 'w', encoding='utf-8') as f:
-    json.dump(full_results, f, ensure_ascii=False, indent=2)
-
-# 保存CSV结果
-with open('final_cities.csv', 'w', encoding='utf-8-sig', newline='') as f:
-    writer = csv.writer(f)
-    writer.writerow(['城市', '出现次数', '区域'])
-    
-    for city_info in all_cities_list:
-        writer.writerow([
-            city_info['city'],
-            city_info['count'],
-            city_info['region']
-        ])
-
-# 为可视化准备数据
-visualization_data = {
-    'cities': [],
-    'regions': {}
-}
-
-# 城市数据（前30个）
-for city_info in all_cities_list[:30]:
-    visualization_data['cities'].append({
-        'name': city_info['city'],
-        'value': city_info['count'],
-        'region': city_info['region']
-    })
-
-# 区域数据
-for region, cities in region_stats.items():
-    visualization_data['regions'][region] = {
-        'city_count': len(cities),
-        'total_mentions': sum(cities.values()),
-        'top_cities': sorted(cities.items(), key=lambda x: x[1], reverse=True)[:5]
+from chapter_reader import ChapterReader
+from columnar_store import COLUMNAR_DIR, save_tables
+from cooccurrence import compute_cooccurrence
+from gazetteer import GEOCODE_CACHE_PATH, geocode_places
+from journeys import JOURNEY_CACHE_PATH, load_journeys
+from region_index import classify_places, region_names
+from chapter_index import CHAPTER_INDEX_PATH, ChapterResultIndex
+from city_analysis import (MENTION_RULES_VERSION, analyze_chapter, canonical_place, custom_words,
+                           direct_city_search, identify_cities_with_jieba, is_valid_city, merge_chapter_records,
+                           normalize_and_count_cities, rules_fingerprint, tokenizer)
+from mention_index import MENTION_INDEX_PATH, MentionIndex
+from parallel_analysis import analyze_chapters_parallel
+from place_matrix import PLACE_MATRIX_PATH, PlaceChapterMatrix
+from profiling import TRACE_PATH, print_trace_summary, profiler, read_trace, summarize_trace
+from segmentation_cache import SegmentationCache, dictionary_fingerprint
+
+# 《儒林外史》原文默认路径
+DEFAULT_SOURCE_PATH = '/Users/yangtuotuo/Documents/trae_projects/CHC assignment2/儒林外史.txt'
+
+# 分词结果缓存目录
+SEGMENTATION_CACHE_DIR = '.segmentation_cache'
+
+# 分析过程中每批并入提及索引的提及数
+MENTION_BATCH_SIZE = 100_000
+
+# 地名识别流水线
+# 导入本模块不会执行任何分析，jieba也只在第一次需要分词时才导入和初始化
+class CityAnalyzer:
+    # 可单独复用的识别函数
+    is_valid_city = staticmethod(is_valid_city)
+    identify_cities_with_jieba = staticmethod(identify_cities_with_jieba)
+    normalize_and_count_cities = staticmethod(normalize_and_count_cities)
+    direct_city_search = staticmethod(direct_city_search)
+
+    def __init__(self, source_path=DEFAULT_SOURCE_PATH, workers=1, cache_dir=SEGMENTATION_CACHE_DIR,
+                 index_path=CHAPTER_INDEX_PATH, mention_index_path=MENTION_INDEX_PATH,
+                 geocode_cache_path=GEOCODE_CACHE_PATH, journey_cache_path=JOURNEY_CACHE_PATH):
+        self.source_path = source_path
+        self.workers = workers
+        self.cache_dir = cache_dir
+        self.index_path = index_path
+        self.mention_index_path = mention_index_path
+        self.geocode_cache_path = geocode_cache_path
+        self.journey_cache_path = journey_cache_path
+
+        # 分词结果缓存：以章节文本哈希和词典指纹为键，文本和词典未变时跳过分词
+        self.segmentation_cache = SegmentationCache(cache_dir, dictionary_fingerprint(custom_words))
+
+        # 原文（内存映射，按章节偏移索引按需读取）
+        self.reader = ChapterReader(source_path)
+
+        # 逐章分析结果索引和地名提及位置索引，原文、词典或过滤规则变化时失效
+        self.signature = {
+            'source': self.reader.source_signature(),
+            'rules': rules_fingerprint()
+        }
+        self.result_index = ChapterResultIndex(index_path, self.signature)
+        # 提及索引另带提及收集规则的版本号，规则调整时只需重建提及索引
+        self.mention_signature = dict(self.signature, mentions=MENTION_RULES_VERSION)
+        self.mention_index = MentionIndex.load(mention_index_path, self.mention_signature)
+
+    def segment(self, text):
+        """分词（优先读取缓存）"""
+        return self.segmentation_cache.segment(text, tokenizer)
+
+    def analyze_chapter(self, chapter):
+        with profiler.span('chapter', cat='chapter', chapter=chapter['chapter_number']):
+            return analyze_chapter(chapter, self.segment(chapter['content']))
+
+    def pending_chapters(self):
+        """索引中尚未保存的章节号"""
+        indexed_mentions = self.mention_index.chapter_numbers()
+        return set(number for number in self.reader.chapter_numbers()
+                   if number not in self.result_index or number not in indexed_mentions)
+
+    def update_index(self, rebuild=False):
+        """分析索引中缺少的章节并保存，返回本次分析的章节数"""
+        if rebuild:
+            self.result_index.records.clear()
+            self.mention_index = MentionIndex(signature=self.mention_signature)
+
+        pending_numbers = self.pending_chapters()
+        if not pending_numbers:
+            return 0
+
+        # 按需逐章读取，逐章合并结果
+        pending_chapters = self.reader.chapters(numbers=pending_numbers)
+        if self.workers > 1:
+            # 先在主进程生成合并词典缓存，工作进程启动时直接载入
+            tokenizer.load()
+            chapter_results = analyze_chapters_parallel(pending_chapters, self.workers, self.cache_dir)
+        else:
+            chapter_results = (self.analyze_chapter(chapter) for chapter in pending_chapters)
+
+        # 按章节顺序写入索引；提及位置每积累 MENTION_BATCH_SIZE 条就并入提及索引，
+        # 待写入的 (偏移, 变体) 列表不随全书长度增长
+        chapter_mentions = {}
+        batch_size = 0
+        for chapter_record, chapter_places, mentions in chapter_results:
+            self.result_index.add(chapter_record)
+            chapter_mentions[chapter_record['chapter_number']] = mentions
+            batch_size += len(mentions)
+            if batch_size >= MENTION_BATCH_SIZE:
+                self.mention_index.add_chapters(chapter_mentions, canonical_place)
+                chapter_mentions, batch_size = {}, 0
+        with profiler.span('save_index', items=len(pending_numbers)):
+            self.result_index.save()
+            if chapter_mentions:
+                self.mention_index.add_chapters(chapter_mentions, canonical_place)
+            self.mention_index.save(self.mention_index_path)
+        return len(pending_numbers)
+
+    def place_matrix(self):
+        """全书地点-章节稀疏矩阵"""
+        with profiler.span('place_matrix'):
+            return PlaceChapterMatrix.from_records(self.result_index.rows())
+
+    def journeys(self):
+        """各章节的叙事行程（提及索引和地名库未变时读取缓存）"""
+        return load_journeys(self.mention_index_path, self.journey_cache_path,
+                             geocode_cache_path=self.geocode_cache_path)
+
+    def cooccurrence(self, mode='sentence', window=50, start=None, end=None, places=None):
+        """[start, end] 范围内的地名共现矩阵（按句、按段或按字符窗口）"""
+        return compute_cooccurrence(self.mention_index, mode, window, self.reader, start, end, places)
+
+    def summarize(self, start=None, end=None):
+        """由已保存的逐章结果汇总 [start, end] 范围内的统计"""
+        with profiler.span('summarize') as span:
+            chapter_analysis = self.result_index.rows(start, end)
+            city_counts, variant_details = merge_chapter_records(chapter_analysis)
+
+            # 进一步过滤结果，移除可能的非地名
+            filtered_counts = {}
+            for city, count in city_counts.items():
+                if is_valid_city(city):
+                    filtered_counts[city] = count
+
+            span['items'] = len(chapter_analysis)
+
+        # 在本地地名库中批量查找全部地点的坐标，再按坐标划分区域
+        with profiler.span('geocode', items=len(filtered_counts)):
+            coordinates = geocode_places(filtered_counts, cache_path=self.geocode_cache_path)
+        with profiler.span('classify_regions', items=len(filtered_counts)):
+            region_stats, all_cities_list = classify_regions(filtered_counts, variant_details, coordinates)
+        return {
+            'start': start,
+            'end': end,
+            'chapter_analysis': chapter_analysis,
+            'city_counts': filtered_counts,
+            'variant_details': variant_details,
+            'region_stats': region_stats,
+            'all_cities_list': all_cities_list,
+            'coordinates': coordinates
+        }
+
+
+# 按区域分类统计，并生成按出现次数排序的城市列表
+# 区域由地点坐标在 regions.geojson 多边形中的位置决定（空间索引批量查询），没有坐标的地点归入其他地区
+def classify_regions(filtered_counts, variant_details, coordinates):
+    city_regions = classify_places(filtered_counts, coordinates)
+    region_stats = {region: Counter() for region in region_names()}
+    for city, count in filtered_counts.items():
+        region_stats[city_regions[city]][city] = count
+
+    # 提取所有城市列表
+    all_cities_list = []
+    for city, count in sorted(filtered_counts.items(), key=lambda x: x[1], reverse=True):
+        region = city_regions[city]
+        all_cities_list.append({
+            'city': city,
+            'count': count,
+            'region': region,
+            'variants': variant_details.get(city, {city: count})
+        })
+
+    return region_stats, all_cities_list
+
+
+# 输出统计结果
+def print_summary(summary):
+    start_chapter, end_chapter = summary['start'], summary['end']
+    filtered_counts = summary['city_counts']
+    filtered_variant_details = summary['variant_details']
+    chapter_analysis = summary['chapter_analysis']
+
+    print(f"\n=== 第{start_chapter}-{end_chapter}章城市识别结果 ===")
+    print(f"共识别出 {len(filtered_counts)} 个城市")
+    print("\n出现次数最多的前20个城市：")
+
+    for i, (city, count) in enumerate(sorted(filtered_counts.items(), key=lambda x: x[1], reverse=True)[:20], 1):
+        print(f"{i:2d}. {city}: {count} 次")
+        # 打印南京的变体详情
+        if city == '南京' and city in filtered_variant_details:
+            print("   南京变体详情：")
+            for variant, v_count in sorted(filtered_variant_details[city].items(), key=lambda x: x[1], reverse=True):
+                if v_count > 0:
+                    print(f"     - {variant}: {v_count} 次")
+
+    # 区域统计
+    print("\n=== 区域统计 ===")
+    for region, cities in summary['region_stats'].items():
+        total_mentions = sum(cities.values())
+        city_count = len(cities)
+        print(f"{region}: {city_count} 个城市, 共 {total_mentions} 次提及")
+
+    # 统计范围内各章节城市出现统计
+    print(f"\n=== 第{start_chapter}-{end_chapter}章各章节城市出现统计 ===")
+    for chapter in chapter_analysis:
+        print(f"第{chapter['chapter_number']}回《{chapter['chapter_title']}》: {chapter['total_city_mentions']} 次")
+
+    # 南京在各章节的分布
+    print("\n=== 南京出现次数最多的10个章节 ===")
+    nanjing_chapters = []
+    for chapter in chapter_analysis:
+        if '南京' in chapter['cities']:
+            nanjing_chapters.append((chapter['chapter_number'], chapter['chapter_title'], chapter['cities']['南京']))
+
+    nanjing_chapters.sort(key=lambda x: x[2], reverse=True)
+    for i, (ch_num, ch_title, count) in enumerate(nanjing_chapters[:10], 1):
+        print(f"{i:2d}. 第{ch_num}回《{ch_title}》: {count} 次")
+
+
+# 保存JSON、CSV、可视化数据和列式二进制结果
+def save_results(summary, place_matrix):
+    start_chapter, end_chapter = summary['start'], summary['end']
+    filtered_counts = summary['city_counts']
+    chapter_analysis = summary['chapter_analysis']
+    region_stats = summary['region_stats']
+    all_cities_list = summary['all_cities_list']
+
+    # 保存JSON结果
+    full_results = {
+        'total_chapters_analyzed': len(chapter_analysis),
+        'analyzed_chapters_range': f'{start_chapter}-{end_chapter}',
+        'total_valid_cities': len(filtered_counts),
+        'city_counts': filtered_counts,
+        'region_statistics': {region: dict(cities) for region, cities in region_stats.items()},
+        'chapter_analysis': chapter_analysis,
+        'city_variant_details': summary['variant_details'],
+        'all_cities_list': all_cities_list
     }
 
-with open('final_visualization.json', 'w', encoding='utf-8') as f:
-    json.dump(visualization_data, f, ensure_ascii=False, indent=2)
-
-print("\n最终分析完成！")
-print(f"分析范围：第30-50章")
-print(f"分析章节数：{len(filtered_chapters)}")
-print(f"结果文件：")
-print(f"1. final_city_analysis.json - 完整分析结果")
-print(f"2. final_cities.csv - 城市统计表格")
-print(f"3. final_visualization.json - 可视化数据")
-print(f"\n总计识别城市数量：{len(filtered_counts)}")
-print(f"南京出现次数：{filtered_counts.get('南京', 0)} 次")
-print(f"扬州出现次数：{filtered_counts.get('揚州', 0)} 次")
-print(f"\n使用jieba分词方法，通过严格过滤非地名词汇，成功排除了'知道'、'說道'等错误结果。")
\ No newline at end of file
+    with profiler.span('json_dump'), open('final_city_analysis.json', 'w', encoding='utf-8') as f:
+        json.dump(full_results, f, ensure_ascii=False, indent=2)
+
+    # 保存列式二进制结果（城市列表、逐章统计、全书地点-章节矩阵），下游可直接内存映射读取
+    with profiler.span('save_columns'):
+        save_tables(COLUMNAR_DIR, {
+            'cities': {
+                'city': np.array([city_info['city'] for city_info in all_cities_list], dtype=str),
+                'count': np.array([city_info['count'] for city_info in all_cities_list], dtype=np.int64),
+                'region': np.array([city_info['region'] for city_info in all_cities_list], dtype=str)
+            },
+            'chapters': {
+                'chapter_number': np.array([chapter['chapter_number'] for chapter in chapter_analysis], dtype=np.int32),
+                'chapter_title': np.array([chapter['chapter_title'] for chapter in chapter_analysis], dtype=str),
+                'total_city_mentions': np.array([chapter['total_city_mentions'] for chapter in chapter_analysis], dtype=np.int64),
+                'total_words': np.array([chapter['total_words'] for chapter in chapter_analysis], dtype=np.int64),
+                'city_density': np.array([chapter['city_density'] for chapter in chapter_analysis], dtype=np.float64)
+            },
+            'matrix': place_matrix.to_columns()
+        })
+
+    # 保存CSV结果
+    with open('final_cities.csv', 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['城市', '出现次数', '区域'])
+
+        for city_info in all_cities_list:
+            writer.writerow([
+                city_info['city'],
+                city_info['count'],
+                city_info['region']
+            ])
+
+    # 为可视化准备数据
+    visualization_data = {
+        'cities': [],
+        'regions': {}
+    }
+
+    # 城市数据（前30个）
+    for city_info in all_cities_list[:30]:
+        city_data = {
+            'name': city_info['city'],
+            'value': city_info['count'],
+            'region': city_info['region']
+        }
+        # 地名库中找到坐标的地点附带经纬度
+        coordinate = summary['coordinates'].get(city_info['city'])
+        if coordinate:
+            city_data['lat'] = coordinate['lat']
+            city_data['lng'] = coordinate['lng']
+        visualization_data['cities'].append(city_data)
+
+    # 区域数据
+    for region, cities in region_stats.items():
+        visualization_data['regions'][region] = {
+            'city_count': len(cities),
+            'total_mentions': sum(cities.values()),
+            'top_cities': sorted(cities.items(), key=lambda x: x[1], reverse=True)[:5]
+        }
+
+    with open('final_visualization.json', 'w', encoding='utf-8') as f:
+        json.dump(visualization_data, f, ensure_ascii=False, indent=2)
+
+
+def main(argv=None):
+    # 命令行参数
+    parser = argparse.ArgumentParser(description='《儒林外史》地名识别与统计')
+    parser.add_argument('--source', default=DEFAULT_SOURCE_PATH, help='《儒林外史》原文路径')
+    parser.add_argument('--workers', type=int, default=1,
+                        help='并行分析的进程数，默认1（串行）')
+    parser.add_argument('--start', type=int, default=30, help='统计范围的开始章节，默认30')
+    parser.add_argument('--end', type=int, default=50, help='统计范围的结束章节，默认50')
+    parser.add_argument('--rebuild-index', action='store_true',
+                        help='忽略已保存的逐章结果，重新分析全书')
+    parser.add_argument('--trace', nargs='?', const=TRACE_PATH,
+                        help=f'记录各阶段耗时到 JSON lines 轨迹文件（Chrome trace 事件格式），默认 {TRACE_PATH}')
+    args = parser.parse_args(argv)
+
+    if args.trace:
+        profiler.start(args.trace)
+    try:
+        run(args)
+    finally:
+        profiler.stop()
+
+    if args.trace:
+        print(f"\n=== 各阶段耗时（{args.trace}）===")
+        print_trace_summary(summarize_trace(read_trace(args.trace)))
+
+
+def run(args):
+
+    # 读取《儒林外史》文本
+    print("读取《儒林外史》文本...")
+    analyzer = CityAnalyzer(args.source, workers=args.workers)
+    print(f"共找到 {len(analyzer.reader)} 个章节")
+
+    # 全书每章只分析一次，之后任意章节范围都由已保存的结果汇总
+    pending_count = len(analyzer.pending_chapters()) if not args.rebuild_index else len(analyzer.reader)
+    print(f"已保存 {len(analyzer.result_index)} 个章节的分析结果，待分析章节数：{pending_count}")
+    if pending_count:
+        print("开始章节分析...")
+        if args.workers > 1:
+            print(f"并行分析，进程数：{args.workers}")
+        analyzer.update_index(rebuild=args.rebuild_index)
+
+    # 全书地点-章节稀疏矩阵，供应用和GIS脚本直接加载
+    place_matrix = analyzer.place_matrix()
+    with profiler.span('save_matrix'):
+        place_matrix.save(PLACE_MATRIX_PATH)
+
+    # 各章节的叙事行程和地点距离矩阵（缓存在提及索引未变时直接复用），供应用和GIS脚本绘制路线
+    with profiler.span('journeys'):
+        journeys = analyzer.journeys()
+
+    # 汇总统计范围内各章节的结果
+    start_chapter, end_chapter = args.start, args.end
+    summary = analyzer.summarize(start_chapter, end_chapter)
+    print(f"统计范围：第{start_chapter}-{end_chapter}章，共 {len(summary['chapter_analysis'])} 个章节")
+
+    # 输出结果
+    print_summary(summary)
+
+    # 保存结果
+    print("\n保存最终分析结果...")
+    with profiler.span('save_results'):
+        save_results(summary, place_matrix)
+
+    filtered_counts = summary['city_counts']
+    print("\n最终分析完成！")
+    print(f"分析范围：第{start_chapter}-{end_chapter}章")
+    print(f"分析章节数：{len(summary['chapter_analysis'])}")
+    print(f"结果文件：")
+    print(f"1. final_city_analysis.json - 完整分析结果")
+    print(f"2. final_cities.csv - 城市统计表格")
+    print(f"3. final_visualization.json - 可视化数据")
+    print(f"4. {COLUMNAR_DIR}/ - 列式二进制结果（可内存映射）")
+    if journeys is not None:
+        print(f"5. {analyzer.journey_cache_path} - 各章节行程与地点距离矩阵")
+        journey_metrics = journeys.metrics(start_chapter, end_chapter)
+        print(f"叙事行程总里程：{journey_metrics['total_km'].sum():.0f} 公里"
+              f"（{int(journey_metrics['legs'].sum())} 段路程）")
+    print(f"\n总计识别城市数量：{len(filtered_counts)}")
+    print(f"南京出现次数：{filtered_counts.get('南京', 0)} 次")
+    print(f"扬州出现次数：{filtered_counts.get('揚州', 0)} 次")
+    print(f"\n使用jieba分词方法，通过严格过滤非地名词汇，成功排除了'知道'、'說道'等错误结果。")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+import bisect
+import csv
+import hashlib
+import json
+import os
+
+from place_classifier import DIRECTION_PREFIXES
+
+# 本地历史地名库（随代码提供）和地理编码缓存的默认位置
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'gazetteer.csv')
+GEOCODE_CACHE_PATH = 'geocode_cache.json'
+
+# 查找时可去掉的行政区划后缀（如"揚州府" -> "揚州"）
+ADMIN_SUFFIXES = ('府', '州', '縣', '城', '鎮', '衛')
+
+
+# 本地历史地名库
+# 从CSV/TSV读取（列：name, variants, lat, lng, modern_name, type，variants 以 | 分隔），
+# 建立 标准名 和 变体 两个索引以及有序键表，支持精确、变体和前缀查找
+class Gazetteer:
+    def __init__(self, entries):
+        self.entries = list(entries)
+        self.exact = {}
+        self.variants = {}
+        for eid, entry in enumerate(self.entries):
+            self.exact.setdefault(entry['name'], eid)
+            for variant in entry['historical_names']:
+                self.variants.setdefault(variant, eid)
+        # 前缀查找用的有序键表
+        self.keys = sorted(set(self.exact) | set(self.variants))
+
+    @classmethod
+    def load(cls, path=GAZETTEER_PATH):
+        delimiter = '\t' if path.lower().endswith(('.tsv', '.tab')) else ','
+        entries = []
+        with open(path, 'r', encoding='utf-8-sig', newline='') as f:
+            for row in csv.DictReader(f, delimiter=delimiter):
+                try:
+                    lat, lng = float(row['lat']), float(row['lng'])
+                except (KeyError, TypeError, ValueError):
+                    continue
+                name = row['name'].strip()
+                variants = [variant.strip() for variant in (row.get('variants') or '').split('|') if variant.strip()]
+                entries.append({
+                    'name': name,
+                    'lat': lat,
+                    'lng': lng,
+                    'modern_name': (row.get('modern_name') or '').strip(),
+                    'type': (row.get('type') or '').strip(),
+                    'historical_names': [name] + [variant for variant in variants if variant != name]
+                })
+        return cls(entries)
+
+    def _entry_id(self, key):
+        eid = self.exact.get(key)
+        return self.variants.get(key) if eid is None else eid
+
+    def lookup(self, place):
+        """返回 (地名库条目, 匹配方式)，未找到时返回 (None, None)
+        匹配方式依次为：exact 标准名、variant 变体、stripped 去掉方向词或行政后缀后匹配、prefix 前缀匹配"""
+        if place in self.exact:
+            return self.entries[self.exact[place]], 'exact'
+        if place in self.variants:
+            return self.entries[self.variants[place]], 'variant'
+
+        # 去掉"到/在/往/自"等方向词和"府/州/縣"等后缀后再查
+        stripped = place[1:] if len(place) > 2 and place.startswith(DIRECTION_PREFIXES) else place
+        for candidate in (stripped, stripped[:-1] if stripped.endswith(ADMIN_SUFFIXES) else None):
+            if candidate and candidate != place and len(candidate) >= 2:
+                eid = self._entry_id(candidate)
+                if eid is not None:
+                    return self.entries[eid], 'stripped'
+
+        # 地名库中最长的、是该地名前缀的键（如"南京城外" -> "南京"）
+        for length in range(len(stripped) - 1, 1, -1):
+            eid = self._entry_id(stripped[:length])
+            if eid is not None:
+                return self.entries[eid], 'prefix'
+
+        # 以该地名为前缀的键只对应一个条目时（如"天長" -> "天長縣"）
+        if len(stripped) >= 2:
+            lo = bisect.bisect_left(self.keys, stripped)
+            hi = bisect.bisect_left(self.keys, stripped + '\uffff')
+            matches = {self._entry_id(key) for key in self.keys[lo:hi]}
+            if len(matches) == 1:
+                return self.entries[matches.pop()], 'prefix'
+        return None, None
+
+
+# 地理编码结果的持久缓存，地名库文件内容变化时整体失效
+class GeocodeCache:
+    def __init__(self, path=GEOCODE_CACHE_PATH, signature=None):
+        self.path = path
+        self.signature = signature
+        self.results = {}
+        self.dirty = False
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                saved = json.load(f)
+            if saved.get('signature') == signature:
+                self.results = saved['results']
+        except (OSError, ValueError, KeyError):
+            pass
+
+    def save(self):
+        if not self.dirty:
+            return
+        try:
+            with open(self.path, 'w', encoding='utf-8') as f:
+                json.dump({'signature': self.signature, 'results': self.results}, f, ensure_ascii=False)
+            self.dirty = False
+        except OSError:
+            # 缓存无法写入时（如只读目录）仅在内存中使用
+            pass
+
+
+def gazetteer_signature(path=GAZETTEER_PATH):
+    with open(path, 'rb') as f:
+        return hashlib.sha256(f.read()).hexdigest()[:16]
+
+
+# 批量地理编码：返回 {地名: {'lat', 'lng', 'modern_name', 'historical_names', 'gazetteer_name', 'match'}}，
+# 只包含找到坐标的地名；查找结果（包括未找到）写入持久缓存，地名库只在有未缓存的地名时才加载
+def geocode_places(places, gazetteer_path=GAZETTEER_PATH, cache_path=GEOCODE_CACHE_PATH):
+    if not os.path.exists(gazetteer_path):
+        return {}
+    cache = GeocodeCache(cache_path, gazetteer_signature(gazetteer_path))
+
+    places = list(dict.fromkeys(places))
+    missing = [place for place in places if place not in cache.results]
+    if missing:
+        gazetteer = Gazetteer.load(gazetteer_path)
+        for place in missing:
+            entry, match = gazetteer.lookup(place)
+            cache.results[place] = None if entry is None else {
+                'lat': entry['lat'],
+                'lng': entry['lng'],
+                'modern_name': entry['modern_name'],
+                'historical_names': entry['historical_names'],
+                'gazetteer_name': entry['name'],
+                'match': match
+            }
+        cache.dirty = True
+        cache.save()
+
+    return {place: cache.results[place] for place in places if cache.results[place] is not None}
+
+
+# 按地名库条目分组：同一条目的不同写法（如"湖州"和"湖州府"）归为一组，返回 {条目标准名: [地名, ...]}
+def group_by_entry(geocoded):
+    groups = {}
+    for place, coord in geocoded.items():
+        groups.setdefault(coord['gazetteer_name'], []).append(place)
+    return groups
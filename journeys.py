@@ -0,0 +1,197 @@
+import json
+import os
+
+import numpy as np
+
+from gazetteer import GAZETTEER_PATH, GEOCODE_CACHE_PATH, gazetteer_signature, geocode_places, group_by_entry
+from mention_index import MENTION_INDEX_PATH, MentionIndex
+
+# 行程缓存的默认保存位置
+JOURNEY_CACHE_PATH = 'journeys.npz'
+
+# 地球平均半径（公里）
+EARTH_RADIUS_KM = 6371.0088
+
+
+# 球面距离矩阵：由纬度、经度数组（度）一次广播算出全部地点两两之间的 haversine 距离（公里）
+def haversine_matrix(lat, lng, radius=EARTH_RADIUS_KM):
+    lat = np.radians(np.asarray(lat, dtype=np.float64))
+    lng = np.radians(np.asarray(lng, dtype=np.float64))
+    dlat = lat[:, None] - lat[None, :]
+    dlng = lng[:, None] - lng[None, :]
+    a = np.sin(dlat / 2) ** 2 + np.cos(lat)[:, None] * np.cos(lat)[None, :] * np.sin(dlng / 2) ** 2
+    return 2 * radius * np.arcsin(np.sqrt(np.clip(a, 0, 1)))
+
+
+# 缓存签名：提及索引文件的大小和修改时间 + 地名库内容，任一变化时缓存失效
+def journey_signature(mention_index_path=MENTION_INDEX_PATH, gazetteer_path=GAZETTEER_PATH):
+    stat = os.stat(mention_index_path)
+    return {'mention_index': [stat.st_size, stat.st_mtime_ns],
+            'gazetteer': gazetteer_signature(gazetteer_path) if os.path.exists(gazetteer_path) else None}
+
+
+# 各章节的叙事行程
+# 每章按地点首次被提及的先后排成一条路线（同一地名库条目的不同写法算同一地点）；
+# 全部章节的路线首尾相接存放（CSR）：章节 i 的各站为 path[indptr[i]:indptr[i + 1]]，
+# leg_km[k] 为第 k 站与同章上一站之间的距离（每章第一站为 0）
+class Journeys:
+    def __init__(self, places=(), lat=(), lng=(), chapters=(), indptr=None, path=None, signature=None):
+        self.signature = signature
+        self.places = list(places)                      # 地点id -> 地名库标准名
+        self.lat = np.asarray(lat, dtype=np.float64)
+        self.lng = np.asarray(lng, dtype=np.float64)
+        self.chapters = np.asarray(chapters, dtype=np.int32)
+        self.indptr = np.zeros(len(self.chapters) + 1, dtype=np.int64) if indptr is None \
+            else np.asarray(indptr, dtype=np.int64)
+        self.path = np.asarray(path if path is not None else [], dtype=np.int32)
+        self.place_ids = {name: pid for pid, name in enumerate(self.places)}
+
+        # 全部地点两两之间的距离矩阵和每一段路程的长度
+        self.distances = haversine_matrix(self.lat, self.lng)
+        self.stop_chapter = np.repeat(np.arange(len(self.chapters)), np.diff(self.indptr))
+        self.leg_km = np.zeros(len(self.path))
+        if len(self.path) > 1:
+            same_chapter = self.stop_chapter[1:] == self.stop_chapter[:-1]
+            self.leg_km[1:] = np.where(same_chapter, self.distances[self.path[:-1], self.path[1:]], 0)
+
+    @classmethod
+    def from_mention_index(cls, mention_index, gazetteer_path=GAZETTEER_PATH, cache_path=GEOCODE_CACHE_PATH,
+                           signature=None):
+        """由地名提及索引和地名库坐标生成全部章节的行程"""
+        coordinates = geocode_places(mention_index.places, gazetteer_path, cache_path)
+        groups = group_by_entry(coordinates)
+        places = list(groups)
+        lat = [coordinates[groups[name][0]]['lat'] for name in places]
+        lng = [coordinates[groups[name][0]]['lng'] for name in places]
+
+        # 提及索引的地名id -> 行程地点id（没有坐标的为 -1）
+        place_entry = np.full(len(mention_index.places), -1, dtype=np.int64)
+        for pid, name in enumerate(places):
+            place_entry[[mention_index.place_ids[place] for place in groups[name]]] = pid
+
+        chapter, _, variant = mention_index.by_chapter(np.iinfo(np.int32).min, np.iinfo(np.int32).max)
+        entry = place_entry[mention_index.place_of(variant)] if len(variant) else np.zeros(0, dtype=np.int64)
+        located = entry >= 0
+        chapter, entry = chapter[located], entry[located]
+
+        # 提及已按 (章节号, 偏移) 排序：每个 (章节, 地点) 取第一次出现的行，按行号排序即得各章的首次提及顺序
+        _, first = np.unique(chapter.astype(np.int64) * max(len(places), 1) + entry, return_index=True)
+        first.sort()
+        chapters = np.union1d(np.fromiter(mention_index.indexed_chapters, dtype=np.int32,
+                                          count=len(mention_index.indexed_chapters)), chapter)
+        indptr = np.searchsorted(chapter[first], chapters, side='left')
+        indptr = np.append(indptr, len(first))
+        return cls(places, lat, lng, chapters, indptr, entry[first], signature)
+
+    @classmethod
+    def load(cls, path=JOURNEY_CACHE_PATH, signature=None):
+        """读取行程缓存；文件不存在或签名不一致时返回 None"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path, allow_pickle=False) as data:
+            saved_signature = json.loads(str(data['signature']))
+            if signature is not None and saved_signature != signature:
+                return None
+            return cls(places=data['places'].tolist(), lat=data['lat'], lng=data['lng'],
+                       chapters=data['chapters'], indptr=data['indptr'], path=data['path'],
+                       signature=saved_signature)
+
+    def save(self, path=JOURNEY_CACHE_PATH):
+        # 写入临时文件后替换，避免中断时留下损坏的缓存
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path,
+                 signature=np.array(json.dumps(self.signature, ensure_ascii=False)),
+                 places=np.array(self.places, dtype=str),
+                 lat=self.lat,
+                 lng=self.lng,
+                 chapters=self.chapters,
+                 indptr=self.indptr,
+                 path=self.path)
+        os.replace(tmp_path, path)
+
+    def _chapter_span(self, start=None, end=None):
+        lo = 0 if start is None else np.searchsorted(self.chapters, start, side='left')
+        hi = len(self.chapters) if end is None else np.searchsorted(self.chapters, end, side='right')
+        return lo, hi
+
+    def trajectory(self, chapter):
+        """某一章按首次提及顺序经过的地点名列表"""
+        i = np.searchsorted(self.chapters, chapter)
+        if i == len(self.chapters) or self.chapters[i] != chapter:
+            return []
+        return [self.places[pid] for pid in self.path[self.indptr[i]:self.indptr[i + 1]]]
+
+    def distance(self, a, b):
+        """两个地点之间的球面距离（公里）"""
+        return float(self.distances[self.place_ids[a], self.place_ids[b]])
+
+    def metrics(self, start=None, end=None):
+        """[start, end] 范围内各章的行程指标：站数、路段数、总里程、最长一段和平均每段里程（公里）"""
+        lo, hi = self._chapter_span(start, end)
+        rows = slice(self.indptr[lo], self.indptr[hi])
+        chapter_ids = self.stop_chapter[rows] - lo
+        stops = np.diff(self.indptr[lo:hi + 1])
+        legs = np.maximum(stops - 1, 0)
+        total_km = np.bincount(chapter_ids, weights=self.leg_km[rows], minlength=hi - lo)
+        max_leg_km = np.zeros(hi - lo)
+        np.maximum.at(max_leg_km, chapter_ids, self.leg_km[rows])
+        with np.errstate(divide='ignore', invalid='ignore'):
+            mean_leg_km = np.where(legs > 0, total_km / legs, 0.0)
+        return {
+            'chapter': self.chapters[lo:hi],
+            'stops': stops,
+            'legs': legs,
+            'total_km': total_km,
+            'max_leg_km': max_leg_km,
+            'mean_leg_km': mean_leg_km
+        }
+
+    def layer_data(self, start=None, end=None, chapter_titles=None):
+        """[start, end] 范围内各章行程的地图数据：地点坐标只存一份，各章路线只引用地点序号"""
+        lo, hi = self._chapter_span(start, end)
+        chapter_titles = chapter_titles or {}
+        used = np.unique(self.path[self.indptr[lo]:self.indptr[hi]])
+        local = {pid: i for i, pid in enumerate(used.tolist())}
+        metrics = self.metrics(start, end)
+
+        routes = []
+        for i, chapter in enumerate(self.chapters[lo:hi].tolist()):
+            stops = self.path[self.indptr[lo + i]:self.indptr[lo + i + 1]].tolist()
+            if len(stops) < 2:
+                continue
+            routes.append({
+                'chapter': chapter,
+                'title': chapter_titles.get(chapter, ''),
+                'stops': [local[pid] for pid in stops],
+                'km': round(float(metrics['total_km'][i]), 1)
+            })
+        return {
+            'places': [self.places[pid] for pid in used.tolist()],
+            'points': [[round(float(self.lat[pid]), 4), round(float(self.lng[pid]), 4)] for pid in used.tolist()],
+            'routes': routes
+        }
+
+
+# 生成行程并写入缓存（分析流水线在更新提及索引后调用）
+def build_journeys(mention_index_path=MENTION_INDEX_PATH, cache_path=JOURNEY_CACHE_PATH,
+                   gazetteer_path=GAZETTEER_PATH, geocode_cache_path=GEOCODE_CACHE_PATH):
+    signature = journey_signature(mention_index_path, gazetteer_path)
+    journeys = Journeys.from_mention_index(MentionIndex.load(mention_index_path), gazetteer_path,
+                                           geocode_cache_path, signature)
+    try:
+        journeys.save(cache_path)
+    except OSError:
+        # 缓存无法写入时（如只读目录）仅在内存中使用
+        pass
+    return journeys
+
+
+# 读取行程：缓存有效时直接加载，否则由提及索引重新生成；没有提及索引（旧版结果或模拟数据）时返回 None
+def load_journeys(mention_index_path=MENTION_INDEX_PATH, cache_path=JOURNEY_CACHE_PATH,
+                  gazetteer_path=GAZETTEER_PATH, geocode_cache_path=GEOCODE_CACHE_PATH):
+    if not os.path.exists(mention_index_path):
+        return None
+    journeys = Journeys.load(cache_path, journey_signature(mention_index_path, gazetteer_path))
+    if journeys is None:
+        journeys = build_journeys(mention_index_path, cache_path, gazetteer_path, geocode_cache_path)
+    return journeys
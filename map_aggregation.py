@@ -0,0 +1,123 @@
+import numpy as np
+
+# Web 墨卡托瓦片的像素边长
+TILE_SIZE = 256
+
+# 默认预计算的缩放级别
+MIN_ZOOM, MAX_ZOOM = 3, 12
+
+# 聚类格子和六边形的屏幕像素大小：每个缩放级别的要素数不超过屏幕能容纳的格子数
+CLUSTER_CELL_PX = 60
+HEX_RADIUS_PX = 24
+
+# 每个聚类在提示中列出的地点数
+CLUSTER_MEMBERS = 5
+
+
+# 经纬度 -> 某缩放级别下的 Web 墨卡托像素坐标（与 Leaflet 的 map.project 一致）
+def project(lat, lng, zoom):
+    scale = TILE_SIZE * 2.0 ** zoom
+    siny = np.clip(np.sin(np.radians(lat)), -0.9999, 0.9999)
+    x = (np.asarray(lng, dtype=np.float64) + 180) / 360 * scale
+    y = (0.5 - np.log((1 + siny) / (1 - siny)) / (4 * np.pi)) * scale
+    return x, y
+
+
+def unproject(x, y, zoom):
+    scale = TILE_SIZE * 2.0 ** zoom
+    lng = np.asarray(x, dtype=np.float64) / scale * 360 - 180
+    lat = np.degrees(np.arctan(np.sinh(np.pi - 2 * np.pi * np.asarray(y, dtype=np.float64) / scale)))
+    return lat, lng
+
+
+# 只保留权重为正的地点，返回 (纬度, 经度, 权重, 原序号) 数组
+def _weighted_points(lat, lng, weight):
+    lat, lng, weight = (np.asarray(a, dtype=np.float64) for a in (lat, lng, weight))
+    keep = np.flatnonzero(weight > 0)
+    return lat[keep], lng[keep], weight[keep], keep
+
+
+# 按缩放级别的网格聚类：每个级别把地点投影到像素平面，落在同一 cell_size 像素方格内的地点合为一个聚类，
+# 聚类位置为权重加权的中心，代表地点为格内权重最大的地点
+# 返回 {缩放级别: [[纬度, 经度, 总权重, 地点数, 代表地点序号, [格内权重最大的若干地点序号]], ...]}
+def zoom_clusters(lat, lng, weight, zooms=range(MIN_ZOOM, MAX_ZOOM + 1), cell_size=CLUSTER_CELL_PX,
+                  members=CLUSTER_MEMBERS):
+    lat, lng, weight, ids = _weighted_points(lat, lng, weight)
+    levels = {}
+    for zoom in zooms:
+        x, y = project(lat, lng, zoom)
+        cells = (np.floor(x / cell_size).astype(np.int64) << 32) | np.floor(y / cell_size).astype(np.int64)
+        _, inverse = np.unique(cells, return_inverse=True)
+        total = np.bincount(inverse, weights=weight)
+        count = np.bincount(inverse)
+        center_lat, center_lng = unproject(np.bincount(inverse, weights=x * weight) / total,
+                                           np.bincount(inverse, weights=y * weight) / total, zoom)
+
+        # 格内按权重降序排列，每格的前 members 个地点
+        order = np.lexsort((-weight, inverse))
+        group_start = np.searchsorted(inverse[order], np.arange(len(total)))
+        rank = np.arange(len(order)) - np.repeat(group_start, count)
+        top = order[rank < members]
+        top_ids = np.split(ids[top], np.cumsum(np.minimum(count, members))[:-1])
+
+        levels[zoom] = [[round(float(a), 5), round(float(b), 5), float(w), int(n), int(top_members[0]),
+                         top_members.tolist()]
+                        for a, b, w, n, top_members in zip(center_lat, center_lng, total, count, top_ids)]
+    return levels
+
+
+# 六边形分箱（尖顶六边形，外接圆半径 radius 像素）：把地点投影到像素平面后取所在六边形，按六边形累加权重
+# 返回 {缩放级别: [[中心纬度, 中心经度, 总权重, 地点数], ...]}
+def hex_bins(lat, lng, weight, zooms=range(MIN_ZOOM, MAX_ZOOM + 1), radius=HEX_RADIUS_PX):
+    lat, lng, weight, _ = _weighted_points(lat, lng, weight)
+    levels = {}
+    for zoom in zooms:
+        x, y = project(lat, lng, zoom)
+
+        # 像素坐标 -> 轴向坐标 (q, r)，再按立方坐标取整到最近的六边形
+        q = (np.sqrt(3) / 3 * x - y / 3) / radius
+        r = (2 / 3 * y) / radius
+        s = -q - r
+        rq, rr, rs = np.round(q), np.round(r), np.round(s)
+        dq, dr, ds = np.abs(rq - q), np.abs(rr - r), np.abs(rs - s)
+        fix_q = (dq > dr) & (dq > ds)
+        fix_r = ~fix_q & (dr > ds)
+        rq = np.where(fix_q, -rr - rs, rq)
+        rr = np.where(fix_r, -rq - rs, rr)
+
+        hexes, inverse = np.unique(np.column_stack([rq, rr]), axis=0, return_inverse=True)
+        inverse = inverse.ravel()
+        total = np.bincount(inverse, weights=weight)
+        count = np.bincount(inverse)
+        hex_q, hex_r = hexes[:, 0], hexes[:, 1]
+        center_lat, center_lng = unproject(radius * np.sqrt(3) * (hex_q + hex_r / 2), radius * 1.5 * hex_r, zoom)
+
+        levels[zoom] = [[round(float(a), 5), round(float(b), 5), float(w), int(n)]
+                        for a, b, w, n in zip(center_lat, center_lng, total, count)]
+    return levels
+
+
+def _place_arrays(places, coordinates, weights):
+    places = [place for place in places if place in coordinates]
+    lat = np.array([coordinates[place]['lat'] for place in places], dtype=np.float64)
+    lng = np.array([coordinates[place]['lng'] for place in places], dtype=np.float64)
+    weight = np.array([weights.get(place, 0) for place in places], dtype=np.float64)
+    return places, lat, lng, weight
+
+
+# 地点聚类图层的数据：地点名、现代名称和权重各保存一份，各级别的聚类只引用地点序号
+def place_cluster_levels(places, coordinates, weights, zooms=range(MIN_ZOOM, MAX_ZOOM + 1),
+                         cell_size=CLUSTER_CELL_PX):
+    places, lat, lng, weight = _place_arrays(places, coordinates, weights)
+    return {
+        'names': places,
+        'modern_names': [coordinates[place].get('modern_name', '') for place in places],
+        'weights': weight.astype(np.int64).tolist(),
+        'levels': zoom_clusters(lat, lng, weight, zooms, cell_size)
+    }
+
+
+# 六边形热力图层的数据
+def place_hex_levels(places, coordinates, weights, zooms=range(MIN_ZOOM, MAX_ZOOM + 1), radius=HEX_RADIUS_PX):
+    _, lat, lng, weight = _place_arrays(places, coordinates, weights)
+    return {'radius': radius, 'levels': hex_bins(lat, lng, weight, zooms, radius)}
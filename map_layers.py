@@ -0,0 +1,312 @@
+from folium.map import Layer
+from folium.template import Template
+
+
+# 章节范围内的地点分布转为一个 GeoJSON FeatureCollection
+# 每个地点一个 Point 要素，属性 c 为该地点非零章节的 [章节号, 次数] 列表（稀疏，只存出现过的章节）；
+# 章节号和标题只在集合上保存一份，体积与 地点数 + 非零项数 成正比
+def chapter_feature_collection(place_matrix, coordinates, places=None, start=None, end=None, chapter_titles=None):
+    lo, hi = place_matrix.chapter_span(start, end)
+    chapters = place_matrix.chapters[lo:hi].tolist()
+    titles = dict(zip(place_matrix.chapters.tolist(), place_matrix.chapter_titles))
+    titles.update(chapter_titles or {})
+
+    features = []
+    for place in (place_matrix.places if places is None else places):
+        pid = place_matrix.place_ids.get(place)
+        coord = coordinates.get(place)
+        if pid is None or coord is None:
+            continue
+        cols = place_matrix.indices[place_matrix.indptr[pid]:place_matrix.indptr[pid + 1]]
+        counts = place_matrix.data[place_matrix.indptr[pid]:place_matrix.indptr[pid + 1]]
+        in_range = (cols >= lo) & (cols < hi)
+        if not in_range.any():
+            continue
+        features.append({
+            'type': 'Feature',
+            'geometry': {'type': 'Point', 'coordinates': [round(coord['lng'], 4), round(coord['lat'], 4)]},
+            'properties': {
+                'name': place,
+                'modern_name': coord.get('modern_name', ''),
+                'historical_names': coord.get('historical_names', [place]),
+                'c': [[place_matrix.chapters[col].item(), count.item()]
+                      for col, count in zip(cols[in_range], counts[in_range])]
+            }
+        })
+
+    return {
+        'type': 'FeatureCollection',
+        'chapters': chapters,
+        'titles': [titles.get(chapter, '') for chapter in chapters],
+        'features': features
+    }
+
+
+# 按章节筛选的地点图层：整张地图只有这一个图层，地点圆点的大小、颜色和弹出信息
+# 由浏览器端按所选章节范围（起止滑块，或"逐回播放"）从要素属性中即时汇总
+class ChapterFilterLayer(Layer):
+    _template = Template("""
+        {% macro header(this, kwargs) %}
+            <style>
+                .chapter-filter {background: white; padding: 8px 10px; border-radius: 5px;
+                                 box-shadow: 0 1px 5px rgba(0,0,0,0.4); font-size: 12px; width: 220px;}
+                .chapter-filter input[type=range] {width: 100%;}
+                .chapter-filter .chapter-title {color: #666; margin-top: 4px;}
+            </style>
+        {% endmacro %}
+
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup();
+            (function() {
+                var group = {{ this.get_name() }};
+                var data = {{ this.data|tojson }};
+                var chapters = data.chapters;
+                var markers = data.features.map(function(feature) {
+                    var c = feature.geometry.coordinates;
+                    var marker = L.circleMarker([c[1], c[0]], {weight: 2, fillOpacity: 0.6});
+                    marker.feature = feature;
+                    return marker;
+                });
+
+                function rangeCount(feature, lo, hi) {
+                    var total = 0, present = 0;
+                    feature.properties.c.forEach(function(item) {
+                        if (item[0] >= lo && item[0] <= hi) { total += item[1]; present += 1; }
+                    });
+                    return [total, present];
+                }
+
+                function color(count, maxCount) {
+                    if (count >= maxCount * 0.7) return 'red';
+                    if (count >= maxCount * 0.4) return 'orange';
+                    if (count >= maxCount * 0.1) return 'green';
+                    return 'blue';
+                }
+
+                function update(lo, hi) {
+                    var counts = markers.map(function(marker) { return rangeCount(marker.feature, lo, hi); });
+                    var maxCount = Math.max.apply(null, counts.map(function(c) { return c[0]; }).concat([1]));
+                    group.clearLayers();
+                    markers.forEach(function(marker, i) {
+                        var total = counts[i][0], present = counts[i][1];
+                        if (!total) return;
+                        var p = marker.feature.properties;
+                        var fill = color(total, maxCount);
+                        marker.setStyle({color: fill, fillColor: fill});
+                        marker.setRadius({{ this.min_radius }} + Math.sqrt(total / maxCount) * {{ this.max_radius - this.min_radius }});
+                        marker.bindTooltip(p.name + ' (出现' + total + '次)');
+                        marker.bindPopup('<h4>' + p.name + '</h4>' +
+                            '<p><b>现代名称：</b>' + p.modern_name + '</p>' +
+                            '<p><b>历史名称：</b>' + p.historical_names.join(', ') + '</p>' +
+                            '<p><b>第' + lo + '-' + hi + '回出现次数：</b>' + total + '</p>' +
+                            '<p><b>出现在章节数：</b>' + present + '</p>', {maxWidth: 300});
+                        group.addLayer(marker);
+                    });
+                }
+
+                var control = L.control({position: 'topright'});
+                control.onAdd = function() {
+                    var div = L.DomUtil.create('div', 'chapter-filter');
+                    var last = chapters.length - 1;
+                    div.innerHTML = '<b>' + {{ this.layer_name|tojson }} + '</b>' +
+                        '<div>第<span class="lo"></span>回 - 第<span class="hi"></span>回</div>' +
+                        '<input class="start" type="range" min="0" max="' + last + '" value="0">' +
+                        '<input class="end" type="range" min="0" max="' + last + '" value="' + last + '">' +
+                        '<button class="play">逐回播放</button>' +
+                        '<div class="chapter-title"></div>';
+                    var start = div.querySelector('.start'), end = div.querySelector('.end');
+                    var timer = null;
+
+                    function refresh(changed) {
+                        // 起点不能超过终点
+                        if (+start.value > +end.value) {
+                            if (changed === start) { end.value = start.value; } else { start.value = end.value; }
+                        }
+                        var lo = chapters[+start.value], hi = chapters[+end.value];
+                        div.querySelector('.lo').textContent = lo;
+                        div.querySelector('.hi').textContent = hi;
+                        div.querySelector('.chapter-title').textContent =
+                            lo === hi ? (data.titles[+start.value] || '') : '';
+                        update(lo, hi);
+                    }
+                    start.addEventListener('input', function() { refresh(start); });
+                    end.addEventListener('input', function() { refresh(end); });
+
+                    // 逐回播放：每次只显示一回，依次前进
+                    div.querySelector('.play').addEventListener('click', function() {
+                        if (timer) { clearInterval(timer); timer = null; return; }
+                        var i = 0;
+                        timer = setInterval(function() {
+                            start.value = end.value = i;
+                            refresh(start);
+                            i += 1;
+                            if (i > last) { clearInterval(timer); timer = null; }
+                        }, {{ this.interval }});
+                    });
+
+                    L.DomEvent.disableClickPropagation(div);
+                    refresh(start);
+                    return div;
+                };
+                if (chapters.length) { control.addTo({{ this._parent.get_name() }}); }
+            })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, data, name='章节分布', min_radius=4, max_radius=18, interval=800, overlay=True,
+                 control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'ChapterFilterLayer'
+        self.data = data
+        self.min_radius = min_radius
+        self.max_radius = max_radius
+        self.interval = interval
+
+
+# 预聚合的地点标记图层：data 由 map_aggregation.place_cluster_levels 生成，
+# 浏览器端只按当前缩放级别取出对应的聚类绘制，要素数与屏幕上的格子数相当，而与地点总数无关
+class ZoomClusterLayer(Layer):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup();
+            (function() {
+                var group = {{ this.get_name() }};
+                var map = {{ this._parent.get_name() }};
+                var data = {{ this.data|tojson }};
+                var zooms = Object.keys(data.levels).map(Number);
+                var minZoom = Math.min.apply(null, zooms), maxZoom = Math.max.apply(null, zooms);
+
+                function color(weight, maxWeight) {
+                    if (weight >= maxWeight * 0.7) return 'red';
+                    if (weight >= maxWeight * 0.4) return 'orange';
+                    if (weight >= maxWeight * 0.1) return 'green';
+                    return 'blue';
+                }
+
+                function draw() {
+                    if (!map.hasLayer(group) || !zooms.length) return;
+                    var zoom = Math.max(minZoom, Math.min(maxZoom, Math.round(map.getZoom())));
+                    var rows = data.levels[zoom];
+                    var maxWeight = Math.max.apply(null, rows.map(function(row) { return row[2]; }).concat([1]));
+                    group.clearLayers();
+                    rows.forEach(function(row) {
+                        var fill = color(row[2], maxWeight);
+                        var name = data.names[row[4]];
+                        var label = row[3] > 1 ? name + ' 等' + row[3] + '处' : name;
+                        var popup = '<h4>' + label + '</h4>';
+                        if (row[3] > 1) {
+                            popup += row[5].map(function(i) {
+                                return data.names[i] + '：' + data.weights[i] + '次';
+                            }).join('<br>') + (row[3] > row[5].length ? '<br>……' : '');
+                        } else {
+                            popup += '<p><b>现代名称：</b>' + data.modern_names[row[4]] + '</p>';
+                        }
+                        popup += '<p><b>总出现次数：</b>' + row[2] + '</p>';
+                        L.circleMarker([row[0], row[1]], {
+                            radius: {{ this.min_radius }} + Math.sqrt(row[2] / maxWeight) * {{ this.max_radius - this.min_radius }},
+                            color: fill, fillColor: fill, fill: true, fillOpacity: 0.6
+                        }).bindTooltip(label + ' (出现' + row[2] + '次)').bindPopup(popup, {maxWidth: 300}).addTo(group);
+                        {% if this.labels %}
+                        L.marker([row[0], row[1]], {icon: L.divIcon({
+                            className: '', iconSize: [150, 20], iconAnchor: [-10, 24],
+                            html: '<div style="font-size: 11pt; font-weight: bold; color: ' + fill + '">' + label + '</div>'
+                        }), interactive: false}).addTo(group);
+                        {% endif %}
+                    });
+                }
+                map.on('zoomend', draw);
+                group.on('add', draw);
+            })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, data, name='地点标记', labels=True, min_radius=5, max_radius=20, overlay=True,
+                 control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'ZoomClusterLayer'
+        self.data = data
+        self.labels = labels
+        self.min_radius = min_radius
+        self.max_radius = max_radius
+
+
+# 预聚合的六边形热力图层：data 由 map_aggregation.place_hex_levels 生成，
+# 浏览器端按当前缩放级别取出六边形中心，在像素平面上展开成六边形绘制
+class HexBinLayer(Layer):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup();
+            (function() {
+                var group = {{ this.get_name() }};
+                var map = {{ this._parent.get_name() }};
+                var data = {{ this.data|tojson }};
+                var zooms = Object.keys(data.levels).map(Number);
+                var minZoom = Math.min.apply(null, zooms), maxZoom = Math.max.apply(null, zooms);
+
+                function color(t) {
+                    if (t >= 0.8) return 'red';
+                    if (t >= 0.65) return 'yellow';
+                    if (t >= 0.4) return 'lime';
+                    return 'blue';
+                }
+
+                function draw() {
+                    if (!map.hasLayer(group) || !zooms.length) return;
+                    var zoom = Math.max(minZoom, Math.min(maxZoom, Math.round(map.getZoom())));
+                    var rows = data.levels[zoom];
+                    var maxWeight = Math.max.apply(null, rows.map(function(row) { return row[2]; }).concat([1]));
+                    group.clearLayers();
+                    rows.forEach(function(row) {
+                        var center = map.project([row[0], row[1]], zoom);
+                        var corners = [];
+                        for (var k = 0; k < 6; k++) {
+                            var angle = Math.PI / 180 * (60 * k - 30);
+                            corners.push(map.unproject([center.x + data.radius * Math.cos(angle),
+                                                        center.y + data.radius * Math.sin(angle)], zoom));
+                        }
+                        var t = Math.sqrt(row[2] / maxWeight);
+                        L.polygon(corners, {stroke: false, fillColor: color(t), fillOpacity: 0.25 + 0.45 * t})
+                            .bindTooltip(row[3] + '处地点，共出现' + row[2] + '次').addTo(group);
+                    });
+                }
+                map.on('zoomend', draw);
+                group.on('add', draw);
+            })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, data, name='热力图', overlay=True, control=True, show=True):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'HexBinLayer'
+        self.data = data
+
+
+# 叙事行程图层：data 由 journeys.Journeys.layer_data 生成，
+# 每章一条按地点首次提及顺序连成的折线，颜色随章节变化，起点画小圆点，提示中列出路线和里程
+class TrajectoryLayer(Layer):
+    _template = Template("""
+        {% macro script(this, kwargs) %}
+            var {{ this.get_name() }} = L.layerGroup();
+            (function() {
+                var group = {{ this.get_name() }};
+                var data = {{ this.data|tojson }};
+                data.routes.forEach(function(route, i) {
+                    var color = 'hsl(' + Math.round(360 * i / Math.max(data.routes.length, 1)) + ', 70%, 45%)';
+                    var points = route.stops.map(function(k) { return data.points[k]; });
+                    var names = route.stops.map(function(k) { return data.places[k]; });
+                    var label = '第' + route.chapter + '回' + (route.title ? ' ' + route.title : '') + '：' +
+                        names.join(' → ') + '（共 ' + route.km + ' 公里）';
+                    L.polyline(points, {color: color, weight: {{ this.weight }}, opacity: 0.7})
+                        .bindTooltip(label, {sticky: true}).addTo(group);
+                    L.circleMarker(points[0], {radius: 4, color: color, fillColor: color, fillOpacity: 1})
+                        .bindTooltip('第' + route.chapter + '回起点：' + names[0]).addTo(group);
+                });
+            })();
+        {% endmacro %}
+        """)
+
+    def __init__(self, data, name='叙事行程', weight=3, overlay=True, control=True, show=False):
+        super().__init__(name=name, overlay=overlay, control=control, show=show)
+        self._name = 'TrajectoryLayer'
+        self.data = data
+        self.weight = weight
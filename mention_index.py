@@ -0,0 +1,140 @@
+import json
+import os
+
+import numpy as np
+
+# 地名提及索引的默认保存位置
+MENTION_INDEX_PATH = 'mention_index.npz'
+
+
+# 地名提及位置索引
+# 每次提及一行，列式存储为定长整数数组：章节号、章内字符偏移、变体id；行按 (章节号, 偏移) 排序
+# 另存一份按地名排序的行号排列和每个地名的起止指针（CSR），按地名或按章节的范围查询都只需二分查找
+class MentionIndex:
+    def __init__(self, variants=(), variant_place=(), places=(), chapter=None, offset=None,
+                 variant=None, signature=None, indexed_chapters=()):
+        self.signature = signature
+        # 已建立索引的章节（包括没有任何地名提及的章节）
+        self.indexed_chapters = set(int(number) for number in indexed_chapters)
+        self._assign(variants, variant_place, places, chapter, offset, variant)
+
+    def _assign(self, variants, variant_place, places, chapter, offset, variant):
+        self.variants = list(variants)              # 变体id -> 变体
+        self.variant_place = np.asarray(variant_place, dtype=np.int32)  # 变体id -> 地名id
+        self.places = list(places)                  # 地名id -> 标准地名
+        self.chapter = np.asarray(chapter if chapter is not None else [], dtype=np.int32)
+        self.offset = np.asarray(offset if offset is not None else [], dtype=np.int32)
+        self.variant = np.asarray(variant if variant is not None else [], dtype=np.int32)
+
+        self.variant_ids = {name: vid for vid, name in enumerate(self.variants)}
+        self.place_ids = {name: pid for pid, name in enumerate(self.places)}
+        self._build_place_order()
+
+    def __len__(self):
+        return len(self.chapter)
+
+    def _build_place_order(self):
+        place = self.variant_place[self.variant] if len(self.variant) else np.zeros(0, dtype=np.int32)
+        # 稳定排序保证同一地名内仍按 (章节号, 偏移) 排列
+        self.place_order = np.argsort(place, kind='stable').astype(np.int32)
+        self.place_ptr = np.searchsorted(place[self.place_order], np.arange(len(self.places) + 1)).astype(np.int64)
+
+    @classmethod
+    def load(cls, path=MENTION_INDEX_PATH, signature=None):
+        """读取索引；文件不存在或签名不一致时返回空索引"""
+        if not os.path.exists(path):
+            return cls(signature=signature)
+        with np.load(path, allow_pickle=False) as data:
+            saved_signature = json.loads(str(data['signature']))
+            if signature is not None and saved_signature != signature:
+                return cls(signature=signature)
+            return cls(variants=data['variants'].tolist(),
+                       variant_place=data['variant_place'],
+                       places=data['places'].tolist(),
+                       chapter=data['chapter'],
+                       offset=data['offset'],
+                       variant=data['variant'],
+                       signature=saved_signature,
+                       indexed_chapters=data['indexed_chapters'])
+
+    def save(self, path=MENTION_INDEX_PATH):
+        # 写入临时文件后替换，避免中断时留下损坏的索引
+        tmp_path = path + '.tmp.npz'
+        np.savez(tmp_path,
+                 signature=np.array(json.dumps(self.signature, ensure_ascii=False)),
+                 variants=np.array(self.variants, dtype=str),
+                 variant_place=self.variant_place,
+                 places=np.array(self.places, dtype=str),
+                 chapter=self.chapter,
+                 offset=self.offset,
+                 variant=self.variant,
+                 indexed_chapters=np.array(sorted(self.indexed_chapters), dtype=np.int32))
+        os.replace(tmp_path, path)
+
+    def chapter_numbers(self):
+        return set(self.indexed_chapters)
+
+    def add_chapters(self, chapter_mentions, canonical):
+        """写入若干章节的提及 {章节号: [(偏移, 变体), ...]}，同一章节已有的行会被替换
+        canonical: 变体 -> 标准地名"""
+        variants = list(self.variants)
+        variant_place = self.variant_place.tolist()
+        places = list(self.places)
+        variant_ids = dict(self.variant_ids)
+        place_ids = dict(self.place_ids)
+
+        new_chapter, new_offset, new_variant = [], [], []
+        for chapter_number, mentions in chapter_mentions.items():
+            for offset, name in mentions:
+                vid = variant_ids.get(name)
+                if vid is None:
+                    place = canonical(name)
+                    pid = place_ids.get(place)
+                    if pid is None:
+                        pid = place_ids[place] = len(places)
+                        places.append(place)
+                    vid = variant_ids[name] = len(variants)
+                    variants.append(name)
+                    variant_place.append(pid)
+                new_chapter.append(chapter_number)
+                new_offset.append(offset)
+                new_variant.append(vid)
+
+        # 新行排序后按章节号插入已有的行（两者章节互不重叠，已有的行本身有序），不必对全部行重新排序
+        new_chapter = np.asarray(new_chapter, dtype=np.int32)
+        new_offset = np.asarray(new_offset, dtype=np.int32)
+        new_variant = np.asarray(new_variant, dtype=np.int32)
+        order = np.lexsort((new_offset, new_chapter))
+        keep = ~np.isin(self.chapter, list(chapter_mentions))
+        at = np.searchsorted(self.chapter[keep], new_chapter[order], side='left')
+        chapter = np.insert(self.chapter[keep], at, new_chapter[order])
+        offset = np.insert(self.offset[keep], at, new_offset[order])
+        variant = np.insert(self.variant[keep], at, new_variant[order])
+
+        self._assign(variants, variant_place, places, chapter, offset, variant)
+        self.indexed_chapters.update(chapter_mentions)
+
+    def _rows(self, rows):
+        return self.chapter[rows], self.offset[rows], self.variant[rows]
+
+    def by_chapter(self, start, end=None):
+        """返回 [start, end] 章节内的全部提及 (章节号, 偏移, 变体id)，按位置排序"""
+        end = start if end is None else end
+        lo = np.searchsorted(self.chapter, start, side='left')
+        hi = np.searchsorted(self.chapter, end, side='right')
+        return self._rows(slice(lo, hi))
+
+    def by_place(self, place, start=None, end=None):
+        """返回某地名（可限定章节范围）的全部提及 (章节号, 偏移, 变体id)，按位置排序"""
+        pid = self.place_ids.get(place)
+        if pid is None:
+            return self._rows(slice(0, 0))
+        rows = self.place_order[self.place_ptr[pid]:self.place_ptr[pid + 1]]
+        chapters = self.chapter[rows]
+        lo = 0 if start is None else np.searchsorted(chapters, start, side='left')
+        hi = len(rows) if end is None else np.searchsorted(chapters, end, side='right')
+        return self._rows(rows[lo:hi])
+
+    def place_of(self, variant_ids):
+        """变体id数组 -> 地名id数组"""
+        return self.variant_place[variant_ids]
@@ -0,0 +1,282 @@
+import argparse
+import hashlib
+import os
+import posixpath
+import re
+import sqlite3
+import threading
+import urllib.parse
+import urllib.request
+from email.utils import formatdate
+from functools import lru_cache
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 离线地图资源目录：vendor/ 下按 "域名/路径" 镜像 CDN 上的 Leaflet 等前端资源，basemap.mbtiles 为底图瓦片
+MAP_ASSETS_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'map_assets')
+VENDOR_DIR = os.path.join(MAP_ASSETS_DIR, 'vendor')
+MBTILES_PATH = os.path.join(MAP_ASSETS_DIR, 'basemap.mbtiles')
+
+# 本地瓦片服务的默认地址
+TILE_SERVER_HOST = '127.0.0.1'
+TILE_SERVER_PORT = 8765
+
+# 瓦片和前端资源由浏览器直接请求：在共享服务器上运行时，用 RULIN_MAP_SERVER_HOST 指定绑定地址（如 0.0.0.0），
+# 用 RULIN_MAP_SERVER_URL 指定浏览器访问服务的地址（如 http://analysis-server:8765 或反向代理地址）
+SERVER_HOST_ENV = 'RULIN_MAP_SERVER_HOST'
+SERVER_URL_ENV = 'RULIN_MAP_SERVER_URL'
+
+# 设置环境变量 RULIN_MAP_OFFLINE=1 时，地图脚本和应用改用本地资源和本地瓦片
+OFFLINE_ENV = 'RULIN_MAP_OFFLINE'
+
+# 在线底图（非离线模式下使用）
+ONLINE_TILES = 'https://{s}.basemaps.cartocdn.com/light_all/{z}/{x}/{y}{r}.png'
+TILE_ATTRIBUTION = '&copy; OpenStreetMap contributors'
+
+# 缓存有效期：前端资源的URL带版本号，可长期缓存；瓦片默认缓存一天
+ASSET_MAX_AGE = 365 * 24 * 3600
+TILE_MAX_AGE = 24 * 3600
+
+# 服务进程内缓存的瓦片数
+TILE_CACHE_SIZE = 4096
+
+# 应用中手写的 Leaflet 页面使用的资源
+LEAFLET_JS = 'https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js'
+LEAFLET_CSS = 'https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css'
+
+# HTML 中引用的外部脚本和样式表，以及CSS中引用的图片、字体
+ASSET_URL = re.compile(r'(?:src|href)\s*=\s*["\'](https?://[^"\'?#]+\.(?:js|css))(?:[?#][^"\']*)?["\']')
+CSS_URL = re.compile(r'url\(\s*["\']?([^"\')]+)["\']?\s*\)')
+
+TILE_FORMATS = {'png': 'image/png', 'jpg': 'image/jpeg', 'jpeg': 'image/jpeg', 'webp': 'image/webp'}
+ASSET_TYPES = {'.js': 'application/javascript', '.css': 'text/css', '.png': 'image/png', '.svg': 'image/svg+xml',
+               '.gif': 'image/gif', '.woff': 'font/woff', '.woff2': 'font/woff2', '.ttf': 'font/ttf',
+               '.eot': 'application/vnd.ms-fontobject'}
+
+
+def offline_enabled():
+    return os.environ.get(OFFLINE_ENV, '') not in ('', '0', 'false', 'False')
+
+
+def server_host():
+    return os.environ.get(SERVER_HOST_ENV) or TILE_SERVER_HOST
+
+
+def server_url(host=None, port=TILE_SERVER_PORT):
+    """浏览器访问瓦片服务的地址：设置了 RULIN_MAP_SERVER_URL 时使用该地址，否则为服务绑定的地址"""
+    public_url = os.environ.get(SERVER_URL_ENV)
+    if public_url:
+        return public_url.rstrip('/')
+    return f'http://{host or server_host()}:{port}'
+
+
+def tile_url(base_url=None):
+    """Leaflet 瓦片URL模板：离线模式下指向本地瓦片服务，否则为在线底图"""
+    if base_url is None and not offline_enabled():
+        return ONLINE_TILES
+    return f'{base_url or server_url()}/tiles/{{z}}/{{x}}/{{y}}'
+
+
+# CDN 资源URL在 vendor 目录中的镜像路径（域名/路径，去掉查询串）
+def vendor_path(url, vendor_dir=VENDOR_DIR):
+    parts = urllib.parse.urlsplit(url)
+    return os.path.join(vendor_dir, parts.netloc, *parts.path.lstrip('/').split('/'))
+
+
+# 把 HTML 中引用的 CDN 脚本和样式表替换为本地服务上的镜像；没有镜像的资源保持原样
+def localize_html(html, base_url=None, vendor_dir=VENDOR_DIR):
+    base_url = base_url or server_url()
+
+    def replace(match):
+        url = match.group(1)
+        if not os.path.isfile(vendor_path(url, vendor_dir)):
+            return match.group(0)
+        parts = urllib.parse.urlsplit(url)
+        return match.group(0).replace(url, f'{base_url}/vendor/{parts.netloc}{parts.path}')
+
+    return ASSET_URL.sub(replace, html)
+
+
+# 只读的 MBTiles 瓦片库（SQLite，tiles 表按 TMS 行号存储）
+# 每个线程一个只读连接；最近读取的瓦片连同其 ETag 缓存在进程内
+class MBTiles:
+    def __init__(self, path=MBTILES_PATH, cache_size=TILE_CACHE_SIZE):
+        self.path = path
+        self._local = threading.local()
+        self.metadata = dict(self._connection().execute('SELECT name, value FROM metadata').fetchall())
+        self.content_type = TILE_FORMATS.get(self.metadata.get('format', 'png'), 'image/png')
+        self.tile = lru_cache(maxsize=cache_size)(self._read_tile)
+
+    def _connection(self):
+        connection = getattr(self._local, 'connection', None)
+        if connection is None:
+            connection = sqlite3.connect(f'file:{self.path}?mode=ro', uri=True)
+            self._local.connection = connection
+        return connection
+
+    def _read_tile(self, z, x, y):
+        """返回 (瓦片数据, ETag)，不存在时返回 None；y 为 XYZ 行号"""
+        row = self._connection().execute(
+            'SELECT tile_data FROM tiles WHERE zoom_level = ? AND tile_column = ? AND tile_row = ?',
+            (z, x, (1 << z) - 1 - y)).fetchone()
+        if row is None:
+            return None
+        data = bytes(row[0])
+        return data, '"' + hashlib.sha1(data).hexdigest()[:16] + '"'
+
+
+# 本地瓦片与前端资源服务
+# /tiles/{z}/{x}/{y} 从 MBTiles 读取瓦片，/vendor/... 返回镜像的前端资源；
+# 响应带 Cache-Control、ETag 和 Last-Modified，浏览器重复请求时按 If-None-Match 返回 304
+class TileRequestHandler(BaseHTTPRequestHandler):
+    tiles = None
+    vendor_dir = VENDOR_DIR
+    tile_max_age = TILE_MAX_AGE
+    last_modified = formatdate(usegmt=True)
+
+    def do_GET(self):
+        path = urllib.parse.urlsplit(self.path).path
+        if path.startswith('/tiles/'):
+            self._send_tile(path)
+        elif path.startswith('/vendor/'):
+            self._send_asset(path[len('/vendor/'):])
+        else:
+            self.send_error(404)
+
+    def _send_tile(self, path):
+        match = re.fullmatch(r'/tiles/(\d+)/(\d+)/(\d+)(?:\.\w+)?', path)
+        tile = self.tiles.tile(*map(int, match.groups())) if match and self.tiles is not None else None
+        if tile is None:
+            # 瓦片库中没有的瓦片返回 204，浏览器显示空白而不报错
+            self.send_response(204)
+            self.send_header('Cache-Control', f'public, max-age={self.tile_max_age}')
+            self.send_header('Access-Control-Allow-Origin', '*')
+            self.end_headers()
+            return
+        data, etag = tile
+        self._send(data, self.tiles.content_type, etag, f'public, max-age={self.tile_max_age}',
+                   self.last_modified)
+
+    def _send_asset(self, relative):
+        # 只允许访问 vendor 目录之内的文件
+        root = os.path.realpath(self.vendor_dir)
+        path = os.path.realpath(os.path.join(root, *posixpath.normpath(relative).split('/')))
+        if not path.startswith(root + os.sep) or not os.path.isfile(path):
+            self.send_error(404)
+            return
+        stat = os.stat(path)
+        etag = f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"'
+        with open(path, 'rb') as f:
+            data = f.read()
+        content_type = ASSET_TYPES.get(os.path.splitext(path)[1].lower(), 'application/octet-stream')
+        self._send(data, content_type, etag, f'public, max-age={ASSET_MAX_AGE}, immutable',
+                   formatdate(stat.st_mtime, usegmt=True))
+
+    def _send(self, data, content_type, etag, cache_control, last_modified):
+        not_modified = etag in (self.headers.get('If-None-Match') or '')
+        self.send_response(304 if not_modified else 200)
+        self.send_header('ETag', etag)
+        self.send_header('Cache-Control', cache_control)
+        self.send_header('Last-Modified', last_modified)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        if not_modified:
+            self.end_headers()
+            return
+        self.send_header('Content-Type', content_type)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def make_tile_server(host=None, port=TILE_SERVER_PORT, mbtiles_path=MBTILES_PATH,
+                     vendor_dir=VENDOR_DIR, tile_max_age=TILE_MAX_AGE):
+    handler = type('Handler', (TileRequestHandler,), {
+        'tiles': MBTiles(mbtiles_path) if os.path.exists(mbtiles_path) else None,
+        'vendor_dir': vendor_dir,
+        'tile_max_age': tile_max_age
+    })
+    return ThreadingHTTPServer((host or server_host(), port), handler)
+
+
+# 在后台线程中启动本地瓦片服务，返回服务地址；端口已被占用时认为服务已由其他进程启动
+def start_tile_server(host=None, port=TILE_SERVER_PORT, mbtiles_path=MBTILES_PATH,
+                      vendor_dir=VENDOR_DIR):
+    try:
+        server = make_tile_server(host, port, mbtiles_path, vendor_dir)
+    except OSError:
+        return server_url(host, port)
+    threading.Thread(target=server.serve_forever, name='tile-server', daemon=True).start()
+    return server_url(*server.server_address[:2])
+
+
+# folium 地图和应用页面用到的全部 CDN 资源
+def default_asset_urls():
+    import folium
+    from folium.plugins import MiniMap
+
+    urls = [LEAFLET_JS, LEAFLET_CSS]
+    for element in (folium.Map, MiniMap):
+        urls += [url for _, url in element.default_js + element.default_css]
+    return list(dict.fromkeys(urls))
+
+
+# 在联网的机器上把 CDN 资源下载到 vendor 目录（CSS 中引用的图片和字体一并下载），之后整个目录可拷贝到内网使用
+def vendor_assets(urls, vendor_dir=VENDOR_DIR, timeout=30):
+    queue, seen, saved = list(urls), set(), []
+    while queue:
+        url = urllib.parse.urldefrag(queue.pop(0))[0]
+        if url in seen:
+            continue
+        seen.add(url)
+        path = vendor_path(url, vendor_dir)
+        if not os.path.exists(path):
+            with urllib.request.urlopen(url, timeout=timeout) as response:
+                data = response.read()
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(path, 'wb') as f:
+                f.write(data)
+            saved.append(path)
+        if path.endswith('.css'):
+            with open(path, 'r', encoding='utf-8', errors='ignore') as f:
+                css = f.read()
+            queue += [urllib.parse.urljoin(url, ref) for ref in CSS_URL.findall(css) if not ref.startswith('data:')]
+    return saved
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='离线地图：本地瓦片服务和前端资源镜像')
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    serve = subparsers.add_parser('serve', help='启动本地瓦片与资源服务')
+    serve.add_argument('--host', default=None, help=f'绑定地址，默认为环境变量 {SERVER_HOST_ENV} 或 {TILE_SERVER_HOST}')
+    serve.add_argument('--port', type=int, default=TILE_SERVER_PORT)
+    serve.add_argument('--mbtiles', default=MBTILES_PATH, help='MBTiles 底图文件')
+    serve.add_argument('--vendor-dir', default=VENDOR_DIR, help='前端资源镜像目录')
+
+    vendor = subparsers.add_parser('vendor', help='（联网时）下载地图页面用到的 CDN 资源')
+    vendor.add_argument('html', nargs='*', help='额外扫描其中CDN资源的HTML文件')
+    vendor.add_argument('--vendor-dir', default=VENDOR_DIR, help='前端资源镜像目录')
+    args = parser.parse_args(argv)
+
+    if args.command == 'serve':
+        server = make_tile_server(args.host, args.port, args.mbtiles, args.vendor_dir)
+        if server.RequestHandlerClass.tiles is None:
+            print(f"未找到底图文件：{args.mbtiles}，只提供前端资源")
+        print(f"本地瓦片服务：{server_url(args.host, args.port)}（Ctrl+C 结束）")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+    else:
+        urls = default_asset_urls()
+        for path in args.html:
+            with open(path, 'r', encoding='utf-8') as f:
+                urls += ASSET_URL.findall(f.read())
+        saved = vendor_assets(urls, args.vendor_dir)
+        print(f"已下载 {len(saved)} 个文件到 {args.vendor_dir}")
+
+
+if __name__ == '__main__':
+    main()
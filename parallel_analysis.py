@@ -0,0 +1,42 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from city_analysis import analyze_chapter, custom_words, tokenizer
+from profiling import profiler
+from segmentation_cache import SegmentationCache, dictionary_fingerprint
+
+# 工作进程内的分词缓存（每个进程初始化一次）
+_worker_cache = None
+
+
+# 工作进程启动时载入一次分词器（合并词典缓存已由主进程生成）
+# 主进程记录运行轨迹时，工作进程把事件追加到同一文件
+def _init_worker(cache_dir, trace_path=None):
+    global _worker_cache
+    if trace_path:
+        profiler.start(trace_path, process_name='worker', truncate=False)
+    tokenizer.load()
+    _worker_cache = SegmentationCache(cache_dir, dictionary_fingerprint(custom_words))
+
+
+def _analyze_in_worker(chapter):
+    with profiler.span('chapter', cat='chapter', chapter=chapter['chapter_number']):
+        tokens = _worker_cache.segment(chapter['content'], tokenizer)
+        return analyze_chapter(chapter, tokens)
+
+
+# 进程池并行分析章节
+# 结果按输入章节顺序逐个产出，主进程按同样顺序边接收边合并，因此输出与串行运行完全一致
+# 同时提交的章节最多 workers * 4 个，章节可以来自按需读取的生成器，内存不随全书长度增长
+def analyze_chapters_parallel(chapters, workers, cache_dir='.segmentation_cache'):
+    window = workers * 4
+    trace_path = profiler.path if profiler.enabled else None
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(cache_dir, trace_path)) as executor:
+        pending = deque()
+        for chapter in chapters:
+            pending.append(executor.submit(_analyze_in_worker, chapter))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
@@ -0,0 +1,63 @@
+import re
+from functools import lru_cache
+
+# 真正地名中可能包含"道"的词
+ROAD_WORDS = ('街道', '道路', '河道', '官道', '省道', '国道')
+
+# 方向词+地名模式
+DIRECTION_PREFIXES = ('到', '在', '往', '自')
+
+
+# 预编译的地名判断器，替代逐条匹配的 is_valid_city
+# 排除词使用 frozenset，非地名正则合并为一个，变体建立 变体->标准地名 的反向索引，判断结果缓存在有界LRU中
+class PlaceClassifier:
+    def __init__(self, normalization, exclude_words, non_place_patterns, suffixes, cache_size=65536):
+        self.exclusions = frozenset(exclude_words)
+        self.non_place_regex = re.compile('|'.join(f'(?:{pattern})' for pattern in non_place_patterns))
+        self.variant_index = {variant: city
+                              for city, variants in normalization.items()
+                              for variant in variants}
+        self.known_cities = frozenset(normalization)
+        self.suffix_regex = re.compile('|'.join(re.escape(suffix) for suffix in suffixes))
+        self.is_valid = lru_cache(maxsize=cache_size)(self._classify)
+
+    def canonical(self, word):
+        """返回变体对应的标准地名，未收录时返回 None"""
+        return self.variant_index.get(word)
+
+    def _classify(self, word):
+        # 检查是否在排除列表中
+        if word in self.exclusions:
+            return False
+
+        # 使用正则表达式检查非地名模式
+        if self.non_place_regex.match(word):
+            return False
+
+        # 检查是否在预定义城市变体中
+        if word in self.variant_index:
+            return True
+
+        # 检查是否包含地名后缀
+        if self.suffix_regex.search(word):
+            # 但排除包含"道"作为后缀且不是真正地名的词汇
+            if '道' in word and not any(s in word for s in ROAD_WORDS):
+                # 进一步检查是否为真正的地名
+                if not re.search(r'[縣府州鎮城鄉村街巷坊]', word):
+                    return False
+            return True
+
+        # 检查是否包含方向词+地名的模式
+        if len(word) > 2 and word.startswith(DIRECTION_PREFIXES):
+            # 截取方向词后的部分，检查是否包含地名特征
+            remaining = word[1:]
+            if any(suffix in remaining for suffix in ['縣', '府', '州', '鎮', '城']):
+                return True
+            # 或者剩余部分是已知城市
+            if remaining in self.known_cities:
+                return True
+
+        return False
+
+    def cache_info(self):
+        return self.is_valid.cache_info()
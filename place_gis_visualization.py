@@ -1,230 +1,99 @@
-import json
+import argparse
+import html
+import os
+from concurrent.futures import ProcessPoolExecutor
+
 import folium
-from folium.plugins import HeatMap, MarkerCluster
+from folium.plugins import MiniMap
+from jinja2.utils import htmlsafe_json_dumps
 import pandas as pd
-from folium.features import DivIcon
-
-# 1. 地理坐标映射 - 收集七个目标地点的经纬度坐标
-# 历史地名与现代地名的对应关系处理
-place_coordinates = {
-    '南京': {  # 历史地名：金陵、應天府、江寧府等
-        'lat': 32.0603,
-        'lng': 118.7969,
-        'modern_name': '南京市',
-        'historical_names': ['南京', '金陵', '應天府', '江寧府', '白下', '南都', '建康', '秣陵', '建業', '江寧']
-    },
-    '北京': {  # 历史地名：京師
-        'lat': 39.9042,
-        'lng': 116.4074,
-        'modern_name': '北京市',
-        'historical_names': ['北京', '京師', '北京城']
-    },
-    '揚州': {  # 历史地名：揚州、揚州府
-        'lat': 32.3930,
-        'lng': 119.4941,
-        'modern_name': '扬州市',
-        'historical_names': ['揚州', '揚州府']
-    },
-    '蘇州': {  # 历史地名：蘇州
-        'lat': 31.2989,
-        'lng': 120.5853,
-        'modern_name': '苏州市',
-        'historical_names': ['蘇州', '吳縣', '吳中']
-    },
-    '杭州': {  # 历史地名：武林、錢塘
-        'lat': 30.2741,
-        'lng': 120.1551,
-        'modern_name': '杭州市',
-        'historical_names': ['杭州', '武林', '錢塘']
-    },
-    '濟南': {  # 历史地名：濟南府
-        'lat': 36.6512,
-        'lng': 117.1201,
-        'modern_name': '济南市',
-        'historical_names': ['濟南', '濟南府']
-    },
-    '湖州': {  # 历史地名：湖郡
-        'lat': 30.8690,
-        'lng': 119.9107,
-        'modern_name': '湖州市',
-        'historical_names': ['湖州', '湖郡']
-    }
-}
 
-# 读取之前的分析结果
-print("读取地点频率分析结果...")
-with open('place_frequency_analysis.json', 'r', encoding='utf-8') as f:
-    analysis_data = json.load(f)
+from gazetteer import geocode_places, group_by_entry
+from journeys import load_journeys
+from map_aggregation import place_cluster_levels, place_hex_levels
+from map_layers import ChapterFilterLayer, HexBinLayer, TrajectoryLayer, ZoomClusterLayer, chapter_feature_collection
+from offline_map import TILE_ATTRIBUTION, localize_html, offline_enabled, server_url, tile_url
+from place_matrix import PlaceChapterMatrix, load_place_chapter_matrix
+
+# 默认统计的章节范围和输出文件
+DEFAULT_START, DEFAULT_END = 30, 50
+MAP_FILE = 'place_distribution_map.html'
+
+# 批量生成的静态站点目录
+SITE_DIR = 'place_maps'
+
+# 默认书名
+DEFAULT_BOOK = '儒林外史'
+
+# 统计信息面板最多列出的地点数
+STATS_PANEL_ROWS = 15
+
+# 随章节范围变化的地图内容；共享模板中以占位符代替，逐个范围填入
+PAYLOAD_KEYS = ('title_html', 'stats_html', 'hex', 'clusters', 'chapters', 'journeys')
+TEMPLATE_MARKER = '__RULIN_MAP_{}__'
 
-# 提取目标地点统计数据和地点-章节矩阵
-target_place_stats = analysis_data['target_place_stats']
-place_chapter_matrix = analysis_data['place_chapter_matrix']
-chapter_titles = {}
 
 # 读取CSV获取章节标题信息
-print("读取章节标题信息...")
-df_matrix = pd.read_csv('place_chapter_matrix.csv')
-for _, row in df_matrix.iterrows():
-    chapter_num = int(row['章节'].replace('第', '').replace('回', ''))
-    chapter_titles[chapter_num] = row['章节标题']
-
-# 2. 创建地图可视化
-print("创建GIS可视化地图...")
-
-# 计算中国东部地区的中心点作为地图初始位置（集中在长三角和华北地区）
-center_lat = sum(place['lat'] for place in place_coordinates.values()) / len(place_coordinates)
-center_lng = sum(place['lng'] for place in place_coordinates.values()) / len(place_coordinates)
-
-# 创建地图实例
-map_china = folium.Map(location=[center_lat, center_lng], zoom_start=6, 
-                      tiles='CartoDB positron', control_scale=True)
-
-# 添加标题
-map_title = "《儒林外史》第30-50章地点分布可视化"
-map_title_html = f"""
-                 <h3 align="center" style="font-size:20px"><b>{map_title}</b></h3>
-                 <p align="center">分析目标：南京、北京、揚州、蘇州、杭州、濟南、湖州</p>
+def load_chapter_titles(csv_path='place_chapter_matrix.csv'):
+    chapter_titles = {}
+    if os.path.exists(csv_path):
+        df_matrix = pd.read_csv(csv_path)
+        for _, row in df_matrix.iterrows():
+            chapter_num = int(row['章节'].replace('第', '').replace('回', ''))
+            chapter_titles[chapter_num] = row['章节标题']
+    return chapter_titles
+
+
+# 地理坐标映射 - 在本地历史地名库中批量查找全部地点的经纬度（结果持久缓存），
+# 同一地名库条目的不同写法合并为一个地点；返回 (合并后的矩阵, {地点: 坐标})
+def geocode_matrix(place_chapter_matrix):
+    geocoded_places = geocode_places(place_chapter_matrix.places)
+    place_groups = group_by_entry(geocoded_places)
+    place_coordinates = {name: geocoded_places[places[0]] for name, places in place_groups.items()}
+    return place_chapter_matrix.merge_places(place_groups), place_coordinates
+
+
+# 各地点的范围统计（由前缀和立方体直接得到）
+def place_range_stats(place_matrix, places, start, end):
+    range_stats = place_matrix.range_cube(places).stats(places, start, end)
+    target_place_stats = {}
+    for i, place in enumerate(places):
+        target_place_stats[place] = {
+            'total_count': int(range_stats['total_count'][i]),
+            'avg_density': float(range_stats['avg_per_chapter'][i]),
+            'presence_rate': float(range_stats['presence_rate'][i]),
+            'present_in_chapters': int(range_stats['present_chapters'][i])
+        }
+    return target_place_stats
+
+
+# 地图初始位置：全部地点坐标的中心
+def map_center(place_coordinates):
+    center_lat = sum(place['lat'] for place in place_coordinates.values()) / len(place_coordinates)
+    center_lng = sum(place['lng'] for place in place_coordinates.values()) / len(place_coordinates)
+    return [center_lat, center_lng]
+
+
+# 某一章节范围的地图内容（标题、统计面板和各图层的数据），全部可直接序列化
+# journeys 为缓存的各章节行程（journeys.load_journeys），没有时行程图层为空
+def map_payload(place_matrix, place_coordinates, start, end, chapter_titles=None, book=DEFAULT_BOOK,
+                journeys=None):
+    target_places = list(place_coordinates)
+    target_place_stats = place_range_stats(place_matrix, target_places, start, end)
+    ranked = sorted(target_places, key=lambda place: target_place_stats[place]['total_count'], reverse=True)
+    ranked = [place for place in ranked if target_place_stats[place]['total_count'] > 0]
+
+    # 标题
+    map_title = f"《{book}》第{start}-{end}章地点分布可视化"
+    title_html = f"""
+                 <h3 align="center" style="font-size:20px"><b>{html.escape(map_title)}</b></h3>
+                 <p align="center">分析目标：{html.escape('、'.join(ranked[:7]))}{' 等' if len(ranked) > 7 else ''}</p>
                  """
-map_china.get_root().html.add_child(folium.Element(map_title_html))
-
-# 3. 创建热力图层 - 根据总出现频率
-print("创建热力图层...")
-
-# 准备热力图数据
-heat_data = []
-for place, stats in target_place_stats.items():
-    if place in place_coordinates:
-        lat = place_coordinates[place]['lat']
-        lng = place_coordinates[place]['lng']
-        # 使用总出现次数作为权重
-        weight = stats['total_count']
-        # 为了热力图效果更好，将权重归一化到合理范围
-        normalized_weight = min(weight / 10, 1)
-        heat_data.append([lat, lng, normalized_weight])
-
-# 添加热力图层
-heat_layer = folium.FeatureGroup(name='总出现频率热力图', control=True)
-HeatMap(
-    heat_data,
-    min_opacity=0.3,
-    max_zoom=15,
-    radius=25,
-    blur=15,
-    gradient={0.4: 'blue', 0.65: 'lime', 0.8: 'yellow', 1: 'red'},
-    overlay=True
-).add_to(heat_layer)
-heat_layer.add_to(map_china)
-
-# 4. 创建地点标记图层 - 根据总出现频率
-print("创建地点标记图层...")
-
-# 获取所有地点的总出现次数，用于计算标记大小
-max_count = max(stats['total_count'] for stats in target_place_stats.values())
-min_count = min(stats['total_count'] for stats in target_place_stats.values())
-count_range = max_count - min_count if max_count > min_count else 1
-
-# 创建地点标记图层
-place_markers = folium.FeatureGroup(name='地点总出现频率标记', control=True)
-
-for place, stats in target_place_stats.items():
-    if place in place_coordinates:
-        coord = place_coordinates[place]
-        total_count = stats['total_count']
-        
-        # 根据出现次数计算标记大小（30-60像素范围）
-        marker_size = 30 + (total_count - min_count) / count_range * 30
-        
-        # 根据出现次数确定颜色
-        if total_count >= max_count * 0.7:
-            color = 'red'
-        elif total_count >= max_count * 0.4:
-            color = 'orange'
-        elif total_count >= max_count * 0.1:
-            color = 'green'
-        else:
-            color = 'blue'
-        
-        # 创建弹出信息
-        popup_content = f"""
-        <h4>{place}</h4>
-        <p><b>现代名称：</b>{coord['modern_name']}</p>
-        <p><b>历史名称：</b>{', '.join(coord['historical_names'])}</p>
-        <p><b>总出现次数：</b>{total_count}</p>
-        <p><b>每章平均密度：</b>{stats['avg_density']:.2f}</p>
-        <p><b>章节存在率：</b>{stats['presence_rate']:.2%}</p>
-        <p><b>出现在章节数：</b>{stats['present_in_chapters']}</p>
-        """
-        
-        # 添加圆形标记
-        folium.CircleMarker(
-            location=[coord['lat'], coord['lng']],
-            radius=marker_size / 10,  # 调整半径大小
-            color=color,
-            fill=True,
-            fill_color=color,
-            fill_opacity=0.6,
-            popup=folium.Popup(popup_content, max_width=300),
-            tooltip=f"{place} (出现{total_count}次)"
-        ).add_to(place_markers)
-        
-        # 添加地点名称标签
-        folium.map.Marker(
-            [coord['lat'] + 0.05, coord['lng']],
-            icon=DivIcon(
-                icon_size=(150, 36),
-                icon_anchor=(0, 0),
-                html=f'<div style="font-size: 12pt; font-weight: bold; color: {color}">{place}</div>',
-            )
-        ).add_to(place_markers)
-
-place_markers.add_to(map_china)
-
-# 5. 为每个章节创建单独的图层
-print("创建章节图层...")
-
-# 获取分析的章节范围
-chapter_range = range(30, 51)  # 30-50章
-
-# 创建章节标记集群
-for chapter_num in chapter_range:
-    chapter_layer = folium.FeatureGroup(name=f'第{chapter_num}回', control=True)
-    marker_cluster = MarkerCluster().add_to(chapter_layer)
-    
-    # 获取该章节的地点数据
-    chapter_has_data = False
-    for place in target_place_stats.keys():
-        if place in place_coordinates and chapter_num in place_chapter_matrix.get(place, {}):
-            count = place_chapter_matrix[place][chapter_num]
-            if count > 0:
-                chapter_has_data = True
-                coord = place_coordinates[place]
-                
-                # 创建弹出信息
-                popup_content = f"""
-                <h5>第{chapter_num}回 《{chapter_titles.get(chapter_num, '')}》</h5>
-                <p><b>地点：</b>{place}</p>
-                <p><b>出现次数：</b>{count}</p>
-                <p><b>现代位置：</b>{coord['modern_name']}</p>
-                """
-                
-                # 添加标记
-                folium.Marker(
-                    location=[coord['lat'], coord['lng']],
-                    popup=folium.Popup(popup_content, max_width=250),
-                    tooltip=f"{place}: {count}次",
-                    icon=folium.Icon(color='blue', icon='info-sign')
-                ).add_to(marker_cluster)
-    
-    # 如果章节有数据，则添加到地图
-    if chapter_has_data:
-        chapter_layer.add_to(map_china)
-
-# 6. 创建统计信息面板
-print("创建统计信息面板...")
-
-# 准备统计信息
-stats_info = """
-<div style="background-color: white; padding: 10px; border-radius: 5px; font-size: 12px;">
+
+    # 统计信息面板（按总出现次数排序）
+    stats_html = """
+<div style="position: fixed; bottom: 30px; left: 10px; z-index: 1000; max-height: 45%; overflow-y: auto;
+            background-color: white; padding: 10px; border-radius: 5px; font-size: 12px;">
     <h4>地点统计概览</h4>
     <table border="1" cellpadding="3" cellspacing="0" style="width: 100%;">
         <tr style="background-color: #f2f2f2;">
@@ -234,47 +103,263 @@ stats_info = """
             <th>存在率</th>
         </tr>
 """
-
-# 按总出现次数排序
-for place in sorted(target_place_stats.keys(), key=lambda x: target_place_stats[x]['total_count'], reverse=True):
-    stats = target_place_stats[place]
-    stats_info += f"""
+    for place in ranked[:STATS_PANEL_ROWS]:
+        stats = target_place_stats[place]
+        stats_html += f"""
         <tr>
-            <td>{place}</td>
+            <td>{html.escape(place)}</td>
             <td>{stats['total_count']}</td>
             <td>{stats['avg_density']:.2f}</td>
             <td>{stats['presence_rate']:.0%}</td>
         </tr>
     """
-
-stats_info += """
+    stats_html += """
     </table>
-    <p><i>数据来源：《儒林外史》第30-50章分析</i></p>
+"""
+    if journeys is not None:
+        journey_metrics = journeys.metrics(start, end)
+        stats_html += f"""
+    <p>叙事行程总里程：{journey_metrics['total_km'].sum():.0f} 公里（{int(journey_metrics['legs'].sum())} 段路程）</p>
+"""
+    stats_html += f"""
+    <p><i>数据来源：《{html.escape(book)}》第{start}-{end}章分析</i></p>
 </div>
 """
 
-# 添加统计信息面板
-folium.Element(stats_info).add_to(folium.plugins.FloatImage(map_china, bottom=5, left=5))
+    place_weights = {place: stats['total_count'] for place, stats in target_place_stats.items()}
+    return {
+        'title_html': title_html,
+        'stats_html': stats_html,
+        'hex': place_hex_levels(target_places, place_coordinates, place_weights),
+        'clusters': place_cluster_levels(target_places, place_coordinates, place_weights),
+        'chapters': chapter_feature_collection(place_matrix, place_coordinates, target_places,
+                                               start, end, chapter_titles),
+        'journeys': journeys.layer_data(start, end, chapter_titles) if journeys is not None
+        else {'places': [], 'points': [], 'routes': []},
+        'ranked': [(place, target_place_stats[place]['total_count']) for place in ranked]
+    }
+
+
+# 由地图内容组装 folium 地图
+def build_map(payload, center, offline=None):
+    offline = offline_enabled() if offline is None else offline
+
+    # 离线模式（环境变量 RULIN_MAP_OFFLINE=1）下底图改用本地瓦片服务
+    # 瓦片地址显式指向本地服务：offline=True 时不依赖是否设置了环境变量
+    offline_tiles = tile_url(server_url()) if offline else None
+    if offline:
+        base_tiles = folium.TileLayer(tiles=offline_tiles, attr=TILE_ATTRIBUTION, name='本地底图')
+    else:
+        base_tiles = 'CartoDB positron'
+    map_china = folium.Map(location=center, zoom_start=6, tiles=base_tiles, control_scale=True)
+
+    map_china.get_root().html.add_child(folium.Element(payload['title_html']))
+
+    # 热力图层：在Python端按缩放级别把地点汇总到六边形格子中，地图只加载汇总后的六边形
+    HexBinLayer(payload['hex'], name='总出现频率热力图').add_to(map_china)
+
+    # 地点标记图层：按缩放级别预先聚类，缩小时相邻地点合并为一个标记，放大后逐级展开为单个地点
+    ZoomClusterLayer(payload['clusters'], name='地点总出现频率标记').add_to(map_china)
+
+    # 章节图层：全部章节共用一个 GeoJSON 图层，在浏览器端按所选章节范围汇总显示
+    ChapterFilterLayer(payload['chapters'], name='章节范围筛选').add_to(map_china)
+
+    # 叙事行程图层：每章按地点首次提及的顺序连成路线（默认隐藏，可在图层控制中打开）
+    TrajectoryLayer(payload['journeys'], name='各章叙事行程').add_to(map_china)
+
+    # 统计信息面板
+    map_china.get_root().html.add_child(folium.Element(payload['stats_html']))
+
+    # 图层控制和鹰眼图
+    folium.LayerControl().add_to(map_china)
+    mini_tiles = folium.TileLayer(tiles=offline_tiles, attr=TILE_ATTRIBUTION) if offline else None
+    MiniMap(tile_layer=mini_tiles).add_to(map_china)
+    return map_china
+
+
+# 函数接口：由地点-章节矩阵、地点坐标和章节范围生成地图（folium.Map）
+def render_place_map(place_matrix, place_coordinates, start, end, chapter_titles=None, book=DEFAULT_BOOK,
+                     offline=None, journeys=None):
+    payload = map_payload(place_matrix, place_coordinates, start, end, chapter_titles, book, journeys)
+    return build_map(payload, map_center(place_coordinates), offline)
+
+
+# 地图页面HTML；离线模式下页面引用的CDN脚本和样式表换成本地服务上的镜像
+def map_html(folium_map, offline=None):
+    page = folium_map.get_root().render()
+    return localize_html(page) if (offline_enabled() if offline is None else offline) else page
+
+
+def save_map(folium_map, path, offline=None):
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(map_html(folium_map, offline))
+
+
+# 共享的页面模板：地图结构只渲染一次，随章节范围变化的内容以占位符代替
+def map_template(center, offline=None):
+    placeholders = {key: TEMPLATE_MARKER.format(key) for key in PAYLOAD_KEYS}
+    return map_html(build_map(placeholders, center, offline), offline)
+
+
+# 在模板中填入某一范围的地图内容：HTML片段原样替换，图层数据替换为与 folium 相同转义的JSON
+def fill_template(template, payload):
+    page = template
+    for key in PAYLOAD_KEYS:
+        marker = TEMPLATE_MARKER.format(key)
+        if key.endswith('_html'):
+            page = page.replace(marker, payload[key])
+        else:
+            page = page.replace(str(htmlsafe_json_dumps(marker)),
+                                str(htmlsafe_json_dumps(payload[key], sort_keys=True)))
+    return page
+
+
+# 滑动章节窗口：按章节序号每 step 章取一个长度为 window 章的范围，最后一个窗口总是到达末章
+def sliding_windows(chapters, window, step):
+    chapters = sorted(chapters)
+    if not chapters:
+        return []
+    last_start = max(len(chapters) - window, 0)
+    starts = list(range(0, last_start + 1, step))
+    if starts[-1] != last_start:
+        starts.append(last_start)
+    return [(chapters[i], chapters[min(i + window, len(chapters)) - 1]) for i in starts]
+
+
+# 工作进程内的共享模板和各书数据（每个进程初始化一次）
+_batch = {}
+
+
+def _init_batch_worker(template, books):
+    _batch['template'] = template
+    _batch['books'] = books
+
+
+def _render_window(book, start, end, path):
+    place_matrix, place_coordinates, chapter_titles, journeys = _batch['books'][book]
+    payload = map_payload(place_matrix, place_coordinates, start, end, chapter_titles, book, journeys)
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(fill_template(_batch['template'], payload))
+    return {'book': book, 'start': start, 'end': end, 'path': path,
+            'total_count': sum(count for _, count in payload['ranked']), 'top_places': payload['ranked'][:3]}
+
+
+def write_index(site_dir, results):
+    rows = []
+    for book in dict.fromkeys(result['book'] for result in results):
+        rows.append(f'<h2>《{html.escape(book)}》</h2>\n<table border="1" cellpadding="4" cellspacing="0">'
+                    '<tr><th>章节范围</th><th>地点提及总数</th><th>主要地点</th></tr>')
+        for result in results:
+            if result['book'] != book:
+                continue
+            link = os.path.relpath(result['path'], site_dir).replace(os.sep, '/')
+            top = '、'.join(f'{place}（{count}）' for place, count in result['top_places'])
+            rows.append(f'<tr><td><a href="{html.escape(link)}">第{result["start"]}-{result["end"]}章</a></td>'
+                        f'<td>{result["total_count"]}</td><td>{html.escape(top)}</td></tr>')
+        rows.append('</table>')
+    page = ('<!DOCTYPE html>\n<html><head><meta charset="utf-8"><title>地点分布地图索引</title></head><body>\n'
+            '<h1>地点分布地图</h1>\n' + '\n'.join(rows) + '\n</body></html>\n')
+    index_path = os.path.join(site_dir, 'index.html')
+    with open(index_path, 'w', encoding='utf-8') as f:
+        f.write(page)
+    return index_path
+
+
+# 批量生成：每本书的每个滑动章节窗口一张地图，写入静态站点目录并生成索引页
+# books 为 {书名: (地点-章节矩阵, 地点坐标, 章节标题, 行程)}；页面模板只渲染一次，由进程池中的工作进程逐个窗口填入
+def render_site(books, window=10, step=5, site_dir=SITE_DIR, workers=1, offline=None):
+    all_coordinates = {}
+    for _, place_coordinates, _, _ in books.values():
+        all_coordinates.update(place_coordinates)
+    template = map_template(map_center(all_coordinates), offline)
+
+    tasks = []
+    for book_id, (book, (place_matrix, _, _, _)) in enumerate(books.items()):
+        book_dir = os.path.join(site_dir, f'book{book_id + 1}')
+        os.makedirs(book_dir, exist_ok=True)
+        for start, end in sliding_windows(place_matrix.chapters.tolist(), window, step):
+            tasks.append((book, start, end, os.path.join(book_dir, f'chapters_{start:03d}_{end:03d}.html')))
+
+    if workers > 1:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_batch_worker,
+                                 initargs=(template, books)) as executor:
+            results = list(executor.map(_render_window, *zip(*tasks), chunksize=4)) if tasks else []
+    else:
+        _init_batch_worker(template, books)
+        results = [_render_window(*task) for task in tasks]
+    return write_index(site_dir, results), results
+
+
+# 读取一本书的地点-章节矩阵并完成地理编码，返回 (矩阵, 地点坐标, 章节标题, 行程)
+# 行程只对流水线生成的本书结果可用（读取当前目录的提及索引和行程缓存），其他书为 None
+def load_book(matrix_path=None):
+    if matrix_path is None:
+        # 优先加载流水线生成的矩阵文件，章节号为整数
+        chapter_titles = load_chapter_titles()
+        place_chapter_matrix = load_place_chapter_matrix(chapter_titles=chapter_titles)
+    else:
+        chapter_titles = {}
+        place_chapter_matrix = PlaceChapterMatrix.load(matrix_path)
+    for chapter_num, title in zip(place_chapter_matrix.chapters.tolist(), place_chapter_matrix.chapter_titles):
+        if title:
+            chapter_titles[chapter_num] = title
+
+    place_matrix, place_coordinates = geocode_matrix(place_chapter_matrix)
+    print(f"共 {len(place_chapter_matrix.places)} 个地点，其中 {len(place_coordinates)} 个在地名库中找到坐标")
+    if not place_coordinates:
+        raise SystemExit("地名库中没有找到任何地点的坐标，无法生成地图")
+    journeys = load_journeys() if matrix_path is None else None
+    return place_matrix, place_coordinates, chapter_titles, journeys
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='地点分布GIS可视化地图')
+    parser.add_argument('--start', type=int, default=DEFAULT_START, help='开始章节')
+    parser.add_argument('--end', type=int, default=DEFAULT_END, help='结束章节')
+    parser.add_argument('--output', default=MAP_FILE, help='地图HTML输出文件')
+    parser.add_argument('--batch', action='store_true', help='按滑动章节窗口批量生成地图站点')
+    parser.add_argument('--book', action='append', default=[], metavar='书名=矩阵文件',
+                        help='批量模式下的书及其地点-章节矩阵（.npz），可重复；默认为本书')
+    parser.add_argument('--window', type=int, default=10, help='批量模式的窗口章节数')
+    parser.add_argument('--step', type=int, default=5, help='批量模式的窗口步长')
+    parser.add_argument('--workers', type=int, default=os.cpu_count() or 1, help='批量模式的进程数')
+    parser.add_argument('--site-dir', default=SITE_DIR, help='批量模式的站点输出目录')
+    args = parser.parse_args(argv)
+    offline = offline_enabled()
+
+    if args.batch:
+        books = {}
+        for spec in args.book or [f'{DEFAULT_BOOK}=']:
+            name, _, path = spec.partition('=')
+            print(f"加载《{name}》...")
+            books[name] = load_book(path or None)
+        index_path, results = render_site(books, args.window, args.step, args.site_dir, args.workers, offline)
+        print(f"\n已生成 {len(results)} 张地图，索引页：{index_path}")
+        if offline:
+            print(f"离线模式：请先运行 python offline_map.py serve 启动本地瓦片服务（{server_url()}）")
+        return
 
-# 7. 添加图层控制和保存地图
-print("添加图层控制...")
+    print("读取章节标题信息并地理编码...")
+    place_matrix, place_coordinates, chapter_titles, journeys = load_book()
 
-# 添加图层控制
-folium.LayerControl().add_to(map_china)
+    print("创建GIS可视化地图...")
+    map_china = render_place_map(place_matrix, place_coordinates, args.start, args.end, chapter_titles,
+                                 offline=offline, journeys=journeys)
+    save_map(map_china, args.output, offline)
 
-# 添加比例尺
-folium.plugins.MiniMap().add_to(map_china)
+    print(f"\nGIS可视化地图已生成！")
+    print(f"文件保存为：{args.output}")
+    if offline:
+        print(f"离线模式：请先运行 python offline_map.py serve 启动本地瓦片服务（{server_url()}）")
+    print("\n地图包含以下功能：")
+    print("1. 总出现频率热力图 - 展示地点的整体重要性")
+    print("2. 地点总出现频率标记 - 使用不同颜色和大小显示出现频率")
+    print("3. 章节过滤器 - 可选择查看特定章节的地点分布")
+    print("4. 统计信息面板 - 展示各地点的详细统计数据")
+    print("5. 各章叙事行程 - 按地点首次提及顺序连成的路线及里程")
+    print("6. 交互式功能 - 点击标记可查看详细信息，支持缩放和平移")
+    print("\n您可以在浏览器中打开此HTML文件查看交互式地图。")
 
-# 保存地图为HTML文件
-map_file = 'place_distribution_map.html'
-map_china.save(map_file)
 
-print(f"\nGIS可视化地图已生成！")
-print(f"文件保存为：{map_file}")
-print("\n地图包含以下功能：")
-print("1. 总出现频率热力图 - 展示地点的整体重要性")
-print("2. 地点总出现频率标记 - 使用不同颜色和大小显示出现频率")
-print("3. 章节过滤器 - 可选择查看特定章节的地点分布")
-print("4. 统计信息面板 - 展示各地点的详细统计数据")
-print("5. 交互式功能 - 点击标记可查看详细信息，支持缩放和平移")
-print("\n您可以在浏览器中打开此HTML文件查看交互式地图。")
\ No newline at end of file
+if __name__ == '__main__':
+    main()
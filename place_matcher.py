@@ -0,0 +1,95 @@
+from collections import Counter, deque
+
+
+# 基于Aho-Corasick自动机的多模式地名匹配器
+# 由变体表一次性构建，单次扫描文本即可找出所有变体（最左最长匹配，不重叠计数）
+class PlaceMatcher:
+    def __init__(self, normalization):
+        """normalization: {标准地名: [变体, ...]}，与 city_normalization 结构一致"""
+        self.variants = []      # 变体id -> 变体
+        self.canonical = []     # 变体id -> 标准地名
+        self.variant_ids = {}   # 变体 -> 变体id
+
+        for city, variants in normalization.items():
+            for variant in variants:
+                if not variant or variant in self.variant_ids:
+                    continue
+                self.variant_ids[variant] = len(self.variants)
+                self.variants.append(variant)
+                self.canonical.append(city)
+
+        self._build()
+
+    def _build(self):
+        # 构建字典树
+        self._goto = [{}]
+        self._output = [[]]
+        for vid, variant in enumerate(self.variants):
+            node = 0
+            for ch in variant:
+                nxt = self._goto[node].get(ch)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[node][ch] = nxt
+                    self._goto.append({})
+                    self._output.append([])
+                node = nxt
+            self._output[node].append(vid)
+
+        # 广度优先构建失败指针，并合并后缀节点的输出
+        self._fail = [0] * len(self._goto)
+        queue = deque(self._goto[0].values())
+        while queue:
+            node = queue.popleft()
+            for ch, nxt in self._goto[node].items():
+                queue.append(nxt)
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                target = self._goto[fail].get(ch, 0)
+                self._fail[nxt] = target if target != nxt else 0
+                self._output[nxt] = self._output[nxt] + self._output[self._fail[nxt]]
+
+    def finditer(self, text):
+        """单次扫描文本，按出现顺序产出 (起始偏移, 变体id)，采用最左最长且不重叠的语义"""
+        goto, fail, output = self._goto, self._fail, self._output
+        variants = self.variants
+
+        # 记录每个起点上最长的匹配
+        longest = {}
+        node = 0
+        for end, ch in enumerate(text, 1):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+            for vid in output[node]:
+                start = end - len(variants[vid])
+                best = longest.get(start)
+                if best is None or len(variants[vid]) > len(variants[best]):
+                    longest[start] = vid
+
+        # 从左到右选取不重叠的匹配
+        position = 0
+        for start in sorted(longest):
+            if start < position:
+                continue
+            vid = longest[start]
+            yield start, vid
+            position = start + len(variants[vid])
+
+    def scan(self, text):
+        """返回 (变体计数, 变体偏移列表)"""
+        counts = Counter()
+        offsets = {}
+        for start, vid in self.finditer(text):
+            variant = self.variants[vid]
+            counts[variant] += 1
+            offsets.setdefault(variant, []).append(start)
+        return counts, offsets
+
+    def count_cities(self, text):
+        """按标准地名汇总的出现次数"""
+        city_counts = Counter()
+        for _, vid in self.finditer(text):
+            city_counts[self.canonical[vid]] += 1
+        return city_counts
@@ -0,0 +1,274 @@
+import json
+import os
+
+import numpy as np
+
+from columnar_store import COLUMNAR_DIR, has_table, load_tables
+
+# 地点-章节稀疏矩阵的默认保存位置
+PLACE_MATRIX_PATH = 'place_chapter_matrix.npz'
+
+
+# 地点×章节出现次数稀疏矩阵（CSR：每个地点一行，只保存非零的章节）
+# 地点和章节各有一个id字典；按行/按列切片和求和都是数组运算
+class PlaceChapterMatrix:
+    def __init__(self, places, chapters, indptr, indices, data, chapter_titles=None, chapter_tokens=None):
+        self.places = list(places)                                  # 行id -> 地点
+        self.chapters = np.asarray(chapters, dtype=np.int32)        # 列id -> 章节号（升序）
+        self.indptr = np.asarray(indptr, dtype=np.int64)
+        self.indices = np.asarray(indices, dtype=np.int32)          # 非零元素的列id
+        self.data = np.asarray(data, dtype=np.int32)                # 非零元素的出现次数
+        self.chapter_titles = list(chapter_titles) if chapter_titles is not None else [''] * len(self.chapters)
+        # 每章的分词数（未知时为0）
+        self.chapter_tokens = np.asarray(chapter_tokens if chapter_tokens is not None
+                                         else np.zeros(len(self.chapters)), dtype=np.int64)
+        self.place_ids = {place: pid for pid, place in enumerate(self.places)}
+
+    @property
+    def shape(self):
+        return len(self.places), len(self.chapters)
+
+    @classmethod
+    def from_records(cls, records):
+        """由逐章分析记录（ChapterResultIndex.rows()）构建，地点按首次出现顺序编号"""
+        records = sorted(records, key=lambda record: record['chapter_number'])
+        place_ids = {}
+        rows, cols, vals = [], [], []
+        for col, record in enumerate(records):
+            for place, count in record['cities'].items():
+                if count <= 0:
+                    continue
+                rows.append(place_ids.setdefault(place, len(place_ids)))
+                cols.append(col)
+                vals.append(count)
+        return cls._from_coo(list(place_ids),
+                             [record['chapter_number'] for record in records],
+                             rows, cols, vals,
+                             [record['chapter_title'] for record in records],
+                             [record.get('total_words', 0) for record in records])
+
+    @classmethod
+    def from_dict(cls, matrix, chapter_titles=None, chapter_tokens=None):
+        """由 {地点: {章节号: 次数}} 构建（章节号可以是字符串）
+        chapter_titles: {章节号: 标题}，chapter_tokens: {章节号: 分词数}"""
+        chapter_titles = {int(chapter): title for chapter, title in (chapter_titles or {}).items()}
+        chapter_tokens = {int(chapter): tokens for chapter, tokens in (chapter_tokens or {}).items()}
+        chapters = set(chapter_titles)
+        for counts in matrix.values():
+            chapters.update(int(chapter) for chapter in counts)
+        chapters = sorted(chapters)
+        chapter_ids = {chapter: col for col, chapter in enumerate(chapters)}
+
+        rows, cols, vals = [], [], []
+        for pid, counts in enumerate(matrix.values()):
+            for chapter, count in counts.items():
+                if count > 0:
+                    rows.append(pid)
+                    cols.append(chapter_ids[int(chapter)])
+                    vals.append(count)
+        return cls._from_coo(list(matrix), chapters, rows, cols, vals,
+                             [chapter_titles.get(chapter, '') for chapter in chapters],
+                             [chapter_tokens.get(chapter, 0) for chapter in chapters])
+
+    @classmethod
+    def _from_coo(cls, places, chapters, rows, cols, vals, chapter_titles, chapter_tokens=None):
+        rows = np.asarray(rows, dtype=np.int64)
+        cols = np.asarray(cols, dtype=np.int32)
+        vals = np.asarray(vals, dtype=np.int32)
+        order = np.lexsort((cols, rows))
+        indptr = np.zeros(len(places) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(rows, minlength=len(places)), out=indptr[1:])
+        return cls(places, chapters, indptr, cols[order], vals[order], chapter_titles, chapter_tokens)
+
+    @classmethod
+    def load(cls, path=PLACE_MATRIX_PATH):
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data['places'].tolist(), data['chapters'], data['indptr'],
+                       data['indices'], data['data'], data['chapter_titles'].tolist(),
+                       data['chapter_tokens'] if 'chapter_tokens' in data.files else None)
+
+    @classmethod
+    def from_columns(cls, columns):
+        """由列式结果中的矩阵表构建（各数组可以是内存映射）"""
+        return cls(columns['places'].tolist(), columns['chapters'], columns['indptr'],
+                   columns['indices'], columns['data'], columns['chapter_titles'].tolist(),
+                   columns.get('chapter_tokens'))
+
+    def to_columns(self):
+        """转换为列式结果中的矩阵表"""
+        return {
+            'places': np.array(self.places, dtype=str),
+            'chapters': self.chapters,
+            'indptr': self.indptr,
+            'indices': self.indices,
+            'data': self.data,
+            'chapter_titles': np.array(self.chapter_titles, dtype=str),
+            'chapter_tokens': self.chapter_tokens
+        }
+
+    def save(self, path=PLACE_MATRIX_PATH):
+        np.savez(path, **self.to_columns())
+
+    def chapter_span(self, start=None, end=None):
+        """章节号范围 [start, end] 对应的列id区间 [lo, hi)"""
+        lo = 0 if start is None else int(np.searchsorted(self.chapters, start, side='left'))
+        hi = len(self.chapters) if end is None else int(np.searchsorted(self.chapters, end, side='right'))
+        return lo, max(lo, hi)
+
+    def chapters_in(self, start=None, end=None):
+        lo, hi = self.chapter_span(start, end)
+        return self.chapters[lo:hi]
+
+    def place_index(self, places):
+        """地点 -> 行id数组，不存在的地点为 -1"""
+        return np.array([self.place_ids.get(place, -1) for place in places], dtype=np.int64)
+
+    def dense(self, places=None, start=None, end=None):
+        """返回 [地点, 章节] 稠密子矩阵，列为 chapters_in(start, end)"""
+        ids = np.arange(len(self.places)) if places is None else self.place_index(places)
+        lo, hi = self.chapter_span(start, end)
+        out = np.zeros((len(ids), hi - lo), dtype=np.int32)
+
+        # 把所选行的非零元素一次性展开，再按列范围筛选写入
+        valid = ids >= 0
+        row_starts = np.where(valid, self.indptr[np.maximum(ids, 0)], 0)
+        lengths = np.where(valid, self.indptr[np.maximum(ids, 0) + 1] - row_starts, 0)
+        rows = np.repeat(np.arange(len(ids)), lengths)
+        positions = np.arange(lengths.sum()) + np.repeat(row_starts - np.cumsum(lengths) + lengths, lengths)
+        cols = self.indices[positions]
+        mask = (cols >= lo) & (cols < hi)
+        out[rows[mask], cols[mask] - lo] = self.data[positions[mask]]
+        return out
+
+    def row_sums(self, places=None, start=None, end=None):
+        """各地点在章节范围内的出现总次数"""
+        return self.dense(places, start, end).sum(axis=1)
+
+    def column_sums(self, places=None, start=None, end=None):
+        """章节范围内每章所选地点的出现总次数"""
+        return self.dense(places, start, end).sum(axis=0)
+
+    def get(self, place, chapter):
+        pid = self.place_ids.get(place)
+        col = int(np.searchsorted(self.chapters, chapter))
+        if pid is None or col >= len(self.chapters) or self.chapters[col] != chapter:
+            return 0
+        row_cols = self.indices[self.indptr[pid]:self.indptr[pid + 1]]
+        pos = int(np.searchsorted(row_cols, col))
+        if pos < len(row_cols) and row_cols[pos] == col:
+            return int(self.data[self.indptr[pid] + pos])
+        return 0
+
+    def merge_places(self, groups):
+        """按 {新地点: [原地点, ...]} 合并行（如把"湖州"和"湖州府"合并为一个地点），未列出的地点丢弃"""
+        mapping = np.full(len(self.places), -1, dtype=np.int64)
+        for gid, places in enumerate(groups.values()):
+            for place in places:
+                if place in self.place_ids:
+                    mapping[self.place_ids[place]] = gid
+
+        rows = mapping[np.repeat(np.arange(len(self.places)), np.diff(self.indptr))]
+        keep = rows >= 0
+        keys, inverse = np.unique(rows[keep] * len(self.chapters) + self.indices[keep], return_inverse=True)
+        vals = np.bincount(inverse, weights=self.data[keep], minlength=len(keys))
+        return self._from_coo(list(groups), self.chapters, keys // len(self.chapters), keys % len(self.chapters),
+                              vals, self.chapter_titles, self.chapter_tokens)
+
+    def range_cube(self, places=None):
+        """所选地点（默认全部）的前缀和立方体，用于任意章节范围的统计"""
+        places = self.places if places is None else list(places)
+        return PlaceRangeCube(places, self.chapters, self.dense(places), self.chapter_tokens)
+
+    def to_dict(self, places=None):
+        """转换为 {地点: {章节号: 次数}}，只包含非零项"""
+        result = {}
+        for place in (self.places if places is None else places):
+            pid = self.place_ids.get(place)
+            result[place] = {}
+            if pid is None:
+                continue
+            for col, count in zip(self.indices[self.indptr[pid]:self.indptr[pid + 1]],
+                                  self.data[self.indptr[pid]:self.indptr[pid + 1]]):
+                result[place][int(self.chapters[col])] = int(count)
+        return result
+
+
+# 地点×章节前缀和立方体
+# 对出现次数、是否出现（章节数）和每章分词数沿章节方向做累加，任意 [start, end] 范围的统计
+# 只需两次二分查找和每个地点一次相减，耗时与范围长度无关
+class PlaceRangeCube:
+    def __init__(self, places, chapters, counts, chapter_tokens=None):
+        """counts: [地点, 章节] 出现次数"""
+        self.places = list(places)
+        self.place_ids = {place: pid for pid, place in enumerate(self.places)}
+        self.chapters = np.asarray(chapters, dtype=np.int32)
+        counts = np.asarray(counts, dtype=np.int64).reshape(len(self.places), len(self.chapters))
+        chapter_tokens = np.zeros(len(self.chapters)) if chapter_tokens is None else chapter_tokens
+
+        self.count_cum = np.zeros((len(self.places), len(self.chapters) + 1), dtype=np.int64)
+        np.cumsum(counts, axis=1, out=self.count_cum[:, 1:])
+        self.presence_cum = np.zeros((len(self.places), len(self.chapters) + 1), dtype=np.int32)
+        np.cumsum(counts > 0, axis=1, out=self.presence_cum[:, 1:])
+        self.token_cum = np.zeros(len(self.chapters) + 1, dtype=np.int64)
+        np.cumsum(np.asarray(chapter_tokens, dtype=np.int64), out=self.token_cum[1:])
+
+    def chapter_span(self, start=None, end=None):
+        """章节号范围 [start, end] 对应的列id区间 [lo, hi)"""
+        lo = 0 if start is None else int(np.searchsorted(self.chapters, start, side='left'))
+        hi = len(self.chapters) if end is None else int(np.searchsorted(self.chapters, end, side='right'))
+        return lo, max(lo, hi)
+
+    def _range(self, cum, places, start, end):
+        lo, hi = self.chapter_span(start, end)
+        if places is None:
+            return cum[:, hi] - cum[:, lo]
+        ids = np.array([self.place_ids.get(place, -1) for place in places], dtype=np.int64)
+        values = cum[np.maximum(ids, 0), hi] - cum[np.maximum(ids, 0), lo]
+        return np.where(ids >= 0, values, 0)
+
+    def totals(self, places=None, start=None, end=None):
+        """各地点在范围内的出现总次数"""
+        return self._range(self.count_cum, places, start, end)
+
+    def present_chapters(self, places=None, start=None, end=None):
+        """各地点在范围内出现的章节数"""
+        return self._range(self.presence_cum, places, start, end)
+
+    def chapter_count(self, start=None, end=None):
+        lo, hi = self.chapter_span(start, end)
+        return hi - lo
+
+    def tokens(self, start=None, end=None):
+        """范围内的分词总数"""
+        lo, hi = self.chapter_span(start, end)
+        return int(self.token_cum[hi] - self.token_cum[lo])
+
+    def stats(self, places=None, start=None, end=None):
+        """范围统计：总次数、出现章节数、每章平均次数、章节存在率、每词密度（各为按地点排列的数组）"""
+        totals = self.totals(places, start, end)
+        present = self.present_chapters(places, start, end)
+        chapters = self.chapter_count(start, end)
+        tokens = self.tokens(start, end)
+        return {
+            'total_count': totals,
+            'present_chapters': present,
+            'avg_per_chapter': totals / chapters if chapters else np.zeros(len(totals)),
+            'presence_rate': present / chapters if chapters else np.zeros(len(totals)),
+            'density': totals / tokens if tokens else np.zeros(len(totals)),
+            'chapters': chapters,
+            'tokens': tokens
+        }
+
+
+# 读取地点-章节矩阵：优先内存映射列式结果，其次稀疏矩阵文件，否则由旧版JSON结果转换
+def load_place_chapter_matrix(matrix_path=PLACE_MATRIX_PATH, json_path='place_frequency_analysis.json',
+                              chapter_titles=None, columnar_dir=COLUMNAR_DIR):
+    if has_table(columnar_dir, 'matrix'):
+        return PlaceChapterMatrix.from_columns(load_tables(columnar_dir, ['matrix'])['matrix'])
+    if os.path.exists(matrix_path):
+        return PlaceChapterMatrix.load(matrix_path)
+    with open(json_path, 'r', encoding='utf-8') as f:
+        analysis_data = json.load(f)
+    chapter_tokens = {chapter['chapter_number']: chapter.get('total_words', 0)
+                      for chapter in analysis_data.get('chapter_analysis', [])}
+    return PlaceChapterMatrix.from_dict(analysis_data['place_chapter_matrix'], chapter_titles, chapter_tokens)
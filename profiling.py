@@ -0,0 +1,160 @@
+import argparse
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+
+# 默认的运行轨迹文件
+TRACE_PATH = 'trace.jsonl'
+
+
+# 未启用时 span() 返回的空上下文
+class _NullSpan:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        return False
+
+    def __setitem__(self, key, value):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+# 一个计时区间：记录墙钟时间和CPU时间，退出时写成一条 Chrome trace 的完整事件（ph='X'）
+# 进入后可以像字典一样补充参数，如 span['items'] = 处理的条目数
+class _Span:
+    __slots__ = ('profiler', 'name', 'cat', 'args', 'ts', 'wall', 'cpu')
+
+    def __init__(self, profiler, name, cat, args):
+        self.profiler = profiler
+        self.name = name
+        self.cat = cat
+        self.args = args
+
+    def __enter__(self):
+        self.ts = time.time_ns() // 1000
+        self.wall = time.perf_counter_ns()
+        self.cpu = time.thread_time_ns()
+        return self
+
+    def __exit__(self, *exc_info):
+        dur = (time.perf_counter_ns() - self.wall) / 1000
+        self.args['cpu_us'] = (time.thread_time_ns() - self.cpu) / 1000
+        self.profiler.emit({'name': self.name, 'cat': self.cat, 'ph': 'X', 'ts': self.ts, 'dur': dur,
+                            'pid': os.getpid(), 'tid': threading.get_ident(), 'args': self.args})
+        return False
+
+    def __setitem__(self, key, value):
+        self.args[key] = value
+
+
+# 流水线各阶段的计时钩子
+# 启用后每个事件写成一行JSON（Chrome trace 事件格式），多个进程可追加写入同一文件；
+# 未启用时 span() 直接返回共享的空上下文，不计时也不写文件
+class Profiler:
+    def __init__(self):
+        self.enabled = False
+        self.path = None
+        self._file = None
+
+    def start(self, path=TRACE_PATH, process_name='main', truncate=True):
+        """开始记录；工作进程使用 truncate=False 追加到主进程的文件"""
+        self.stop()
+        if truncate:
+            open(path, 'w').close()
+        # 所有进程都以追加模式、行缓冲打开：每个事件一次写入文件末尾，互不覆盖或交错
+        self._file = open(path, 'a', encoding='utf-8', buffering=1)
+        self.path = path
+        self.enabled = True
+        self.emit({'name': 'process_name', 'ph': 'M', 'pid': os.getpid(), 'tid': threading.get_ident(),
+                   'args': {'name': process_name}})
+
+    def stop(self):
+        if self._file is not None:
+            self._file.close()
+        self._file = None
+        self.enabled = False
+
+    def emit(self, event):
+        if self._file is not None:
+            self._file.write(json.dumps(event, ensure_ascii=False) + '\n')
+
+    def span(self, name, cat='stage', **args):
+        if not self.enabled:
+            return _NULL_SPAN
+        return _Span(self, name, cat, args)
+
+    def counter(self, name, **values):
+        """计数器事件（ph='C'），如缓存命中数"""
+        if self.enabled:
+            self.emit({'name': name, 'ph': 'C', 'ts': time.time_ns() // 1000, 'pid': os.getpid(),
+                       'tid': threading.get_ident(), 'args': values})
+
+
+# 全局计时钩子（各模块共享同一对象，由命令行参数启用）
+profiler = Profiler()
+
+
+def read_trace(path=TRACE_PATH):
+    with open(path, 'r', encoding='utf-8') as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+# 按阶段汇总：调用次数、墙钟/CPU总耗时、处理条目数；计数器取每个进程的最后取值再求和
+def summarize_trace(events):
+    stages = defaultdict(lambda: {'calls': 0, 'wall_ms': 0.0, 'cpu_ms': 0.0, 'items': 0})
+    last_counters = {}
+    for event in events:
+        if event['ph'] == 'X':
+            stage = stages[event['name']]
+            stage['calls'] += 1
+            stage['wall_ms'] += event['dur'] / 1000
+            stage['cpu_ms'] += event['args'].get('cpu_us', 0) / 1000
+            stage['items'] += event['args'].get('items', 0)
+        elif event['ph'] == 'C':
+            last_counters[(event['name'], event['pid'])] = event['args']
+
+    counters = defaultdict(lambda: defaultdict(int))
+    for (name, _), values in last_counters.items():
+        for key, value in values.items():
+            counters[name][key] += value
+    return {'stages': dict(stages), 'counters': {name: dict(values) for name, values in counters.items()}}
+
+
+def print_trace_summary(summary):
+    print(f"{'阶段':20s}{'次数':>8s}{'墙钟(ms)':>12s}{'CPU(ms)':>12s}{'条目数':>10s}")
+    for name, stage in sorted(summary['stages'].items(), key=lambda x: x[1]['wall_ms'], reverse=True):
+        print(f"{name:20s}{stage['calls']:8d}{stage['wall_ms']:12.1f}{stage['cpu_ms']:12.1f}{stage['items']:10d}")
+    for name, values in summary['counters'].items():
+        hits, misses = values.get('hits', 0), values.get('misses', 0)
+        rate = f"，命中率 {hits / (hits + misses):.1%}" if hits + misses else ''
+        print(f"{name}: 命中 {hits} 次，未命中 {misses} 次{rate}")
+
+
+# 转换为 Chrome trace 的JSON对象格式（可在 chrome://tracing 或 Perfetto 中打开）
+def to_chrome_trace(events, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({'traceEvents': events, 'displayTimeUnit': 'ms'}, f, ensure_ascii=False)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='汇总运行轨迹文件')
+    parser.add_argument('trace', nargs='?', default=TRACE_PATH, help='JSON lines 轨迹文件')
+    parser.add_argument('--chrome', help='另存为 Chrome trace JSON 文件')
+    args = parser.parse_args(argv)
+
+    events = read_trace(args.trace)
+    print_trace_summary(summarize_trace(events))
+    if args.chrome:
+        to_chrome_trace(events, args.chrome)
+        print(f"已保存 Chrome trace：{args.chrome}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,189 @@
+import json
+import os
+from functools import lru_cache
+
+import numpy as np
+
+# 区域多边形文件（GeoJSON，随代码提供）
+REGIONS_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'regions.geojson')
+
+# 不在任何多边形内（或没有坐标）的地点归入的区域
+DEFAULT_REGION = '其他地区'
+
+# STR 树每个节点最多包含的子节点数
+NODE_CAPACITY = 8
+
+# 点在多边形内判断时每批最多计算的 点×边 数，控制内存峰值
+MAX_CELLS_PER_BATCH = 4_000_000
+
+
+# GeoJSON 的 Polygon / MultiPolygon 几何拆成多边形列表，每个多边形是若干个 (k, 2) 的环（外环和洞）
+def _polygon_rings(geometry):
+    if geometry['type'] == 'Polygon':
+        parts = [geometry['coordinates']]
+    elif geometry['type'] == 'MultiPolygon':
+        parts = geometry['coordinates']
+    else:
+        return []
+    return [[np.asarray(ring, dtype=np.float64)[:, :2] for ring in part] for part in parts]
+
+
+# 按 Sort-Tile-Recursive 方法把外包框打包成一层父节点：
+# 先按中心 x 排序切成若干竖条，每条内再按中心 y 排序，每 NODE_CAPACITY 个连续的框合为一个节点
+def _str_pack(bounds, capacity=NODE_CAPACITY):
+    count = len(bounds)
+    node_count = -(-count // capacity)
+    slice_size = capacity * int(np.ceil(np.sqrt(node_count)))
+
+    center_x = (bounds[:, 0] + bounds[:, 2]) / 2
+    center_y = (bounds[:, 1] + bounds[:, 3]) / 2
+    order = np.argsort(center_x, kind='stable')
+    for lo in range(0, count, slice_size):
+        part = order[lo:lo + slice_size]
+        order[lo:lo + slice_size] = part[np.argsort(center_y[part], kind='stable')]
+
+    starts = np.arange(0, count, capacity)
+    ends = np.minimum(starts + capacity, count)
+    ordered = bounds[order]
+    parent_bounds = np.column_stack([np.minimum.reduceat(ordered[:, 0], starts),
+                                     np.minimum.reduceat(ordered[:, 1], starts),
+                                     np.maximum.reduceat(ordered[:, 2], starts),
+                                     np.maximum.reduceat(ordered[:, 3], starts)])
+    return order, parent_bounds, starts, ends
+
+
+# 区域多边形的空间索引
+# 多边形的外包框用 STR 方法自底向上打包成 R 树；查询时全部点同时逐层下降，
+# 每层只保留落在节点外包框内的 (点, 节点) 对，最后对候选的 (点, 多边形) 对做射线法判断
+class RegionIndex:
+    def __init__(self, region_names, polygon_regions, polygons, capacity=NODE_CAPACITY):
+        self.region_names = list(region_names)                              # 区域id -> 区域名（文件中的顺序）
+        self.polygon_regions = np.asarray(polygon_regions, dtype=np.int64)  # 多边形id -> 区域id
+
+        # 每个多边形的全部边（各环首尾相接），按多边形连续存放
+        edges, edge_counts, bounds = [], [], []
+        for rings in polygons:
+            polygon_edges = [np.hstack([ring, np.roll(ring, -1, axis=0)]) for ring in rings]
+            polygon_edges = np.vstack(polygon_edges)
+            edges.append(polygon_edges)
+            edge_counts.append(len(polygon_edges))
+            bounds.append([polygon_edges[:, 0].min(), polygon_edges[:, 1].min(),
+                           polygon_edges[:, 0].max(), polygon_edges[:, 1].max()])
+        self.edges = np.vstack(edges) if edges else np.zeros((0, 4))
+        self.edge_ptr = np.concatenate([[0], np.cumsum(edge_counts)]).astype(np.int64)
+        self.bounds = np.asarray(bounds, dtype=np.float64).reshape(-1, 4)
+
+        # 自底向上建树：levels[0] 为根，每层记录节点外包框及其子节点在下一层的范围
+        self.levels = []
+        self.leaf_order = np.arange(len(self.bounds))
+        level_bounds = self.bounds
+        while len(level_bounds):
+            order, parent_bounds, starts, ends = _str_pack(level_bounds, capacity)
+            if self.levels:
+                # 下一层节点按本次打包顺序重排
+                child = self.levels[0]
+                self.levels[0] = {'bounds': child['bounds'][order],
+                                  'start': child['start'][order], 'end': child['end'][order]}
+            else:
+                self.leaf_order = order
+            self.levels.insert(0, {'bounds': parent_bounds, 'start': starts, 'end': ends})
+            if len(parent_bounds) == 1:
+                break
+            level_bounds = parent_bounds
+
+    @classmethod
+    def load(cls, path=REGIONS_PATH, name_property='name'):
+        with open(path, 'r', encoding='utf-8') as f:
+            collection = json.load(f)
+
+        region_ids = {}
+        polygon_regions, polygons = [], []
+        for feature in collection['features']:
+            name = feature['properties'][name_property]
+            rid = region_ids.setdefault(name, len(region_ids))
+            for rings in _polygon_rings(feature['geometry']):
+                polygon_regions.append(rid)
+                polygons.append(rings)
+        return cls(list(region_ids), polygon_regions, polygons)
+
+    def candidates(self, points):
+        """R 树批量查询：返回外包框包含该点的 (点序号, 多边形id) 对"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        if not self.levels:
+            return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+        point_ids = np.arange(len(points))
+        nodes = np.zeros(len(points), dtype=np.int64)
+        for level in self.levels:
+            box = level['bounds'][nodes]
+            inside = ((points[point_ids, 0] >= box[:, 0]) & (points[point_ids, 0] <= box[:, 2]) &
+                      (points[point_ids, 1] >= box[:, 1]) & (points[point_ids, 1] <= box[:, 3]))
+            point_ids, nodes = point_ids[inside], nodes[inside]
+
+            # 展开到子节点
+            counts = level['end'][nodes] - level['start'][nodes]
+            offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+            point_ids = np.repeat(point_ids, counts)
+            nodes = np.repeat(level['start'][nodes], counts) + offsets
+
+        # 叶子层：按多边形自身的外包框过滤
+        polygon_ids = self.leaf_order[nodes]
+        box = self.bounds[polygon_ids]
+        inside = ((points[point_ids, 0] >= box[:, 0]) & (points[point_ids, 0] <= box[:, 2]) &
+                  (points[point_ids, 1] >= box[:, 1]) & (points[point_ids, 1] <= box[:, 3]))
+        return point_ids[inside], polygon_ids[inside]
+
+    def _contains(self, polygon_id, points):
+        """射线法（奇偶规则，洞自动排除）：向右的水平射线与多边形各边的交点数为奇数即在内"""
+        edges = self.edges[self.edge_ptr[polygon_id]:self.edge_ptr[polygon_id + 1]]
+        x1, y1, x2, y2 = edges.T
+        result = np.zeros(len(points), dtype=bool)
+        step = max(1, MAX_CELLS_PER_BATCH // max(len(edges), 1))
+        for lo in range(0, len(points), step):
+            x = points[lo:lo + step, 0:1]
+            y = points[lo:lo + step, 1:2]
+            straddle = (y1 > y) != (y2 > y)
+            with np.errstate(divide='ignore', invalid='ignore'):
+                cross_x = x1 + (y - y1) * (x2 - x1) / (y2 - y1)
+            result[lo:lo + step] = np.count_nonzero(straddle & (x < cross_x), axis=1) % 2 == 1
+        return result
+
+    def classify(self, points):
+        """批量返回各点所在的区域id，不在任何区域内的为 -1；多个区域重叠时取文件中靠前的区域"""
+        points = np.asarray(points, dtype=np.float64).reshape(-1, 2)
+        point_ids, polygon_ids = self.candidates(points)
+
+        best = np.full(len(points), len(self.region_names), dtype=np.int64)
+        for polygon_id in np.unique(polygon_ids):
+            selected = point_ids[polygon_ids == polygon_id]
+            hits = selected[self._contains(polygon_id, points[selected])]
+            np.minimum.at(best, hits, self.polygon_regions[polygon_id])
+        best[best == len(self.region_names)] = -1
+        return best
+
+    def region_of(self, points, default=DEFAULT_REGION):
+        """批量返回各点所在的区域名"""
+        names = np.array(self.region_names + [default], dtype=object)
+        return names[self.classify(points)].tolist()
+
+
+@lru_cache(maxsize=None)
+def load_region_index(path=REGIONS_PATH):
+    return RegionIndex.load(path)
+
+
+# 按坐标批量划分区域：coordinates 为 {地点: {'lat', 'lng', ...}}（见 gazetteer.geocode_places），
+# 返回 {地点: 区域名}，没有坐标的地点归入默认区域
+def classify_places(places, coordinates, path=REGIONS_PATH, default=DEFAULT_REGION):
+    places = list(places)
+    located = [place for place in places if place in coordinates]
+    regions = dict.fromkeys(places, default)
+    if located and os.path.exists(path):
+        points = np.array([[coordinates[place]['lng'], coordinates[place]['lat']] for place in located])
+        regions.update(zip(located, load_region_index(path).region_of(points, default)))
+    return regions
+
+
+# 区域名列表（文件中的顺序，默认区域排在最后）
+def region_names(path=REGIONS_PATH, default=DEFAULT_REGION):
+    names = load_region_index(path).region_names if os.path.exists(path) else []
+    return [name for name in names if name != default] + [default]
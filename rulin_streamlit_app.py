@@ -2,9 +2,17 @@ import streamlit as st
 import pandas as pd
 import numpy as np
 import json
+import os
 import plotly.express as px
 import streamlit.components.v1 as components
 
+from columnar_store import COLUMNAR_DIR, has_table
+from gazetteer import geocode_places, group_by_entry
+from journeys import load_journeys
+from offline_map import (LEAFLET_CSS, LEAFLET_JS, TILE_ATTRIBUTION, localize_html, offline_enabled,
+                         start_tile_server, tile_url)
+from place_matrix import PLACE_MATRIX_PATH, PlaceChapterMatrix, load_place_chapter_matrix
+
 # ==========================================
 # 1. 设置页面配置 (必须是第一个 Streamlit 命令)
 # ==========================================
@@ -24,7 +32,7 @@ translations = {
     'zh': {
         'page_title': '《儒林外史》地点分布分析',
         'main_header': '《儒林外史》地点分布分析系统',
-        'sub_header': '基于第30-50章文本分析的交互式可视化',
+        'sub_header': '基于全书逐章文本分析的交互式可视化',
         'sidebar_settings': '筛选设置',
         'chapter_range': '章节范围',
         'start_chapter': '开始章节',
@@ -98,11 +106,23 @@ translations = {
         'high_frequency': '高频地点',
         'medium_frequency': '中频地点',
         'low_frequency': '低频地点',
+        'map_desc_point9': '彩色折线为各章叙事行程：按地点在该回首次被提及的顺序连接，悬停可查看路线和里程',
+        'journey_layer': '各章叙事行程',
+        'journey_header': '各章叙事行程',
+        'journey_title': '第{start}-{end}回各章叙事行程里程',
+        'journey_route': '行程路线',
+        'journey_stops': '地点数',
+        'journey_legs': '路段数',
+        'journey_total_km': '总里程（公里）',
+        'journey_max_leg_km': '最长一段（公里）',
+        'journey_mean_leg_km': '平均每段（公里）',
+        'journey_summary': '第{start}-{end}回叙事行程共 {legs} 段，总里程 {km:.0f} 公里',
+        'no_journey_data': '没有地名提及索引，无法显示叙事行程（请先运行分析流水线）',
     },
     'en': {
         'page_title': 'Rulin Wai Shi Place Distribution Analysis',
         'main_header': 'Rulin Wai Shi Place Distribution Analysis System',
-        'sub_header': 'Interactive Visualization Based on Chapters 30-50 Text Analysis',
+        'sub_header': 'Interactive Visualization Based on Chapter-by-Chapter Text Analysis',
         'sidebar_settings': 'Filter Settings',
         'chapter_range': 'Chapter Range',
         'start_chapter': 'Start Chapter',
@@ -176,6 +196,18 @@ translations = {
         'high_frequency': 'High Frequency',
         'medium_frequency': 'Medium Frequency',
         'low_frequency': 'Low Frequency',
+        'map_desc_point9': 'Colored lines are the narrative journey of each chapter, connecting places in the order they are first mentioned; hover to see the route and distance',
+        'journey_layer': 'Chapter Journeys',
+        'journey_header': 'Narrative Journeys by Chapter',
+        'journey_title': 'Journey Distance of Each Chapter (Chapters {start}-{end})',
+        'journey_route': 'Route',
+        'journey_stops': 'Places',
+        'journey_legs': 'Legs',
+        'journey_total_km': 'Total Distance (km)',
+        'journey_max_leg_km': 'Longest Leg (km)',
+        'journey_mean_leg_km': 'Average Leg (km)',
+        'journey_summary': 'Chapters {start}-{end}: {legs} legs, {km:.0f} km in total',
+        'no_journey_data': 'No place mention index is available, so narrative journeys cannot be shown (run the analysis pipeline first)',
     }
 }
 
@@ -215,9 +247,12 @@ st.markdown("""
 </style>
 """, unsafe_allow_html=True)
 
+# 默认分析的目标地点
+default_places = ['南京', '北京', '揚州', '蘇州', '杭州', '濟南', '湖州']
+
 # 生成模拟数据的函数
-def generate_mock_data(place_coordinates):
-    places = list(place_coordinates.keys())
+def generate_mock_data(places):
+    places = list(places)
     chapters = list(range(30, 51))
     
     # 构建 DataFrame
@@ -236,18 +271,36 @@ def generate_mock_data(place_coordinates):
     
     return analysis_data, df_matrix
 
-@st.cache_data
+# 用 cache_resource 保存同一个对象：cache_data 每次重新运行都要反序列化出整份矩阵、分析结果和坐标的副本，
+# 这里每次重新运行直接复用；合并地点后的矩阵本身是新数组，只有章节号等列仍是内存映射的视图
+@st.cache_resource
 def load_data():
-    # 地理坐标数据
-    place_coordinates = {
-        '南京': {'lat': 32.0603, 'lng': 118.7969, 'modern_name': '南京市'},
-        '北京': {'lat': 39.9042, 'lng': 116.4074, 'modern_name': '北京市'},
-        '揚州': {'lat': 32.3930, 'lng': 119.4941, 'modern_name': '扬州市'},
-        '蘇州': {'lat': 31.2989, 'lng': 120.5853, 'modern_name': '苏州市'},
-        '杭州': {'lat': 30.2741, 'lng': 120.1551, 'modern_name': '杭州市'},
-        '濟南': {'lat': 36.6512, 'lng': 117.1201, 'modern_name': '济南市'},
-        '湖州': {'lat': 30.8690, 'lng': 119.9107, 'modern_name': '湖州市'}
-    }
+    analysis_data, place_matrix = load_place_matrix()
+
+    # 在本地历史地名库中批量查找坐标（结果持久缓存），同一条目的不同写法合并为一个地点
+    geocoded_places = geocode_places(place_matrix.places)
+    place_groups = group_by_entry(geocoded_places)
+    place_coordinates = {name: geocoded_places[places[0]] for name, places in place_groups.items()}
+    place_matrix = place_matrix.merge_places(place_groups)
+
+    # 目标地点在前，其余找到坐标的地点在后
+    target_places = [place for place in analysis_data['target_places'] if place in place_coordinates]
+    analysis_data['target_places'] = target_places + [place for place in place_coordinates
+                                                      if place not in target_places]
+    return analysis_data, place_matrix, place_coordinates
+
+def load_place_matrix():
+    # 优先加载分析流水线生成的全书地点-章节矩阵（列式结果直接内存映射）
+    if has_table(COLUMNAR_DIR, 'matrix') or os.path.exists(PLACE_MATRIX_PATH):
+        place_matrix = load_place_chapter_matrix()
+        try:
+            with open('place_frequency_analysis.json', 'r', encoding='utf-8') as f:
+                analysis_data = json.load(f)
+        except FileNotFoundError:
+            analysis_data = {}
+        if 'target_places' not in analysis_data:
+            analysis_data['target_places'] = list(default_places)
+        return analysis_data, place_matrix
 
     try:
         # 尝试读取CSV数据
@@ -258,14 +311,14 @@ def load_data():
             
     except FileNotFoundError:
         # 如果文件不存在，使用模拟数据
-        analysis_data, df_matrix = generate_mock_data(place_coordinates)
+        analysis_data, df_matrix = generate_mock_data(default_places)
 
     # 构建字典时确保 key 是整数 (int)
     csv_place_matrix = {}
     
     # 确保 target_places 存在
     if 'target_places' not in analysis_data:
-        analysis_data['target_places'] = list(place_coordinates.keys())
+        analysis_data['target_places'] = list(default_places)
         
     for place in analysis_data['target_places']:
         csv_place_matrix[place] = {}
@@ -290,28 +343,57 @@ def load_data():
                     except ValueError:
                         pass
 
-    analysis_data['place_chapter_matrix'] = csv_place_matrix
+    # 准备章节标题
+    chapter_titles = {}
+    for idx, row in df_matrix.iterrows():
+        try:
+            c_str = str(row['章节'])
+            c_num = int(''.join(filter(str.isdigit, c_str)))
+            chapter_titles[c_num] = row.get('章节标题', c_str)
+        except:
+            pass
+
+    # 每章分词数（旧版结果中有时提供）
+    chapter_tokens = {chapter['chapter_number']: chapter.get('total_words', 0)
+                      for chapter in analysis_data.get('chapter_analysis', []) if 'chapter_number' in chapter}
+
+    # 转换为稀疏矩阵，之后按矩阵切片统计
+    analysis_data.pop('place_chapter_matrix', None)
+    place_matrix = PlaceChapterMatrix.from_dict(csv_place_matrix, chapter_titles, chapter_tokens)
+
+    return analysis_data, place_matrix
+
+# 目标地点的前缀和立方体：拖动章节范围时各项统计只需按地点相减，不随范围长度增长
+@st.cache_data
+def load_range_cube(places):
+    _, place_matrix, _ = load_data()
+    return place_matrix.range_cube(places)
+
+# 各章节的叙事行程（由分析流水线缓存，没有提及索引时为 None）
+@st.cache_data
+def load_journey_data():
+    return load_journeys()
+
+# 离线模式下在后台启动本地瓦片与资源服务（每个应用进程只启动一次），地图页面的资源和底图都从本地读取
+# 浏览器不在服务器本机时，用 RULIN_MAP_SERVER_HOST / RULIN_MAP_SERVER_URL 设置绑定地址和对外地址（见 offline_map）
+@st.cache_resource
+def start_map_server():
+    return start_tile_server()
 
-    return analysis_data, df_matrix, place_coordinates
+map_server_url = start_map_server() if offline_enabled() else None
+map_tile_url = tile_url(map_server_url)
 
 # 加载数据
-analysis_data, df_matrix, place_coordinates = load_data()
+analysis_data, place_matrix, place_coordinates = load_data()
+journeys = load_journey_data()
 
 # 提取关键数据
 target_places = analysis_data.get('target_places', [])
-place_chapter_matrix = analysis_data.get('place_chapter_matrix', {})
+place_cube = load_range_cube(tuple(target_places))
 
 # 准备章节数据
-chapter_numbers = []
-chapter_titles = {}
-for idx, row in df_matrix.iterrows():
-    try:
-        c_str = str(row['章节'])
-        c_num = int(''.join(filter(str.isdigit, c_str)))
-        chapter_numbers.append(c_num)
-        chapter_titles[c_num] = row.get('章节标题', c_str)
-    except:
-        pass
+chapter_numbers = place_matrix.chapters.tolist()
+chapter_titles = {chapter: title for chapter, title in zip(chapter_numbers, place_matrix.chapter_titles) if title}
 
 # 主标题
 st.markdown(f'<div class="main-header">{t("main_header")}</div>', unsafe_allow_html=True)
@@ -340,10 +422,15 @@ with st.sidebar:
     # 章节范围选择器
     st.subheader(t("chapter_range"))
     col1, col2 = st.columns(2)
+    # 范围由已有数据的章节决定，默认显示第30-50回
+    first_chapter = min(chapter_numbers, default=30)
+    last_chapter = max(chapter_numbers, default=50)
+    default_start = min(max(30, first_chapter), last_chapter)
+    default_end = max(min(50, last_chapter), default_start)
     with col1:
-        start_chapter = st.number_input(t("start_chapter"), min_value=30, max_value=49, value=30)
+        start_chapter = st.number_input(t("start_chapter"), min_value=first_chapter, max_value=last_chapter, value=default_start)
     with col2:
-        end_chapter = st.number_input(t("end_chapter"), min_value=31, max_value=50, value=50)
+        end_chapter = st.number_input(t("end_chapter"), min_value=first_chapter, max_value=last_chapter, value=default_end)
     
     # 确保开始章节小于等于结束章节
     if start_chapter > end_chapter:
@@ -375,7 +462,13 @@ with st.sidebar:
     st.info(f"{t('analysis_place_count')} {len(selected_places)}")
 
 # 主要内容区域
-selected_chapters = list(range(start_chapter, end_chapter + 1))
+selected_chapters = place_matrix.chapters_in(start_chapter, end_chapter).tolist()
+
+# 所选地点在所选章节范围内的出现次数 [地点, 章节]（逐章图表使用）
+selected_counts = place_matrix.dense(selected_places, start_chapter, end_chapter)
+
+# 所选地点的范围统计（由前缀和直接得到）
+selected_stats = place_cube.stats(selected_places, start_chapter, end_chapter)
 
 # 创建选项卡
 main_tabs = st.tabs([t("tab_map"), t("tab_overview"), t("tab_charts"), t("tab_table")])
@@ -386,10 +479,9 @@ with main_tabs[0]:
     
     # 计算筛选后的统计数据
     filtered_stats = {}
-    for place in selected_places:
-        filtered_count = sum(place_chapter_matrix.get(place, {}).get(ch, 0) for ch in selected_chapters)
+    for place, total_count in zip(selected_places, selected_stats['total_count']):
         filtered_stats[place] = {
-            'total_count': filtered_count
+            'total_count': int(total_count)
         }
     
     # 创建地点数据表格
@@ -422,6 +514,10 @@ with main_tabs[0]:
                 'count': count
             })
     
+    # 所选范围内各章的叙事行程路线
+    js_journeys = (journeys.layer_data(start_chapter, end_chapter, chapter_titles) if journeys is not None
+                   else {'places': [], 'points': [], 'routes': []})
+
     # 显示坐标数据表格
     if locations:
         df_locations = pd.DataFrame(locations)
@@ -435,6 +531,7 @@ with main_tabs[0]:
             high_frequency_text = t('high_frequency')
             medium_frequency_text = t('medium_frequency')
             low_frequency_text = t('low_frequency')
+            journey_layer_text = t('journey_layer')
             
             # =======================================================
             # 关键修复：HTML/JS 字符串中的大括号全部改为 {{ }}
@@ -446,8 +543,8 @@ with main_tabs[0]:
             <html>
             <head>
                 <meta http-equiv="content-type" content="text/html; charset=UTF-8" />
-                <script src="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.js"></script>
-                <link rel="stylesheet" href="https://cdn.jsdelivr.net/npm/leaflet@1.9.3/dist/leaflet.css"/>
+                <script src="{LEAFLET_JS}"></script>
+                <link rel="stylesheet" href="{LEAFLET_CSS}"/>
                 <style>
                     html, body {{
                         width: 100%;
@@ -470,8 +567,8 @@ with main_tabs[0]:
                 <script>
                     var map = L.map('map').setView([33.35, 118.92], 6);
                     
-                    L.tileLayer('https://{{s}}.basemaps.cartocdn.com/light_all/{{z}}/{{x}}/{{y}}{{r}}.png', {{
-                        attribution: '&copy; OpenStreetMap contributors',
+                    L.tileLayer('{map_tile_url}', {{
+                        attribution: '{TILE_ATTRIBUTION}',
                         maxZoom: 20
                     }}).addTo(map);
                     
@@ -545,11 +642,30 @@ with main_tabs[0]:
                     if(locations.length > 0) {{
                         map.fitBounds(featureGroup.getBounds().pad(0.2));
                     }}
+
+                    // 各章叙事行程：按地点首次提及的顺序连成折线
+                    var journeys = {json.dumps(js_journeys, ensure_ascii=False)};
+                    var journeyGroup = L.layerGroup().addTo(map);
+                    journeys.routes.forEach(function(route, i) {{
+                        var color = 'hsl(' + Math.round(360 * i / journeys.routes.length) + ', 70%, 45%)';
+                        var points = route.stops.map(function(k) {{ return journeys.points[k]; }});
+                        var names = route.stops.map(function(k) {{ return journeys.places[k]; }});
+                        L.polyline(points, {{ color: color, weight: 3, opacity: 0.6 }})
+                            .bindTooltip('第' + route.chapter + '回：' + names.join(' → ') + '（' + route.km + ' km）',
+                                         {{ sticky: true }})
+                            .addTo(journeyGroup);
+                    }});
+                    if(journeys.routes.length > 0) {{
+                        L.control.layers(null, {{ '{journey_layer_text}': journeyGroup }}).addTo(map);
+                    }}
                 </script>
             </body>
             </html>
             '''
             
+            if map_server_url:
+                leaflet_map_html = localize_html(leaflet_map_html, map_server_url)
+
             st.subheader(t("visualization_title", start=start_chapter, end=end_chapter))
             components.html(leaflet_map_html, height=700, scrolling=False)
             
@@ -566,6 +682,7 @@ with main_tabs[0]:
                 <li>{t('map_desc_point6')}</li>
                 <li>{t('map_desc_point7')}</li>
                 <li>{t('map_desc_point8')}</li>
+                <li>{t('map_desc_point9')}</li>
             </ul>
             </div>
             """, unsafe_allow_html=True)
@@ -579,18 +696,14 @@ with main_tabs[1]:
     st.header(t("overview_header"))
     
     overview_data = []
-    for place in selected_places:
-        filtered_count = sum(place_chapter_matrix.get(place, {}).get(ch, 0) for ch in selected_chapters)
-        filtered_chapter_count = sum(1 for ch in selected_chapters if place_chapter_matrix.get(place, {}).get(ch, 0) > 0)
-        filtered_presence_rate = filtered_chapter_count / len(selected_chapters) if len(selected_chapters) > 0 else 0
-        
+    for i, place in enumerate(selected_places):
         overview_data.append({
             t('place'): place,
             t('modern_name'): place_coordinates.get(place, {}).get('modern_name', ''),
-            t('total_mentions'): filtered_count,
-            t('avg_per_chapter'): filtered_count / len(selected_chapters) if len(selected_chapters) > 0 else 0,
-            t('presence_rate'): filtered_presence_rate,
-            t('present_chapters'): filtered_chapter_count
+            t('total_mentions'): int(selected_stats['total_count'][i]),
+            t('avg_per_chapter'): float(selected_stats['avg_per_chapter'][i]),
+            t('presence_rate'): float(selected_stats['presence_rate'][i]),
+            t('present_chapters'): int(selected_stats['present_chapters'][i])
         })
     
     if overview_data:
@@ -634,9 +747,9 @@ with main_tabs[2]:
     st.header(t("trends_header"))
     
     trend_data = []
-    for chapter in selected_chapters:
-        for place in selected_places:
-            count = place_chapter_matrix.get(place, {}).get(chapter, 0)
+    for col, chapter in enumerate(selected_chapters):
+        for row, place in enumerate(selected_places):
+            count = int(selected_counts[row, col])
             trend_data.append({
                 t('chapter'): chapter,
                 t('place'): place,
@@ -657,13 +770,8 @@ with main_tabs[2]:
         
         # 热力图
         st.subheader(t("heatmap"))
-        # 构建矩阵
-        heat_matrix = []
-        for chapter in selected_chapters:
-            row = []
-            for place in selected_places:
-                row.append(place_chapter_matrix.get(place, {}).get(chapter, 0))
-            heat_matrix.append(row)
+        # 构建矩阵 [章节, 地点]
+        heat_matrix = selected_counts.T
             
         fig_heat = px.imshow(
             heat_matrix,
@@ -676,19 +784,49 @@ with main_tabs[2]:
     else:
         st.info(t("no_data"))
 
+    # 各章叙事行程的里程（由缓存的行程和距离矩阵直接得到）
+    st.subheader(t("journey_header"))
+    if journeys is not None:
+        journey_metrics = journeys.metrics(start_chapter, end_chapter)
+        df_journey = pd.DataFrame({
+            t('chapter'): journey_metrics['chapter'],
+            t('journey_route'): [' → '.join(journeys.trajectory(chapter))
+                                 for chapter in journey_metrics['chapter'].tolist()],
+            t('journey_stops'): journey_metrics['stops'],
+            t('journey_legs'): journey_metrics['legs'],
+            t('journey_total_km'): journey_metrics['total_km'].round(1),
+            t('journey_max_leg_km'): journey_metrics['max_leg_km'].round(1),
+            t('journey_mean_leg_km'): journey_metrics['mean_leg_km'].round(1)
+        })
+        st.info(t("journey_summary", start=start_chapter, end=end_chapter,
+                  legs=int(journey_metrics['legs'].sum()), km=float(journey_metrics['total_km'].sum())))
+        if len(df_journey):
+            fig_journey = px.bar(
+                df_journey,
+                x=t('chapter'),
+                y=t('journey_total_km'),
+                hover_data=[t('journey_stops'), t('journey_max_leg_km')],
+                title=t("journey_title", start=start_chapter, end=end_chapter)
+            )
+            st.plotly_chart(fig_journey, use_container_width=True)
+        st.dataframe(df_journey, use_container_width=True, hide_index=True)
+    else:
+        st.info(t("no_journey_data"))
+
 # 4. 详细表格选项卡
 with main_tabs[3]:
     st.header(t("detailed_table"))
     
     detailed_data = []
-    for chapter in selected_chapters:
+    chapter_totals = selected_counts.sum(axis=0)
+    for col, chapter in enumerate(selected_chapters):
         row = {
             t('chapter'): chapter,
             t('chapter_title'): chapter_titles.get(chapter, f"第{chapter}回"),
-            t('total_places'): sum(place_chapter_matrix.get(place, {}).get(chapter, 0) for place in selected_places)
+            t('total_places'): int(chapter_totals[col])
         }
-        for place in selected_places:
-            row[place] = place_chapter_matrix.get(place, {}).get(chapter, 0)
+        for place_row, place in enumerate(selected_places):
+            row[place] = int(selected_counts[place_row, col])
         detailed_data.append(row)
     
     if detailed_data:
@@ -0,0 +1,141 @@
+import hashlib
+import os
+from array import array
+from importlib.metadata import PackageNotFoundError, version
+
+from profiling import profiler
+from token_stream import TokenStream
+
+# 缓存文件头，变更存储格式时递增版本号
+CACHE_MAGIC = b'SEGC1'
+
+# 超过上限时淘汰到上限的这一比例，之后的写入不必每次都重新扫描目录
+EVICT_TARGET = 0.9
+
+
+# 根据自定义词典内容和jieba版本生成指纹，词典变化后旧缓存自动失效
+# 通过包元数据读取版本号，避免为计算指纹而导入jieba
+def dictionary_fingerprint(custom_words):
+    try:
+        jieba_version = version('jieba')
+    except PackageNotFoundError:
+        jieba_version = ''
+    digest = hashlib.sha256(jieba_version.encode('utf-8'))
+    for word in custom_words:
+        digest.update(word.encode('utf-8'))
+        digest.update(b'\n')
+    return digest.hexdigest()[:16]
+
+
+# 以内容寻址的分词结果磁盘缓存
+# 精确模式的分词结果首尾相接即为原文，因此只需保存每个词的长度（uint32数组），读取时按长度切回原文
+class SegmentationCache:
+    def __init__(self, cache_dir, fingerprint, max_bytes=64 * 1024 * 1024):
+        self.cache_dir = cache_dir
+        self.fingerprint = fingerprint
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+        os.makedirs(cache_dir, exist_ok=True)
+        self._total_bytes = sum(size for _, size, _ in self._entries())
+
+    def _entries(self):
+        """缓存文件的 (修改时间, 大小, 路径) 列表
+        多个进程共享同一缓存目录时，文件可能在列出后被其他进程删除，这些文件直接跳过"""
+        entries = []
+        for entry in os.scandir(self.cache_dir):
+            if not entry.name.endswith('.seg'):
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def _path(self, text):
+        digest = hashlib.sha256(self.fingerprint.encode('ascii'))
+        digest.update(text.encode('utf-8'))
+        return os.path.join(self.cache_dir, digest.hexdigest() + '.seg')
+
+    def get(self, text):
+        """命中时返回 TokenStream，否则返回 None"""
+        path = self._path(text)
+        try:
+            with open(path, 'rb') as f:
+                data = f.read()
+        except FileNotFoundError:
+            self.misses += 1
+            return None
+
+        if not data.startswith(CACHE_MAGIC):
+            self.misses += 1
+            return None
+        lengths = array('I')
+        lengths.frombytes(data[len(CACHE_MAGIC):])
+        if sum(lengths) != len(text):
+            self.misses += 1
+            return None
+
+        tokens = []
+        position = 0
+        for length in lengths:
+            tokens.append(text[position:position + length])
+            position += length
+
+        # 更新访问时间，供淘汰时按最近使用排序（文件可能刚被其他进程淘汰，读到的内容仍然有效）
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        self.hits += 1
+        return TokenStream(tokens)
+
+    def put(self, text, tokens):
+        tokens = list(tokens)
+        # 分词结果无法还原原文时不缓存
+        if ''.join(tokens) != text:
+            return
+
+        path = self._path(text)
+        try:
+            self._total_bytes -= os.path.getsize(path)
+        except FileNotFoundError:
+            pass
+        data = CACHE_MAGIC + array('I', (len(token) for token in tokens)).tobytes()
+        with open(path, 'wb') as f:
+            f.write(data)
+        self._total_bytes += len(data)
+
+        if self._total_bytes > self.max_bytes:
+            self._evict(keep=path)
+
+    def _evict(self, keep=None):
+        # 按最近访问时间从旧到新删除，直到总大小降到上限的 EVICT_TARGET 以内
+        # 多个进程共享同一缓存目录时，文件可能已被其他进程删除
+        entries = sorted(self._entries())
+        total = sum(size for _, size, _ in entries)
+        target = self.max_bytes * EVICT_TARGET
+        for _, size, path in entries:
+            if total <= target:
+                break
+            if path == keep:
+                continue
+            total -= size
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+        self._total_bytes = total
+
+    def segment(self, text, tokenizer=None):
+        """优先读取缓存，未命中时分词并写入缓存"""
+        with profiler.span('segmentation', items=len(text)) as span:
+            tokens = self.get(text)
+            span['cache'] = 'miss' if tokens is None else 'hit'
+            if tokens is None:
+                tokens = TokenStream.segment(text, tokenizer)
+                self.put(text, tokens.tokens)
+        profiler.counter('segmentation_cache', hits=self.hits, misses=self.misses)
+        return tokens
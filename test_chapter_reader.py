@@ -0,0 +1,20 @@
+from chapter_reader import ChapterReader
+
+TEXT = '儒林外史\n\n*第一回　甲\n王冕在南京。\n又到揚州。\n*第二回　乙\n周進回家。\n'
+
+
+def read_chapters(path):
+    with ChapterReader(str(path)) as reader:
+        return [(chapter['chapter_number'], chapter['chapter_title'], chapter['content'])
+                for chapter in reader.chapters()]
+
+
+# CRLF 换行的原文与 LF 原文切分结果相同（与以文本模式读取一致）
+def test_crlf_source_matches_lf(tmp_path):
+    lf_path, crlf_path = tmp_path / 'lf.txt', tmp_path / 'crlf.txt'
+    lf_path.write_bytes(TEXT.encode('utf-8'))
+    crlf_path.write_bytes(TEXT.replace('\n', '\r\n').encode('utf-8'))
+
+    expected = [(1, '第一回　甲', '王冕在南京。\n又到揚州。'), (2, '第二回　乙', '周進回家。\n')]
+    assert read_chapters(lf_path) == expected
+    assert read_chapters(crlf_path) == expected
@@ -0,0 +1,12 @@
+import numpy as np
+
+from columnar_store import load_tables, save_tables
+
+
+# 重新保存时旧的内存映射仍读到完整的旧内容，新读取得到新内容
+def test_resave_keeps_existing_mappings_intact(tmp_path):
+    save_tables(str(tmp_path), {'matrix': {'data': np.arange(10, dtype=np.int32)}})
+    mapped = load_tables(str(tmp_path))['matrix']['data']
+    save_tables(str(tmp_path), {'matrix': {'data': np.arange(3, dtype=np.int32)}})
+    assert mapped.tolist() == list(range(10))
+    assert load_tables(str(tmp_path))['matrix']['data'].tolist() == [0, 1, 2]
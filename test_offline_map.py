@@ -0,0 +1,46 @@
+import re
+import urllib.parse
+
+from offline_map import ASSET_URL, localize_html, make_tile_server, server_url, tile_url, vendor_path
+from place_gis_visualization import map_html, render_place_map
+from place_matrix import PlaceChapterMatrix
+
+COORDINATES = {
+    '南京': {'lat': 32.06, 'lng': 118.79, 'modern_name': '南京市', 'historical_names': ['南京', '金陵']},
+    '揚州': {'lat': 32.39, 'lng': 119.41, 'modern_name': '扬州市', 'historical_names': ['揚州']},
+}
+
+
+# 离线模式（未设置环境变量，只传 offline=True）生成的页面中，除本地服务外不引用任何外部主机
+def test_offline_map_has_no_external_hosts(tmp_path, monkeypatch):
+    monkeypatch.delenv('RULIN_MAP_OFFLINE', raising=False)
+    place_matrix = PlaceChapterMatrix.from_dict({'南京': {1: 3, 2: 1}, '揚州': {2: 2}}, {1: '甲', 2: '乙'})
+    folium_map = render_place_map(place_matrix, COORDINATES, 1, 2, offline=True)
+
+    # 模拟已镜像的 CDN 资源
+    page = folium_map.get_root().render()
+    for url in ASSET_URL.findall(page):
+        path = tmp_path / vendor_path(url, '')
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text('')
+    page = localize_html(page, vendor_dir=str(tmp_path))
+
+    local_host = urllib.parse.urlsplit(server_url()).netloc
+    hosts = set(re.findall(r'https?://([^/"\'\s)]+)', page)) - {local_host}
+    assert not hosts
+    assert 'basemaps.cartocdn.com' not in map_html(folium_map, offline=True)
+
+
+# 绑定地址和浏览器访问的地址可分别设置
+def test_server_address_is_configurable(monkeypatch):
+    monkeypatch.delenv('RULIN_MAP_SERVER_URL', raising=False)
+    monkeypatch.setenv('RULIN_MAP_SERVER_HOST', '0.0.0.0')
+    server = make_tile_server(port=0)
+    try:
+        assert server.server_address[0] == '0.0.0.0'
+    finally:
+        server.server_close()
+
+    monkeypatch.setenv('RULIN_MAP_SERVER_URL', 'http://maps.example.org:8765/')
+    assert server_url() == 'http://maps.example.org:8765'
+    assert tile_url(server_url()) == 'http://maps.example.org:8765/tiles/{z}/{x}/{y}'
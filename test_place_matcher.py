@@ -0,0 +1,22 @@
+from place_matcher import PlaceMatcher
+
+
+# 同一起点取最长的变体，重叠部分不重复计数
+def test_longest_variant_at_same_start():
+    matcher = PlaceMatcher({'湖州': ['湖州', '湖州府']})
+    counts, offsets = matcher.scan('湖州府在湖州')
+    assert counts == {'湖州府': 1, '湖州': 1}
+    assert offsets == {'湖州府': [0], '湖州': [4]}
+
+
+# 起点不同的重叠变体只保留最左边的一个
+def test_leftmost_match_wins_over_overlap():
+    matcher = PlaceMatcher({'南京': ['南京'], '京城': ['京城']})
+    assert list(matcher.finditer('南京城')) == [(0, matcher.variant_ids['南京'])]
+    assert matcher.count_cities('南京城，京城') == {'南京': 1, '京城': 1}
+
+
+# 按标准地名汇总各变体的出现次数
+def test_count_cities_merges_variants():
+    matcher = PlaceMatcher({'南京': ['南京', '金陵', '應天府'], '揚州': ['揚州']})
+    assert matcher.count_cities('金陵即南京，應天府；揚州') == {'南京': 3, '揚州': 1}
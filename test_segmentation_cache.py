@@ -0,0 +1,31 @@
+import os
+
+import segmentation_cache
+from segmentation_cache import EVICT_TARGET, SegmentationCache
+
+
+def cache_bytes(cache_dir):
+    return sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+
+
+# 超过上限时淘汰到上限的 EVICT_TARGET 以内，刚写入的条目保留
+def test_evicts_to_low_water_mark(tmp_path):
+    cache = SegmentationCache(str(tmp_path), 'fp', max_bytes=2000)
+    texts = [f'{i:03d}' + '南京' * 50 for i in range(30)]
+    for text in texts:
+        cache.put(text, list(text))
+    assert cache_bytes(tmp_path) <= 2000 * EVICT_TARGET
+    assert cache.get(texts[-1]).tokens == list(texts[-1])
+
+
+# 读取后文件被其他进程淘汰时仍返回读到的结果
+def test_hit_survives_concurrent_eviction(tmp_path, monkeypatch):
+    cache = SegmentationCache(str(tmp_path), 'fp')
+    cache.put('揚州城外', ['揚州', '城外'])
+
+    def evicted(path, *args, **kwargs):
+        os.remove(path)
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(segmentation_cache.os, 'utime', evicted)
+    assert cache.get('揚州城外').tokens == ['揚州', '城外']
+    assert cache.get('揚州城外') is None
@@ -0,0 +1,33 @@
+from itertools import accumulate
+
+
+# 单个章节的分词结果，只切分一次，供候选地名提取、密度计算等各阶段复用
+class TokenStream:
+    def __init__(self, tokens):
+        self.tokens = list(tokens)
+        self._offsets = None
+
+    @classmethod
+    def segment(cls, text, tokenizer=None):
+        """使用jieba精确模式切分文本（未指定分词器时使用jieba默认分词器）"""
+        if tokenizer is None:
+            import jieba
+            tokenizer = jieba
+        return cls(tokenizer.cut(text, cut_all=False))
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __iter__(self):
+        return iter(self.tokens)
+
+    @property
+    def offsets(self):
+        """每个词在原文中的起始字符偏移（按需计算一次）"""
+        if self._offsets is None:
+            self._offsets = list(accumulate((len(token) for token in self.tokens), initial=0))[:-1]
+        return self._offsets
+
+    def with_offsets(self):
+        """产出 (起始偏移, 词)"""
+        return zip(self.offsets, self.tokens)
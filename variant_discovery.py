@@ -0,0 +1,203 @@
+import argparse
+import csv
+import re
+
+import numpy as np
+
+from city_analysis import city_normalization, city_suffixes, exclude_words, is_valid_city
+from place_classifier import DIRECTION_PREFIXES
+from place_matcher import PlaceMatcher
+from profiling import profiler
+
+# 候选变体的默认输出文件
+CANDIDATES_PATH = 'place_variant_candidates.csv'
+
+# 上下文字符编码占用的位数（CJK 扩展区最大码位 < 2**21）
+CONTEXT_BITS = 21
+
+
+# 文本转为码位数组，非汉字（标点、换行、字母等）记为0，作为 n-gram 的分隔符
+def encode_text(text):
+    codes = np.frombuffer(text.encode('utf-32-le'), dtype=np.uint32).astype(np.int64)
+    is_han = ((codes >= 0x3400) & (codes <= 0x9FFF)) | ((codes >= 0x20000) & (codes <= 0x2FFFF))
+    return np.where(is_han, codes, 0)
+
+
+# 稀疏截断后缀数组：只对给定起点排序，且只比较前 depth 个字符
+# step=1 时读取起点之后的字符（正向后缀），step=-1 时读取起点及之前的字符（即反转文本的后缀）
+class SparseSuffixArray:
+    def __init__(self, codes, positions, depth, step=1):
+        self.codes = codes
+        self.depth = depth
+        self.step = step
+
+        offsets = positions[:, None] + step * np.arange(depth)
+        inside = (offsets >= 0) & (offsets < len(codes))
+        columns = np.where(inside, codes[np.clip(offsets, 0, len(codes) - 1)], 0)
+
+        # 第一列为主键的字典序排序
+        order = np.lexsort(columns.T[::-1])
+        self.positions = positions[order]
+        self.columns = columns[order]
+
+        # 每行从起点开始的连续汉字数，以及与上一行相同的前缀长度（LCP）
+        padded = np.zeros((len(self.columns), 1), dtype=bool)
+        self.valid_length = np.argmin(np.hstack([self.columns != 0, padded]), axis=1)
+        same = (self.columns[1:] == self.columns[:-1]) & (self.columns[1:] != 0)
+        self.lcp = np.argmin(np.hstack([same, padded[1:]]), axis=1)
+
+    def ngram_groups(self, n):
+        """前 n 个字符相同的连续行为一组，返回 (每行组号, 各组首行)，只保留 n 个字符都是汉字的组"""
+        starts = np.ones(len(self.positions), dtype=bool)
+        starts[1:] = self.lcp < n
+        group = np.cumsum(starts) - 1
+        first_rows = np.flatnonzero(starts)
+        keep = self.valid_length[first_rows] >= n
+        # 保留的组重新编号，其余行记为 -1
+        new_ids = np.full(len(first_rows), -1, dtype=np.int64)
+        new_ids[keep] = np.arange(keep.sum())
+        return new_ids[group], first_rows[keep]
+
+    def context(self, n, before=False):
+        """每行 n-gram 之外紧邻的字符（before=True 时为起点之前的字符），越界记为0"""
+        offsets = self.positions - self.step if before else self.positions + self.step * n
+        inside = (offsets >= 0) & (offsets < len(self.codes))
+        return np.where(inside, self.codes[np.clip(offsets, 0, len(self.codes) - 1)], 0)
+
+    def ngram(self, row, n):
+        chars = ''.join(map(chr, self.columns[row, :n]))
+        return chars if self.step == 1 else chars[::-1]
+
+
+# 各组上下文字符分布的信息熵（比特）
+def _entropy(group, context, group_count):
+    keys, counts = np.unique((group << CONTEXT_BITS) | context, return_counts=True)
+    owner = keys >> CONTEXT_BITS
+    totals = np.bincount(group, minlength=group_count)
+    p = counts / totals[owner]
+    return np.bincount(owner, weights=-p * np.log2(p), minlength=group_count)
+
+
+# 从稀疏后缀数组中挖掘长度为 min_length..depth 的高频 n-gram
+def _mine(suffix_array, kind, min_length, min_count):
+    candidates = []
+    for n in range(min_length, suffix_array.depth + 1):
+        group, first_rows = suffix_array.ngram_groups(n)
+        rows = group >= 0
+        group = group[rows]
+        counts = np.bincount(group, minlength=len(first_rows))
+        frequent = np.flatnonzero(counts >= min_count)
+        if not len(frequent):
+            continue
+
+        # 反向读取时，n-gram 之前的字符是读取方向上的下一个字符
+        ahead = _entropy(group, suffix_array.context(n)[rows], len(first_rows))
+        behind = _entropy(group, suffix_array.context(n, before=True)[rows], len(first_rows))
+        left, right = (behind, ahead) if suffix_array.step == 1 else (ahead, behind)
+        for gid in frequent:
+            candidates.append({
+                'candidate': suffix_array.ngram(first_rows[gid], n),
+                'length': n,
+                'count': int(counts[gid]),
+                'left_entropy': float(left[gid]),
+                'right_entropy': float(right[gid]),
+                'kind': kind
+            })
+    return candidates
+
+
+# 已收录变体的前两个字（不含"到南京"之类的方向词组合），用于挖掘已知地名附近的新写法
+def variant_stems(normalization=city_normalization):
+    stems = set()
+    for city, variants in normalization.items():
+        for variant in [city] + variants:
+            if len(variant) >= 2 and not variant.startswith(DIRECTION_PREFIXES):
+                stems.add(variant[:2])
+    return stems
+
+
+# 候选地名变体挖掘
+# 以地名后缀结尾的 n-gram：在后缀字处建立反向稀疏后缀数组；
+# 已知地名附近的 n-gram：在已收录变体的前两个字处建立正向稀疏后缀数组；
+# 每个数组只排序一次，各长度的 n-gram 由相邻行的公共前缀长度分组得到
+def discover_variants(text, max_length=6, min_length=2, min_count=3, suffixes=city_suffixes,
+                      normalization=city_normalization):
+    with profiler.span('variant_discovery', items=len(text)) as span:
+        codes = encode_text(text)
+
+        suffix_codes = np.array([ord(suffix) for suffix in suffixes if len(suffix) == 1], dtype=np.int64)
+        suffix_positions = np.flatnonzero(np.isin(codes, suffix_codes))
+        candidates = _mine(SparseSuffixArray(codes, suffix_positions, max_length, step=-1),
+                           'suffix', min_length, min_count)
+
+        stems = variant_stems(normalization)
+        stem_codes = np.array([ord(stem[0]) << CONTEXT_BITS | ord(stem[1]) for stem in stems], dtype=np.int64)
+        bigrams = (codes[:-1] << CONTEXT_BITS) | codes[1:]
+        stem_positions = np.flatnonzero(np.isin(bigrams, stem_codes))
+        candidates += _mine(SparseSuffixArray(codes, stem_positions, max_length, step=1),
+                            'variant', max(min_length, 3), min_count)
+
+        # 去掉已收录的变体、含排除词的片段（如"知道湖州"）和跨越两个已知地名的片段（如"杭州揚州"），
+        # 同一 n-gram 只保留一次
+        known = {variant for variants in normalization.values() for variant in variants}
+        known.update(normalization)
+        excluded = re.compile('|'.join(re.escape(word) for word in sorted(exclude_words, key=len, reverse=True)))
+        matcher = PlaceMatcher(normalization)
+        merged = {}
+        for candidate in candidates:
+            name = candidate['candidate']
+            if name in known or excluded.search(name) or sum(1 for _ in matcher.finditer(name)) > 1:
+                continue
+            if name in merged:
+                merged[name]['kind'] += '+' + candidate['kind']
+                continue
+            candidate['boundary_entropy'] = min(candidate['left_entropy'], candidate['right_entropy'])
+            # 频次越高、两侧搭配越丰富（越像独立的词）得分越高
+            candidate['score'] = float(np.log2(candidate['count'] + 1) * candidate['boundary_entropy'])
+            candidate['classifier_valid'] = is_valid_city(name)
+            candidate['canonical_guess'] = next((city for city in normalization if city in name), '')
+            merged[name] = candidate
+
+        ranked = sorted(merged.values(), key=lambda c: (c['score'], c['count']), reverse=True)
+        span['items'] = len(ranked)
+    return ranked
+
+
+def save_candidates(candidates, path=CANDIDATES_PATH):
+    columns = ['candidate', 'length', 'count', 'left_entropy', 'right_entropy', 'boundary_entropy',
+               'score', 'kind', 'classifier_valid', 'canonical_guess']
+    with open(path, 'w', encoding='utf-8-sig', newline='') as f:
+        writer = csv.DictWriter(f, fieldnames=columns)
+        writer.writeheader()
+        for candidate in candidates:
+            writer.writerow({column: (round(candidate[column], 4) if isinstance(candidate[column], float)
+                                      else candidate[column]) for column in columns})
+
+
+def main(argv=None):
+    from final_optimized_analysis import DEFAULT_SOURCE_PATH
+
+    parser = argparse.ArgumentParser(description='挖掘未收录的地名变体候选')
+    parser.add_argument('--source', nargs='+', default=[DEFAULT_SOURCE_PATH], help='语料文件（可多个）')
+    parser.add_argument('--max-length', type=int, default=6, help='候选的最大长度，默认6')
+    parser.add_argument('--min-count', type=int, default=3, help='候选的最小出现次数，默认3')
+    parser.add_argument('--top', type=int, default=30, help='输出得分最高的候选数量')
+    parser.add_argument('--output', default=CANDIDATES_PATH, help='候选CSV输出文件')
+    args = parser.parse_args(argv)
+
+    texts = []
+    for path in args.source:
+        with open(path, 'r', encoding='utf-8') as f:
+            texts.append(f.read())
+    candidates = discover_variants('\n'.join(texts), args.max_length, min_count=args.min_count)
+
+    print(f"=== 共挖掘出 {len(candidates)} 个候选变体 ===")
+    for i, candidate in enumerate(candidates[:args.top], 1):
+        print(f"{i:2d}. {candidate['candidate']}: {candidate['count']} 次，"
+              f"边界熵 {candidate['boundary_entropy']:.2f}，得分 {candidate['score']:.2f}（{candidate['kind']}）")
+    save_candidates(candidates, args.output)
+    print(f"已保存：{args.output}")
+
+
+if __name__ == '__main__':
+    main()